@@ -1,48 +1,169 @@
-from typing import Any
-from fastapi import FastAPI, Depends, HTTPException
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, Union
+from fastapi import FastAPI, Depends, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import RedirectResponse
+from sqlalchemy.ext.asyncio import AsyncSession  # type: ignore
+from sqlalchemy.orm import Session  # type: ignore
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import (
+    PlainTextResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
 import uvicorn
-from datetime import datetime
-
-import spacy
+import asyncio
+import os
+import time
 import uuid
 
 from src.auth.auth_bearer import JWTBearer
+from src.auth.auth_handler import decodeJWTCached, flushJWTCache, getJWTCacheStats
 from src.api.response_models import (
     RecognitionResponse,
     ErrorCode,
     BaseResponse,
     LatestMentionsResponse,
+    PoolStatusResponse,
+    InferenceStatusResponse,
+    AuthCacheResponse,
+    ProfilesResponse,
+    SchedulerResponse,
+    LeadersResponse,
+    WorkersResponse,
+    ReadinessResponse,
+    StatsResponse,
 )
 from src.api.request_models import (
+    BatchExtractorRequestBody,
+    BatchItem,
     ExtractorRequestBody,
     MDRUpdateRequest,
     BRUpdateRequest,
     FeedbackRequest,
+    ProcessingRequest,
+    StatsRequest,
+)
+from src.exceptions import JobLocked
+from src.models import MediaHouse, Status
+from src.finder import (
+    ModelType,
+    find_mention,
+    find_mentions_batch,
+    reload_models,
 )
-from src.models import Comment, MediaHouse, Status
-from src.tools import write_jsonlines_to_bucket, check_expiration_time
-from src.finder import ModelType, find_mention
+from src.tools import dumps_line
+from src.memory import get_master_pid, get_workers_memory
+from src.metrics import register_cache, register_queue, render_metrics
+from src.profiling import (
+    StackSampler,
+    list_reports,
+    new_report_id,
+    read_report,
+    render_report,
+    write_report,
+)
+from src.inference import INFERENCE_EXECUTOR, DeadlineExceeded, Overloaded
 from src.mdr.preprocess import preprocess_mdr_comment
 from src.mdr.get_comments import MDRCommentGetter
 from src.br.get_comments import BRCommentGetter
 from src.br.preprocess import preprocess_br_comment
-from src.publisher.teams import TeamsConnector, send_comments
+from src.publisher.worker import OutboxWorker
+from src.pipeline import ClassifierWorker, process_backlog, to_comments
+from src.scheduler import PipelineScheduler
+from src.warmup import Warmup
 from src.storage.postgres import (
     create_tables,
     get_engine,
+    get_pool_status,
+    session_scope,
+    SESSION,
     TableWriter,
-    sessionmaker,
-    get_unpublished,
-    get_unprocessed,
+    invalidate_latest_mentions,
+    LATEST_MENTIONS_STATS,
+)
+from src.storage.postgres_async import (
+    ASYNC_SESSION,
+    AsyncTableWriter,
+    get_async_engine,
     get_latest_mentions,
 )
-from settings import BUGG_MODEL_V1_PATH, BACKUP_PATH, POSTGRES_URI, MAX_NUMBER_PUBLISH
-from src.exceptions import PreprocessingError
+from src.storage.backup import BackupWriter
+from src.storage.big_query import BigQueryWriter, sync_comments
+from src.storage.outbox import count_pending, enqueue_missing
+from src.storage.notify import (
+    LATEST_MENTIONS_CHANNEL,
+    NotificationListener,
+    TO_BE_PROCESSED_CHANNEL,
+    TO_BE_PUBLISHED_CHANNEL,
+)
+from src.storage.leader import get_job_holders, run_exclusive
+from src.storage.partitions import apply_retention, ensure_partitions
+from src.storage.stats import (
+    get_feedback_rates,
+    get_status_counts,
+    rebuild_status_counts,
+)
+from settings import (
+    WORKER_ID,
+    PROFILE_ALWAYS_ON,
+    PROFILE_ALWAYS_ON_INTERVAL,
+    PROFILE_INTERVAL,
+    PROFILE_PATH,
+    INFERENCE_TIMEOUT_SECONDS,
+    FIND_MENTIONS_BATCH_MAX_ITEMS,
+    FIND_MENTIONS_BATCH_SIZE,
+    PRELOAD_MODELS,
+    BACKUP_PATH,
+    BACKUP_FORMAT,
+    ARCHIVE_PATH,
+    POSTGRES_URI,
+    POSTGRES_ASYNC_URI,
+    OUTBOX_WORKER_ENABLED,
+    PIPELINE_EVENTS_ENABLED,
+    PIPELINE_SWEEP_SECONDS,
+    SCHEDULER_ENABLED,
+    PUBLISH_EXPIRY_MINUTES,
+    RETENTION_MONTHS,
+    POSTGRES_PARTITIONED,
+    PARTITION_MONTHS_AHEAD,
+)
 
 ENGINE = get_engine(POSTGRES_URI)
-SPACY_MODEL = spacy.load(BUGG_MODEL_V1_PATH)
+ASYNC_ENGINE = get_async_engine(POSTGRES_ASYNC_URI)
+if BACKUP_FORMAT == "parquet":
+    # pyarrow is only imported, when it is used
+    from src.storage.parquet import ParquetBackupWriter
+
+    BACKUP_WRITER = ParquetBackupWriter(BACKUP_PATH + "parquet/")
+else:
+    BACKUP_WRITER = BackupWriter(BACKUP_PATH)
+OUTBOX_WORKER = OutboxWorker(ENGINE)
+CLASSIFIER_WORKER = ClassifierWorker(ENGINE)
+SCHEDULER = PipelineScheduler(ENGINE, BACKUP_WRITER, on_classified=OUTBOX_WORKER.wake)
+LISTENER = NotificationListener(
+    ENGINE, {LATEST_MENTIONS_CHANNEL: invalidate_latest_mentions}
+)
+if PIPELINE_EVENTS_ENABLED:
+    LISTENER.callbacks.update(
+        {
+            TO_BE_PROCESSED_CHANNEL: CLASSIFIER_WORKER.wake,
+            TO_BE_PUBLISHED_CHANNEL: OUTBOX_WORKER.wake,
+        }
+    )
+WARMUP = Warmup(
+    ENGINE, ASYNC_ENGINE, types=[ModelType(type_) for type_ in PRELOAD_MODELS]
+)
+ALWAYS_ON_SAMPLER = (
+    StackSampler(PROFILE_ALWAYS_ON_INTERVAL) if PROFILE_ALWAYS_ON else None
+)
+register_cache("jwt", getJWTCacheStats)
+register_cache("latest_mentions", lambda: LATEST_MENTIONS_STATS)
+register_queue("backup", lambda: BACKUP_WRITER.pending)
+register_queue("inference", lambda: INFERENCE_EXECUTOR.get_status()["in_flight"])
+register_queue("outbox", lambda: count_outbox())
+register_queue("scheduler_pages", lambda: SCHEDULER.get_queue_depths()["pages"])
+register_queue("scheduler_stored", lambda: SCHEDULER.get_queue_depths()["stored"])
 APP = FastAPI(
     title="WTWM mention extractor",
     description="Recognise mentions of the editorial team in a given text.",
@@ -67,6 +188,116 @@ APP.add_middleware(
 )
 
 
+def wants_profile(request: Request) -> bool:
+    """True, if an authenticated request asks to be profiled, false otherwise.
+
+    :param request: incoming request
+    """
+    flag = request.headers.get("x-profile") or request.query_params.get("profile")
+    if flag is None or flag.lower() not in ("1", "true"):
+        return False
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    return scheme == "Bearer" and bool(decodeJWTCached(token))
+
+
+@APP.middleware("http")
+async def profile_request(request: Request, call_next: Callable) -> Response:
+    """Profile a request, if the header 'X-Profile' or query 'profile' is set.
+
+    The report id is returned in the header 'X-Profile-Id', see '/v1/profile'.
+    """
+    if not wants_profile(request):
+        return await call_next(request)
+
+    sampler = StackSampler(PROFILE_INTERVAL).start()
+    try:
+        response = await call_next(request)
+    finally:
+        sampler.stop()
+
+    report_id = new_report_id()
+    title = f"{request.method} {request.url.path}?{request.url.query}"
+    await run_in_threadpool(write_report, PROFILE_PATH, report_id, title, sampler)
+    response.headers["X-Profile-Id"] = report_id
+    return response
+
+
+def get_session() -> Iterator[Session]:
+    """Provide a db session for the time of a request."""
+    yield from session_scope(ENGINE)
+
+
+@contextmanager
+def exclusive(job: str) -> Iterator[None]:
+    """Run a batch on one replica at a time, reject the request otherwise.
+
+    :param job: name of the batch
+    """
+    try:
+        with run_exclusive(ENGINE, job):
+            yield
+    except JobLocked as exc:
+        raise HTTPException(status_code=ErrorCode.CONFLICT.value, detail=str(exc))
+
+
+def count_outbox() -> int:
+    """Return the number of comments waiting to be published."""
+    with SESSION(bind=ENGINE) as session:
+        return count_pending(session)
+
+
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """Provide an async db session for the time of a request."""
+    async with ASYNC_SESSION(bind=ASYNC_ENGINE) as session:
+        yield session
+
+
+@APP.on_event("startup")
+def startup() -> None:
+    """Create the database tables once and start publishing, when the app starts."""
+    create_tables(ENGINE)
+    # the async pool is opened on the loop, that serves the requests
+    WARMUP.loop = asyncio.get_event_loop()
+    WARMUP.start()
+    with SESSION(bind=ENGINE) as session:
+        enqueue_missing(session, PUBLISH_EXPIRY_MINUTES)
+
+    if ALWAYS_ON_SAMPLER is not None:
+        ALWAYS_ON_SAMPLER.start()
+
+    if PIPELINE_EVENTS_ENABLED:
+        # notifications wake the workers, polling is only a fallback
+        OUTBOX_WORKER.poll_seconds = PIPELINE_SWEEP_SECONDS
+        CLASSIFIER_WORKER.start()
+
+    # feedback in other workers invalidates the latest mentions of this one
+    if PIPELINE_EVENTS_ENABLED or ENGINE.dialect.name == "postgresql":
+        LISTENER.start()
+
+    if SCHEDULER_ENABLED:
+        SCHEDULER.start()
+
+    if OUTBOX_WORKER_ENABLED or PIPELINE_EVENTS_ENABLED or SCHEDULER_ENABLED:
+        OUTBOX_WORKER.start()
+
+
+@APP.on_event("shutdown")
+async def shutdown() -> None:
+    """Close all pooled db connections and finish the current backup file."""
+    WARMUP.stop(timeout=5)
+    SCHEDULER.stop(timeout=30)
+    LISTENER.stop(timeout=5)
+    CLASSIFIER_WORKER.stop(timeout=30)
+    OUTBOX_WORKER.stop(timeout=30)
+    INFERENCE_EXECUTOR.shutdown()
+    if ALWAYS_ON_SAMPLER is not None:
+        ALWAYS_ON_SAMPLER.stop()
+    BACKUP_WRITER.close()
+    ENGINE.dispose()
+    await ASYNC_ENGINE.dispose()
+
+
 @APP.get("/")
 async def redirect():
     """Redirect to documentation if index page is called."""
@@ -74,20 +305,50 @@ async def redirect():
     return response
 
 
+@APP.get("/live", response_model=BaseResponse)
+async def live() -> BaseResponse:
+    """Return ok, as long as the api answers at all."""
+    return BaseResponse(status="ok", msg="Alive.")
+
+
+@APP.get("/ready", response_model=ReadinessResponse)
+async def ready() -> ReadinessResponse:
+    """Return ok, once models and db pools are warmed up, and 503 before."""
+    if not WARMUP.ready:
+        msg = f"Not ready, the warm-up is '{WARMUP.state}'."
+        if WARMUP.error:
+            msg += f" Last error: '{WARMUP.error}'"
+        raise HTTPException(status_code=ErrorCode.SERVICE_UNAVAILABLE.value, detail=msg)
+
+    return ReadinessResponse(status="ok", msg="Ready.", result=WARMUP.get_status())
+
+
 # Note: Security is done by the dev server for now
 @APP.post(
     "/v1/find_mentions",
     response_model=RecognitionResponse,
     dependencies=[Depends(JWTBearer())],
 )
-async def find_mentions(body: ExtractorRequestBody) -> RecognitionResponse:
-    """Find mentions of the editorial team in a comment."""
+async def find_mentions(
+    body: ExtractorRequestBody,
+    x_request_timeout: Optional[float] = Header(None),
+) -> RecognitionResponse:
+    """Find mentions of the editorial team in a comment.
+
+    The optional header 'X-Request-Timeout' shortens the deadline of the request.
+    """
     type_ = ModelType.GPT2
-    results = find_mention(
-        type_,
-        body.text,
-        str(uuid.uuid4()),
-    )
+    try:
+        results = await INFERENCE_EXECUTOR.run(
+            find_mention,
+            type_,
+            body.text,
+            str(uuid.uuid4()),
+            timeout=get_timeout(x_request_timeout),
+        )
+    except (Overloaded, DeadlineExceeded) as exc:
+        raise to_http_exception(exc)
+
     if len(results) > 1:
         msg = f"Found {len(results)} mentions."
     elif len(results) == 1:
@@ -100,38 +361,136 @@ async def find_mentions(body: ExtractorRequestBody) -> RecognitionResponse:
     )
 
 
+def get_timeout(requested: Optional[float]) -> float:
+    """Return the deadline of a request in seconds.
+
+    :param requested: timeout asked for by the client
+    """
+    if requested is None or requested <= 0:
+        return INFERENCE_TIMEOUT_SECONDS
+
+    return min(requested, INFERENCE_TIMEOUT_SECONDS)
+
+
+def to_http_exception(exc: Union[Overloaded, DeadlineExceeded]) -> HTTPException:
+    """Reject a request, that the inference executor couldn't serve.
+
+    :param exc: rejection of the executor
+    """
+    if isinstance(exc, Overloaded):
+        code = ErrorCode.TOO_MANY_REQUESTS
+    else:
+        code = ErrorCode.SERVICE_UNAVAILABLE
+
+    return HTTPException(
+        status_code=code.value,
+        detail=str(exc),
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def iter_batch_results(
+    type_: ModelType, items: list[BatchItem], batch_size: int, timeout: float
+) -> Iterator[bytes]:
+    """Find mentions chunk by chunk and yield a json line per item.
+
+    :param type_: model type
+    :param items: texts with their client side ids
+    :param batch_size: number of texts per forward pass
+    :param timeout: seconds until the remaining items are given up
+
+    Note: Items, that couldn't be classified because of overload or the deadline, get
+          an error line as well.
+    """
+    deadline = time.monotonic() + timeout
+    for start in range(0, len(items), batch_size):
+        chunk = items[start : start + batch_size]
+        try:
+            results = INFERENCE_EXECUTOR.run_sync(
+                find_mentions_batch,
+                type_,
+                [item.text for item in chunk],
+                [item.id for item in chunk],
+                batch_size=batch_size,
+                timeout=max(deadline - time.monotonic(), 0),
+            )
+        except (Overloaded, DeadlineExceeded) as exc:
+            results = [exc] * len(chunk)
+
+        for item, result in zip(chunk, results):
+            if isinstance(result, Exception):
+                yield dumps_line({"id": item.id, "status": "error", "msg": str(result)})
+            else:
+                yield dumps_line(
+                    {
+                        "id": item.id,
+                        "status": "ok",
+                        "result": [r.as_dict() for r in result],
+                    }
+                )
+
+
+@APP.post(
+    "/v1/find_mentions_batch",
+    response_class=StreamingResponse,
+    dependencies=[Depends(JWTBearer())],
+)
+def find_mentions_in_batch(
+    body: BatchExtractorRequestBody,
+    x_request_timeout: Optional[float] = Header(None),
+) -> StreamingResponse:
+    """Find mentions in several comments and stream a json line per comment.
+
+    Lines are sent as soon as their chunk is classified. Comments, that can't be
+    processed, get a line with status 'error' instead of failing the whole request.
+    The optional header 'X-Request-Timeout' shortens the deadline of the request.
+    """
+    if len(body.items) > FIND_MENTIONS_BATCH_MAX_ITEMS:
+        msg = f"Got {len(body.items)} items, but at most {FIND_MENTIONS_BATCH_MAX_ITEMS} are allowed."
+        raise HTTPException(
+            status_code=ErrorCode.UNPROCESSABLE_ENTITY.value, detail=msg
+        )
+
+    if INFERENCE_EXECUTOR.is_full():
+        raise to_http_exception(Overloaded(INFERENCE_EXECUTOR.retry_after))
+
+    return StreamingResponse(
+        iter_batch_results(
+            ModelType.GPT2,
+            body.items,
+            FIND_MENTIONS_BATCH_SIZE,
+            get_timeout(x_request_timeout),
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
 @APP.get(
     "/v1/get_mdr_comments",
     response_model=BaseResponse,
     dependencies=[Depends(JWTBearer())],
 )
 def update_comments_from_mdr(
-    query: dict[str, Any] = Depends(MDRUpdateRequest.query_template)
+    query: dict[str, Any] = Depends(MDRUpdateRequest.query_template),
+    session: Session = Depends(get_session),
 ) -> BaseResponse:
     """Get comments from mdr source, store them in the bucket and db."""
     config = MDRUpdateRequest.from_query(query)
     get_comments = MDRCommentGetter()
-    # postgres credentials
-    create_tables(ENGINE)
-    # process comments
-    comments = []
-    for raw_comment in get_comments(config.from_, config.to):
-        try:
-            comment = Comment(**preprocess_mdr_comment(raw_comment))
-        except (IndexError, AttributeError, KeyError, ValueError) as exc:
-            print(f"Skipping comment because of: {exc}")
-        else:
-            comments.append(comment)
-
-    ## save raw comments as backup
-    file_path = BACKUP_PATH + f"{datetime.now().isoformat()}_comment_backup.jsonl"
-    write_jsonlines_to_bucket(file_path, [c.as_dict() for c in comments])
-    # TODO when needed
-    # raw_comments = load_comments_from_bucket(path)
-    # write to database
-    with TableWriter(ENGINE, purge=False) as writer:
+    # the scheduler leads 'fetch_<source>', so its batches don't block the endpoint
+    with exclusive(f"ingest_{MediaHouse.MDR.value}"):
+        # process comments
+        raw_comments = get_comments(config.from_, config.to)
+        comments = to_comments(raw_comments, preprocess_mdr_comment)
+        ## save raw comments as backup
         for comment in comments:
-            writer.write(comment)
+            BACKUP_WRITER.write(comment.as_dict())
+
+        # TODO when needed
+        # raw_comments = load_comments_from_bucket(path)
+        # write to database
+        with TableWriter(ENGINE, session=session, purge=False) as writer:
+            writer.write_many(comments)
 
     msg = f"Processed {len(comments)} comments."
     return BaseResponse(status="ok", msg=msg)
@@ -143,32 +502,26 @@ def update_comments_from_mdr(
     dependencies=[Depends(JWTBearer())],
 )
 def get_latest_br_comments(
-    query: dict[str, Any] = Depends(BRUpdateRequest.query_template)
+    query: dict[str, Any] = Depends(BRUpdateRequest.query_template),
+    session: Session = Depends(get_session),
 ) -> BaseResponse:
     """Get comments from mdr source, store them in the bucket and db."""
     config = BRUpdateRequest.from_query(query)
     get_comments = BRCommentGetter()
-    # postgres credentials
-    create_tables(ENGINE)
-    # process comments
-    comments = []
-    for raw_comment in get_comments(config.lookback):
-        try:
-            comment = Comment(**preprocess_br_comment(raw_comment))
-        except (IndexError, AttributeError, KeyError, ValueError) as exc:
-            print(f"Skipping comment because of: {exc}")
-        else:
-            comments.append(comment)
-
-    ## save raw comments as backup
-    file_path = BACKUP_PATH + f"{datetime.now().isoformat()}_comment_backup.jsonl"
-    write_jsonlines_to_bucket(file_path, [c.as_dict() for c in comments])
-    # TODO when needed
-    # raw_comments = load_comments_from_bucket(path)
-    # write to database
-    with TableWriter(ENGINE, purge=False) as writer:
+    # the scheduler leads 'fetch_<source>', so its batches don't block the endpoint
+    with exclusive(f"ingest_{MediaHouse.BR.value}"):
+        # process comments
+        raw_comments = get_comments(config.lookback)
+        comments = to_comments(raw_comments, preprocess_br_comment)
+        ## save raw comments as backup
         for comment in comments:
-            writer.write(comment)
+            BACKUP_WRITER.write(comment.as_dict())
+
+        # TODO when needed
+        # raw_comments = load_comments_from_bucket(path)
+        # write to database
+        with TableWriter(ENGINE, session=session, purge=False) as writer:
+            writer.write_many(comments)
 
     msg = f"Processed {len(comments)} comments."
     return BaseResponse(status="ok", msg=msg)
@@ -179,33 +532,33 @@ def get_latest_br_comments(
     response_model=BaseResponse,
     dependencies=[Depends(JWTBearer())],
 )
-def add_mentions_to_stored_comments() -> BaseResponse:
-    """Add extraction result to unprocessed comments."""
-    session = sessionmaker()(bind=ENGINE)
-    comments = get_unprocessed(session)
-    mentions = []
-    type_ = ModelType.GPT2
-    for comment in comments:
-        try:
-            results = find_mention(type_, comment.body, comment.id)
-        except PreprocessingError as exc:
-            print(f"Caught exception for comment with id: '{comment.id}': {exc}")
-            comment.status = Status.ERROR
-            comment.note = str(exc)
-        else:
-            if results:
-                comment.status = Status.TO_BE_PUBLISHED
-                comment.mentions = results
-                mentions.extend(results)
-            else:
-                comment.status = Status.NO_MENTIONS
+def add_mentions_to_stored_comments(
+    query: dict[str, Any] = Depends(ProcessingRequest.query_template),
+    session: Session = Depends(get_session),
+) -> BaseResponse:
+    """Add extraction result to unprocessed comments.
 
-    with TableWriter(ENGINE, session=session, purge=False) as writer:
-        for comment in comments:
-            writer.update(comment)
+    Comments are classified and committed chunk by chunk until the backlog is empty or
+    the row or time budget of this call is used up. Each chunk takes a slot of the
+    inference executor, the call is rejected like '/v1/find_mentions', if it is
+    overloaded, and stops early, if it gets overloaded meanwhile.
+    """
+    try:
+        config = ProcessingRequest.from_query(query)
+    except (TypeError, ValueError) as exc:
+        msg = f"Query is illformed: '{exc}'"
+        raise HTTPException(
+            status_code=ErrorCode.UNPROCESSABLE_ENTITY.value, detail=msg
+        )
 
-    session.close()
-    msg = f"Processed and updated {len(comments)} comments."
+    if INFERENCE_EXECUTOR.is_full():
+        raise to_http_exception(Overloaded(INFERENCE_EXECUTOR.retry_after))
+
+    processed = process_backlog(
+        ENGINE, session, config.chunk_size, config.max_rows, config.max_seconds
+    )
+
+    msg = f"Processed and updated {processed} comments."
     return BaseResponse(status="ok", msg=msg)
 
 
@@ -215,26 +568,17 @@ def add_mentions_to_stored_comments() -> BaseResponse:
     dependencies=[Depends(JWTBearer())],
 )
 def send_comments_to_teams() -> BaseResponse:
-    """Get unsend comments and publish them to teams."""
-    session = sessionmaker()(bind=ENGINE)
-    unpublished_comments = get_unpublished(session)
-    if not unpublished_comments:
+    """Publish the outbox to teams right away.
+
+    Note: Comments are published by a background worker anyway. This endpoint drains
+          the outbox in the request, e.g. if the worker is disabled.
+    """
+    delivered = OUTBOX_WORKER.run_once()
+    if not delivered:
         msg = "No new comments to publish."
         return BaseResponse(status="ok", msg=msg)
 
-    lookback_minutes = 30
-    unpublished_comments = check_expiration_time(unpublished_comments, lookback_minutes)
-    with TableWriter(ENGINE, session=session, purge=False) as writer:
-        for media_house_id in ["mdr", "br"]:
-            connector = TeamsConnector(MediaHouse.from_id(media_house_id))
-            # TODO switch back to media house related publishing. Now all comments are published to each media house
-            send_comments(connector, unpublished_comments, writer, MAX_NUMBER_PUBLISH)
-
-        # TODO set back to count per media house
-        pub_buf = len(unpublished_comments)
-
-    session.close()
-    msg = f"Published {pub_buf} comments."
+    msg = f"Published {delivered} comments."
     return BaseResponse(status="ok", msg=msg)
 
 
@@ -243,11 +587,11 @@ def send_comments_to_teams() -> BaseResponse:
     response_model=LatestMentionsResponse,
     dependencies=[Depends(JWTBearer())],
 )
-def get_mentions() -> LatestMentionsResponse:
+async def get_mentions(
+    session: AsyncSession = Depends(get_async_session),
+) -> LatestMentionsResponse:
     """Return a list of the latest comments with mentions."""
-    session = sessionmaker()(bind=ENGINE)
-    latest_mentions = get_latest_mentions(session)
-    session.close()
+    latest_mentions = await get_latest_mentions(session)
     if not latest_mentions or latest_mentions is None:
         msg = "No comments with mentions lately."
         return LatestMentionsResponse(status="ok", msg=msg, result=[])
@@ -259,8 +603,9 @@ def get_mentions() -> LatestMentionsResponse:
 @APP.get(
     "/v1/feedback", response_model=BaseResponse, dependencies=[Depends(JWTBearer())]
 )
-def give_feedback(
-    query: dict[str, Any] = Depends(FeedbackRequest.query_template)
+async def give_feedback(
+    query: dict[str, Any] = Depends(FeedbackRequest.query_template),
+    session: AsyncSession = Depends(get_async_session),
 ) -> BaseResponse:
     """Reload a model from the bucket into this running API."""
     try:
@@ -269,34 +614,241 @@ def give_feedback(
         msg = f"Query is illformed: '{exc}'"
         raise HTTPException(status_code=ErrorCode.NOT_FOUND.value, detail=msg)
     else:
-        session = sessionmaker()(bind=ENGINE)
-        with TableWriter(ENGINE, session=session, purge=False) as writer:
-            comment = writer.get_comment(config.id)
+        async with AsyncTableWriter(ASYNC_ENGINE, session=session) as writer:
+            comment = await writer.get_comment(config.id)
             if comment is None:
                 msg = f"No comment with id: '{config.id}'"
                 raise HTTPException(status_code=ErrorCode.NOT_FOUND.value, detail=msg)
 
+            previous_status = comment.status
             comment.status = config.choice
-            writer.update(comment)
+            await writer.update(comment)
+
+        # other workers invalidate their caches, when they are notified on commit
+        if Status.ACCEPTED in (previous_status, config.choice):
+            invalidate_latest_mentions()
 
-        session.close()
         return BaseResponse(status="ok", msg=f"Updated comment status with feedback.")
 
 
+@APP.get(
+    "/v1/apply_retention",
+    response_model=BaseResponse,
+    dependencies=[Depends(JWTBearer())],
+)
+def archive_old_comments(session: Session = Depends(get_session)) -> BaseResponse:
+    """Archive finished comments past the retention period and drop old partitions.
+
+    Note: Meant to run daily, it also creates the partitions of the upcoming months.
+    """
+    with exclusive("apply_retention"):
+        if POSTGRES_PARTITIONED:
+            ensure_partitions(ENGINE, PARTITION_MONTHS_AHEAD)
+
+        archived, dropped = apply_retention(
+            ENGINE, session, RETENTION_MONTHS, ARCHIVE_PATH
+        )
+
+    msg = f"Archived {archived} comments and dropped {dropped} partitions."
+    return BaseResponse(status="ok", msg=msg)
+
+
+@APP.get(
+    "/v1/sync_bigquery",
+    response_model=BaseResponse,
+    dependencies=[Depends(JWTBearer())],
+)
+def sync_bigquery(session: Session = Depends(get_session)) -> BaseResponse:
+    """Export comments changed since the last sync to BigQuery."""
+    with exclusive("sync_bigquery"):
+        count = sync_comments(session, BigQueryWriter())
+
+    return BaseResponse(status="ok", msg=f"Exported {count} comments.")
+
+
+@APP.get(
+    "/v1/stats",
+    response_model=StatsResponse,
+    dependencies=[Depends(JWTBearer())],
+)
+def get_stats(
+    query: dict[str, Any] = Depends(StatsRequest.query_template),
+    session: Session = Depends(get_session),
+) -> StatsResponse:
+    """Return comment counts per day, media house, status and model type."""
+    try:
+        config = StatsRequest.from_query(query)
+    except (AttributeError, TypeError, ValueError) as exc:
+        msg = f"Query is illformed: '{exc}'"
+        raise HTTPException(
+            status_code=ErrorCode.UNPROCESSABLE_ENTITY.value, detail=msg
+        )
+
+    counts = get_status_counts(session, config.from_, config.to, config.media_house)
+    result = {
+        "counts": [count.as_dict() for count in counts],
+        "feedback": get_feedback_rates(counts),
+    }
+    msg = f"Found {len(counts)} counts from {config.from_} to {config.to}."
+    return StatsResponse(status="ok", msg=msg, result=result)
+
+
+@APP.get(
+    "/v1/rebuild_stats",
+    response_model=BaseResponse,
+    dependencies=[Depends(JWTBearer())],
+)
+def rebuild_stats(session: Session = Depends(get_session)) -> BaseResponse:
+    """Recompute the comment counts from scratch."""
+    with exclusive("rebuild_stats"):
+        rows = rebuild_status_counts(session)
+
+    return BaseResponse(status="ok", msg=f"Rebuilt {rows} comment counts.")
+
+
+@APP.get(
+    "/v1/pool_status",
+    response_model=PoolStatusResponse,
+    dependencies=[Depends(JWTBearer())],
+)
+def pool_status() -> PoolStatusResponse:
+    """Return usage and checkout wait times of the db connection pool."""
+    return PoolStatusResponse(
+        status="ok", msg="Current db pool status.", result=get_pool_status(ENGINE)
+    )
+
+
+@APP.get(
+    "/v1/inference_status",
+    response_model=InferenceStatusResponse,
+    dependencies=[Depends(JWTBearer())],
+)
+def inference_status() -> InferenceStatusResponse:
+    """Return load and rejections of the inference executor."""
+    return InferenceStatusResponse(
+        status="ok",
+        msg="Current inference executor status.",
+        result=INFERENCE_EXECUTOR.get_status(),
+    )
+
+
+@APP.get(
+    "/v1/auth_cache",
+    response_model=AuthCacheResponse,
+    dependencies=[Depends(JWTBearer())],
+)
+def auth_cache(flush: bool = False) -> AuthCacheResponse:
+    """Return size and hit rate of the verified token cache, flush it if requested."""
+    stats = getJWTCacheStats()
+    if flush:
+        flushJWTCache()
+        return AuthCacheResponse(status="ok", msg="Flushed token cache.", result=stats)
+
+    return AuthCacheResponse(status="ok", msg="Current token cache.", result=stats)
+
+
+@APP.get("/metrics", dependencies=[Depends(JWTBearer())])
+def metrics() -> Response:
+    """Return counters and latencies per stage in the prometheus text format."""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@APP.get(
+    "/v1/profiles", response_model=ProfilesResponse, dependencies=[Depends(JWTBearer())]
+)
+def profiles() -> ProfilesResponse:
+    """List the ids of the stored request profiles, newest first."""
+    return ProfilesResponse(
+        status="ok", msg="Stored profiles.", result=list_reports(PROFILE_PATH)
+    )
+
+
+@APP.get(
+    "/v1/profile",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(JWTBearer())],
+)
+def profile(id: Optional[str] = None, reset: bool = False) -> PlainTextResponse:
+    """Return a stored request profile with top functions and call tree.
+
+    Without id, the hot stacks of the always on sampling since its last reset are
+    returned.
+    """
+    if id is None:
+        if ALWAYS_ON_SAMPLER is None:
+            msg = "Always on profiling is disabled, set 'PROFILE_ALWAYS_ON'."
+            raise HTTPException(status_code=ErrorCode.NOT_FOUND.value, detail=msg)
+
+        stacks, samples, seconds = ALWAYS_ON_SAMPLER.snapshot(reset=reset)
+        return PlainTextResponse(render_report(stacks, samples, seconds))
+
+    report = read_report(PROFILE_PATH, id)
+    if report is None:
+        msg = f"Couldn't find the profile: '{id}'"
+        raise HTTPException(status_code=ErrorCode.NOT_FOUND.value, detail=msg)
+
+    return PlainTextResponse(report)
+
+
+@APP.get(
+    "/v1/scheduler",
+    response_model=SchedulerResponse,
+    dependencies=[Depends(JWTBearer())],
+)
+def scheduler() -> SchedulerResponse:
+    """Return queue depths and the latest runs of the in-process scheduler."""
+    return SchedulerResponse(
+        status="ok", msg="Current scheduler status.", result=SCHEDULER.get_status()
+    )
+
+
+@APP.get(
+    "/v1/leaders", response_model=LeadersResponse, dependencies=[Depends(JWTBearer())]
+)
+def leaders() -> LeadersResponse:
+    """Return the replica, that currently runs each singleton job."""
+    return LeadersResponse(
+        status="ok",
+        msg=f"Leaders of singleton jobs, this replica is '{WORKER_ID}'.",
+        result=get_job_holders(ENGINE),
+    )
+
+
+@APP.get(
+    "/v1/workers", response_model=WorkersResponse, dependencies=[Depends(JWTBearer())]
+)
+def workers() -> WorkersResponse:
+    """Return shared and private resident memory of each serving process in bytes."""
+    return WorkersResponse(
+        status="ok",
+        msg=f"Memory of the serving processes, this worker is '{os.getpid()}'.",
+        result=get_workers_memory(),
+    )
+
+
 @APP.get(
     "/v1/reload_model", response_model=BaseResponse, dependencies=[Depends(JWTBearer())]
 )
 def reload_model() -> BaseResponse:
-    """Reload a model from the bucket into this running API."""
+    """Reload the loaded models from the bucket into this running API.
+
+    Note: Refused, when served by 'src.serve'. Only the worker answering the request
+          would reload and its copy would no longer be shared with the master and the
+          other workers. Restart the master to load new models instead.
+    """
+    if get_master_pid() is not None:
+        msg = "Models are shared by the workers of 'src.serve', restart it to reload them."
+        raise HTTPException(status_code=ErrorCode.CONFLICT.value, detail=msg)
+
     try:
-        SPACY_MODEL = spacy.load(BUGG_MODEL_V1_PATH)
+        types = reload_models()
     except OSError as exc:
-        msg = f"Couldn't find the model at: '{BUGG_MODEL_V1_PATH}' because '{exc}'"
+        msg = f"Couldn't reload the models because '{exc}'"
         raise HTTPException(status_code=ErrorCode.NOT_FOUND.value, detail=msg)
     else:
-        return BaseResponse(
-            status="ok", msg=f"Successfully reloaded model '{BUGG_MODEL_V1_PATH}'"
-        )
+        names = ", ".join(type_.value for type_ in types)
+        return BaseResponse(status="ok", msg=f"Successfully reloaded models '{names}'")
 
 
 if __name__ == "__main__":
@@ -1,30 +1,159 @@
 import os
+import socket
 
 # file path
 BACKUP_PATH = os.environ.get("BACKUP_PATH", "model/backup/")
+ARCHIVE_PATH = os.environ.get("ARCHIVE_PATH", BACKUP_PATH + "archive/")
+# backup files: 'gzip', 'zstd' or 'none'
+BACKUP_COMPRESSION = os.environ.get("BACKUP_COMPRESSION", "gzip")
+BACKUP_ROTATE_BYTES = int(os.environ.get("BACKUP_ROTATE_BYTES", 64 * 1024 * 1024))
+BACKUP_ROTATE_SECONDS = int(os.environ.get("BACKUP_ROTATE_SECONDS", 3600))
+# seconds between flushing the compressor and syncing the current file to disk
+BACKUP_FLUSH_SECONDS = int(os.environ.get("BACKUP_FLUSH_SECONDS", 60))
+BACKUP_IN_BACKGROUND = os.environ.get("BACKUP_IN_BACKGROUND", "true").lower() == "true"
+# backup format: 'jsonl' or 'parquet'
+BACKUP_FORMAT = os.environ.get("BACKUP_FORMAT", "jsonl")
+BACKUP_PARQUET_ROWS = int(os.environ.get("BACKUP_PARQUET_ROWS", 10000))
 GPT2_MODEL_PATH = os.environ.get("GPT2_MODEL_PATH", "model/gpt2/")
+# memory mapped copy of the gpt2 weights, shared by all workers, disabled if empty
+GPT2_WEIGHTS_PATH = os.environ.get("GPT2_WEIGHTS_PATH", "")
+# worker processes of 'src.serve', that share the models loaded by their master
+SERVE_WORKERS = int(os.environ.get("SERVE_WORKERS", 1))
 BUGG_MODEL_V1_PATH = os.environ.get("BUGG_MODEL_V1_PATH", "model/detect_mentions/")
 # recogniser source data
 BASELINE_SOURCE = os.environ.get(
     "BASELINE_SOURCE_FILE", "model/baseline_regex_collection.txt"
 )
 
-# comment source api settings
-MDR_COMMENT_ENDPOINT_TOKEN = os.environ["MDR_COMMENT_ENDPOINT_TOKEN"]
-MDR_COMMENT_ENDPOINT = os.environ["MDR_COMMENT_ENDPOINT"]
-BR_COMMENT_ENDPOINT_TOKEN = os.environ["BR_COMMENT_ENDPOINT_TOKEN"]
-BR_COMMENT_ENDPOINT = os.environ["BR_COMMENT_ENDPOINT"]
+# comment source api settings, see '__getattr__'
 
 
-# postgres
+# bigquery export
 TABLE_ID = os.environ.get("TABLE_ID", "comments")
-POSTGRES_IP = os.environ["DATABASE_ADDRESS"]
-POSTGRES_USER = os.environ["DATABASE_USER"]
-POSTGRES_PASS = os.environ["DATABASE_PASSWORD"]
-POSTGRES_URI = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASS}@{POSTGRES_IP}"
+BIGQUERY_PROJECT_ID = os.environ.get("BIGQUERY_PROJECT_ID", "")
+BIGQUERY_DATASET_ID = os.environ.get("BIGQUERY_DATASET_ID", "")
+BIGQUERY_CREDENTIAL_PATH = os.environ.get("IDA_BIGQUERY_CREDENTIAL_PATH", "")
+BIGQUERY_SYNC_PATH = os.environ.get("BIGQUERY_SYNC_PATH", BACKUP_PATH + "bigquery/")
+
+# postgres, credentials see '__getattr__'
+POSTGRES_POOL_SIZE = int(os.environ.get("POSTGRES_POOL_SIZE", 5))
+POSTGRES_MAX_OVERFLOW = int(os.environ.get("POSTGRES_MAX_OVERFLOW", 10))
+POSTGRES_POOL_TIMEOUT = int(os.environ.get("POSTGRES_POOL_TIMEOUT", 30))
+POSTGRES_POOL_RECYCLE = int(os.environ.get("POSTGRES_POOL_RECYCLE", 1800))
+POSTGRES_POOL_PRE_PING = (
+    os.environ.get("POSTGRES_POOL_PRE_PING", "true").lower() == "true"
+)
+# partition comments and mentions by month, applies when tables are created
+POSTGRES_PARTITIONED = os.environ.get("POSTGRES_PARTITIONED", "false").lower() == "true"
+PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", 2))
+# months until finished comments are archived and removed
+RETENTION_MONTHS = int(os.environ.get("RETENTION_MONTHS", 3))
+
+# classification job
+PROCESSING_CHUNK_SIZE = int(os.environ.get("PROCESSING_CHUNK_SIZE", 100))
+PROCESSING_MAX_ROWS = int(os.environ.get("PROCESSING_MAX_ROWS", 5000))
+PROCESSING_MAX_SECONDS = float(os.environ.get("PROCESSING_MAX_SECONDS", 50))
+# upper bounds of the chunk size and time budget a request may ask for
+PROCESSING_CHUNK_SIZE_LIMIT = int(os.environ.get("PROCESSING_CHUNK_SIZE_LIMIT", 500))
+PROCESSING_MAX_SECONDS_LIMIT = float(
+    os.environ.get("PROCESSING_MAX_SECONDS_LIMIT", 300)
+)
+# limits of /v1/find_mentions_batch
+FIND_MENTIONS_BATCH_MAX_ITEMS = int(
+    os.environ.get("FIND_MENTIONS_BATCH_MAX_ITEMS", 500)
+)
+FIND_MENTIONS_BATCH_SIZE = int(os.environ.get("FIND_MENTIONS_BATCH_SIZE", 32))
+# concurrent forward passes for requests and calls allowed to wait for them
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 2))
+INFERENCE_QUEUE_SIZE = int(os.environ.get("INFERENCE_QUEUE_SIZE", 16))
+# default and max deadline of a request, clients may ask for less
+INFERENCE_TIMEOUT_SECONDS = float(os.environ.get("INFERENCE_TIMEOUT_SECONDS", 10))
+INFERENCE_RETRY_AFTER_SECONDS = int(os.environ.get("INFERENCE_RETRY_AFTER_SECONDS", 2))
+# models loaded on startup, others are loaded on their first request
+PRELOAD_MODELS = [
+    type_ for type_ in os.environ.get("PRELOAD_MODELS", "gpt2").split(",") if type_
+]
+# sample batches run through each preloaded model, before the api reports ready
+WARMUP_ROUNDS = int(os.environ.get("WARMUP_ROUNDS", 2))
+WARMUP_RETRY_SECONDS = float(os.environ.get("WARMUP_RETRY_SECONDS", 10))
+# work queue claims, 'WORKER_ID' see '__getattr__'
+CLAIM_LEASE_SECONDS = int(os.environ.get("CLAIM_LEASE_SECONDS", 300))
+# seconds between renewals of the leadership of singleton jobs
+LEADER_RENEW_SECONDS = float(os.environ.get("LEADER_RENEW_SECONDS", 10))
+# seconds the latest mentions are served from cache
+LATEST_MENTIONS_CACHE_TTL = int(os.environ.get("LATEST_MENTIONS_CACHE_TTL", 60))
+# profiling of single requests and the optional always on sampling
+PROFILE_PATH = os.environ.get("PROFILE_PATH", "model/profiles/")
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 0.005))
+PROFILE_ALWAYS_ON = os.environ.get("PROFILE_ALWAYS_ON", "false").lower() == "true"
+PROFILE_ALWAYS_ON_INTERVAL = float(os.environ.get("PROFILE_ALWAYS_ON_INTERVAL", 0.1))
 
 # team settings
 MAX_NUMBER_PUBLISH = 5
-TEST_TARGET = os.environ["TEST_TARGET"]
-MDR_TARGET = os.environ["MDR_TARGET"]
-BR_TARGET = os.environ["BR_TARGET"]
+TEAMS_BATCH_SIZE = int(os.environ.get("TEAMS_BATCH_SIZE", 10))
+TEAMS_HTTP_POOL_SIZE = int(os.environ.get("TEAMS_HTTP_POOL_SIZE", 4))
+# comments older than this are not published anymore
+PUBLISH_EXPIRY_MINUTES = int(os.environ.get("PUBLISH_EXPIRY_MINUTES", 30))
+# webhook calls per second and burst size per media house
+TEAMS_RATE_PER_SECOND = float(os.environ.get("TEAMS_RATE_PER_SECOND", 1))
+TEAMS_RATE_BURST = int(os.environ.get("TEAMS_RATE_BURST", 4))
+# background publisher draining the outbox
+OUTBOX_WORKER_ENABLED = (
+    os.environ.get("OUTBOX_WORKER_ENABLED", "true").lower() == "true"
+)
+OUTBOX_POLL_SECONDS = float(os.environ.get("OUTBOX_POLL_SECONDS", 5))
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_BACKOFF_SECONDS = float(os.environ.get("OUTBOX_BACKOFF_SECONDS", 2))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.environ.get("OUTBOX_MAX_BACKOFF_SECONDS", 300))
+# wake classifier and publisher by postgres notifications instead of polling
+PIPELINE_EVENTS_ENABLED = (
+    os.environ.get("PIPELINE_EVENTS_ENABLED", "false").lower() == "true"
+)
+# fallback sweep for notifications, that got lost
+PIPELINE_SWEEP_SECONDS = float(os.environ.get("PIPELINE_SWEEP_SECONDS", 60))
+# in-process scheduler for fetching and classifying, instead of external calls
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "false").lower() == "true"
+SCHEDULER_MDR_INTERVAL = float(os.environ.get("SCHEDULER_MDR_INTERVAL", 60))
+SCHEDULER_BR_INTERVAL = float(os.environ.get("SCHEDULER_BR_INTERVAL", 60))
+SCHEDULER_LOOKBACK_HOURS = int(os.environ.get("SCHEDULER_LOOKBACK_HOURS", 1))
+SCHEDULER_QUEUE_SIZE = int(os.environ.get("SCHEDULER_QUEUE_SIZE", 4))
+SCHEDULER_HISTORY_SIZE = int(os.environ.get("SCHEDULER_HISTORY_SIZE", 100))
+# settings without default, read on first use, so that e.g. tools and tests import
+# this module without setting all of them
+REQUIRED = {
+    "MDR_COMMENT_ENDPOINT_TOKEN": "MDR_COMMENT_ENDPOINT_TOKEN",
+    "MDR_COMMENT_ENDPOINT": "MDR_COMMENT_ENDPOINT",
+    "BR_COMMENT_ENDPOINT_TOKEN": "BR_COMMENT_ENDPOINT_TOKEN",
+    "BR_COMMENT_ENDPOINT": "BR_COMMENT_ENDPOINT",
+    "POSTGRES_IP": "DATABASE_ADDRESS",
+    "POSTGRES_USER": "DATABASE_USER",
+    "POSTGRES_PASS": "DATABASE_PASSWORD",
+    "TEST_TARGET": "TEST_TARGET",
+    "MDR_TARGET": "MDR_TARGET",
+    "BR_TARGET": "BR_TARGET",
+}
+
+
+def __getattr__(name: str) -> str:
+    """Read a required setting from the environment.
+
+    :param name: name of the setting
+    """
+    if name in REQUIRED:
+        return os.environ[REQUIRED[name]]
+    elif name == "WORKER_ID":
+        # read late, so that each forked worker gets its own id
+        return os.environ.get("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+    elif name == "POSTGRES_URI":
+        user, password, ip = (
+            __getattr__(key)
+            for key in ("POSTGRES_USER", "POSTGRES_PASS", "POSTGRES_IP")
+        )
+        return f"postgresql://{user}:{password}@{ip}"
+    elif name == "POSTGRES_ASYNC_URI":
+        return __getattr__("POSTGRES_URI").replace(
+            "postgresql://", "postgresql+asyncpg://"
+        )
+    else:
+        raise AttributeError(f"module 'settings' has no attribute '{name}'")
@@ -1,10 +1,17 @@
 from typing import Any, Optional, Union
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 from fastapi import Query
 
-from src.models import Status
+from src.models import MediaHouse, Status
+from settings import (
+    PROCESSING_CHUNK_SIZE,
+    PROCESSING_CHUNK_SIZE_LIMIT,
+    PROCESSING_MAX_ROWS,
+    PROCESSING_MAX_SECONDS,
+    PROCESSING_MAX_SECONDS_LIMIT,
+)
 
 DEFAULT_LOOKBACK = 12
 
@@ -13,6 +20,15 @@ class ExtractorRequestBody(BaseModel):
     text: str
 
 
+class BatchItem(BaseModel):
+    id: str
+    text: str
+
+
+class BatchExtractorRequestBody(BaseModel):
+    items: list[BatchItem]
+
+
 class MDRUpdateRequest(BaseModel):
     from_: datetime
     to: datetime
@@ -132,3 +148,121 @@ class FeedbackRequest(BaseModel):
 
         choice = Status.from_choice(choice)
         return cls(id=id_, choice=choice)
+
+
+class ProcessingRequest(BaseModel):
+    chunk_size: int = PROCESSING_CHUNK_SIZE
+    max_rows: int = PROCESSING_MAX_ROWS
+    max_seconds: float = PROCESSING_MAX_SECONDS
+
+    @staticmethod
+    def query_template(
+        chunk_size: Optional[int] = Query(
+            PROCESSING_CHUNK_SIZE,
+            title="Chunk size",
+            description="Number of comments classified and committed at once",
+            le=PROCESSING_CHUNK_SIZE_LIMIT,
+        ),
+        max_rows: Optional[int] = Query(
+            PROCESSING_MAX_ROWS,
+            title="Max rows",
+            description="Max number of comments to process in this call",
+        ),
+        max_seconds: Optional[float] = Query(
+            PROCESSING_MAX_SECONDS,
+            title="Max seconds",
+            description="Time budget in seconds after which no new chunk is started",
+            le=PROCESSING_MAX_SECONDS_LIMIT,
+        ),
+    ) -> dict[str, Any]:
+        """Define api query parameters.
+
+        :param : api query arguments
+
+        Note: This query definition is used for swagger documentation.
+        """
+        return {
+            "chunk_size": chunk_size,
+            "max_rows": max_rows,
+            "max_seconds": max_seconds,
+        }
+
+    @classmethod
+    def from_query(cls, query: dict[str, Any]) -> "ProcessingRequest":
+        """Init from api arguments.
+
+        :param query: api path query as dict
+        """
+        chunk_size = query.get("chunk_size")
+        if chunk_size is None:
+            chunk_size = PROCESSING_CHUNK_SIZE
+        max_rows = query.get("max_rows")
+        if max_rows is None:
+            max_rows = PROCESSING_MAX_ROWS
+        max_seconds = query.get("max_seconds")
+        if max_seconds is None:
+            max_seconds = PROCESSING_MAX_SECONDS
+        # explicit zeros are rejected, not replaced by the defaults
+        if chunk_size <= 0 or max_rows <= 0 or max_seconds <= 0:
+            raise ValueError("Chunk size, max rows and max seconds must be positive.")
+
+        if chunk_size > PROCESSING_CHUNK_SIZE_LIMIT:
+            raise ValueError(f"Chunk size must be <= {PROCESSING_CHUNK_SIZE_LIMIT}.")
+
+        if max_seconds > PROCESSING_MAX_SECONDS_LIMIT:
+            raise ValueError(f"Max seconds must be <= {PROCESSING_MAX_SECONDS_LIMIT}.")
+
+        return cls(chunk_size=chunk_size, max_rows=max_rows, max_seconds=max_seconds)
+
+
+class StatsRequest(BaseModel):
+    from_: date
+    to: date
+    media_house: Optional[MediaHouse] = None
+
+    @staticmethod
+    def query_template(
+        from_: Optional[str] = Query(
+            (date.today() - timedelta(days=7)).isoformat(),  # example value
+            title="From",
+            description="First day to include (iso 8601)",
+        ),
+        to: Optional[str] = Query(
+            date.today().isoformat(),  # example value
+            title="To",
+            description="Last day to include (iso 8601)",
+        ),
+        media_house: Optional[str] = Query(
+            None,
+            title="Media house",
+            description="Media house id, all media houses if empty",
+        ),
+    ) -> dict[str, Optional[str]]:
+        """Define api query parameters.
+
+        :param : api query arguments
+
+        Note: This query definition is used for swagger documentation.
+        """
+        return {"from": from_, "to": to, "media_house": media_house}
+
+    @classmethod
+    def from_query(cls, query: dict[str, Any]) -> "StatsRequest":
+        """Init from api arguments.
+
+        :param query: api path query as dict
+        """
+        to = date.fromisoformat(query["to"]) if query.get("to") else date.today()
+        if query.get("from"):
+            from_ = date.fromisoformat(query["from"])
+        else:
+            from_ = to - timedelta(days=7)
+
+        if to < from_:
+            raise ValueError(f"'to' value lays before 'from' value: {to} < {from_}")
+
+        media_house = query.get("media_house")
+        if media_house is not None:
+            media_house = MediaHouse.from_id(media_house)
+
+        return cls(from_=from_, to=to, media_house=media_house)
@@ -4,7 +4,10 @@ from enum import Enum
 
 class ErrorCode(Enum):
     NOT_FOUND = 404
+    CONFLICT = 409
     UNPROCESSABLE_ENTITY = 422
+    TOO_MANY_REQUESTS = 429
+    SERVICE_UNAVAILABLE = 503
 
 
 class BaseResponse(BaseModel):
@@ -18,3 +21,39 @@ class RecognitionResponse(BaseResponse):
 
 class LatestMentionsResponse(BaseResponse):
     result: list[dict]
+
+
+class PoolStatusResponse(BaseResponse):
+    result: dict
+
+
+class StatsResponse(BaseResponse):
+    result: dict
+
+
+class InferenceStatusResponse(BaseResponse):
+    result: dict
+
+
+class AuthCacheResponse(BaseResponse):
+    result: dict
+
+
+class ProfilesResponse(BaseResponse):
+    result: list[str]
+
+
+class SchedulerResponse(BaseResponse):
+    result: dict
+
+
+class LeadersResponse(BaseResponse):
+    result: dict
+
+
+class WorkersResponse(BaseResponse):
+    result: dict
+
+
+class ReadinessResponse(BaseResponse):
+    result: dict
@@ -1,7 +1,7 @@
 from fastapi import HTTPException, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
-from .auth_handler import decodeJWT
+from .auth_handler import decodeJWTCached
 
 
 class JWTBearer(HTTPBearer):
@@ -36,7 +36,7 @@ class JWTBearer(HTTPBearer):
 
         :param jwtoken: the token to verify
         """
-        payload = decodeJWT(jwtoken)
+        payload = decodeJWTCached(jwtoken)
         if payload is not None:
             if payload:
                 return True
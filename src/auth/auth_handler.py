@@ -1,11 +1,37 @@
+import hashlib
+import threading
 import time
 import os
-from typing import Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 import jwt
+from cachetools import TLRUCache  # type: ignore
 
-JWT_ALGORITHM = os.environ["JWT_ALGORITHM"]
-JWT_SECRET = os.environ["JWT_ALGORITHM"]
+# read from the environment on first use, see 'getJWTKey'
+JWT_ALGORITHM: Optional[str] = None
+JWT_SECRET: Optional[str] = None
+# verified tokens are trusted until they expire, at most for this many seconds
+JWT_CACHE_TTL = float(os.environ.get("JWT_CACHE_TTL", 300))
+JWT_NEGATIVE_CACHE_TTL = float(os.environ.get("JWT_NEGATIVE_CACHE_TTL", 10))
+JWT_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE", 1024))
+
+
+def _time_to_use(key: bytes, payload: Optional[Dict[str, Any]], now: float) -> float:
+    """Return the time until a cached verification is valid.
+
+    :param key: token digest
+    :param payload: decoded token or None, if the token was rejected
+    :param now: current time
+    """
+    if payload is None:
+        return now + JWT_NEGATIVE_CACHE_TTL
+
+    return min(now + JWT_CACHE_TTL, payload["expires"])
+
+
+JWT_CACHE = TLRUCache(maxsize=JWT_CACHE_SIZE, ttu=_time_to_use, timer=time.time)
+JWT_CACHE_LOCK = threading.Lock()
+JWT_CACHE_STATS = {"hits": 0, "misses": 0}
 
 
 def token_response(token: str) -> Dict[str, str]:
@@ -16,6 +42,17 @@ def token_response(token: str) -> Dict[str, str]:
     return {"access_token": token}
 
 
+def getJWTKey() -> Tuple[str, str]:
+    """Return secret and algorithm of the tokens, read them on first use."""
+    global JWT_ALGORITHM, JWT_SECRET
+    if JWT_ALGORITHM is None:
+        JWT_ALGORITHM = os.environ["JWT_ALGORITHM"]
+    if JWT_SECRET is None:
+        JWT_SECRET = os.environ["JWT_SECRET"]
+
+    return JWT_SECRET, JWT_ALGORITHM
+
+
 def signJWT(user_id: str, valid_in_sec: int = 31556952) -> Dict[str, str]:
     """Create a JWT token from a user_id.
 
@@ -25,7 +62,8 @@ def signJWT(user_id: str, valid_in_sec: int = 31556952) -> Dict[str, str]:
     Note: Default expiration time is one year
     """
     payload = {"user_id": user_id, "expires": time.time() + valid_in_sec}
-    token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    secret, algorithm = getJWTKey()
+    token = jwt.encode(payload, secret, algorithm=algorithm)
     return token_response(token)
 
 
@@ -34,8 +72,46 @@ def decodeJWT(token: str) -> Optional[Dict[str, str]]:
 
     :param token: the token to decode
     """
+    secret, algorithm = getJWTKey()
     try:
-        decoded_token = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        decoded_token = jwt.decode(token, secret, algorithms=[algorithm])
         return decoded_token if decoded_token["expires"] >= time.time() else None
     except:
         return None
+
+
+def decodeJWTCached(token: str) -> Optional[Dict[str, str]]:
+    """Decode a JWT token, reusing earlier verifications of the same token.
+
+    :param token: the token to decode
+
+    Note: Tokens are cached by their digest, valid ones until they expire or for
+          'JWT_CACHE_TTL' seconds, rejected ones for 'JWT_NEGATIVE_CACHE_TTL' seconds.
+    """
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    with JWT_CACHE_LOCK:
+        try:
+            payload = JWT_CACHE[key]
+        except KeyError:
+            JWT_CACHE_STATS["misses"] += 1
+        else:
+            JWT_CACHE_STATS["hits"] += 1
+            return payload
+
+    payload = decodeJWT(token)
+    with JWT_CACHE_LOCK:
+        JWT_CACHE[key] = payload
+
+    return payload
+
+
+def flushJWTCache() -> None:
+    """Forget all cached verifications, e.g. after a token was revoked."""
+    with JWT_CACHE_LOCK:
+        JWT_CACHE.clear()
+
+
+def getJWTCacheStats() -> Dict[str, int]:
+    """Return size and hit/miss counters of the token cache."""
+    with JWT_CACHE_LOCK:
+        return {"size": len(JWT_CACHE), **JWT_CACHE_STATS}
@@ -0,0 +1,64 @@
+from typing import Optional
+import threading
+
+
+class BackgroundWorker:
+    """Run 'drain' in a thread whenever woken up, at the latest every 'poll_seconds'.
+
+    :param name: name of the thread
+    :param poll_seconds: seconds to sleep between rounds, unless woken up earlier
+
+    Note: Subclasses implement 'drain'. Use 'run_once' to drain from a request, while
+          the thread might be running.
+    """
+
+    def __init__(self, name: str, poll_seconds: float):
+        self.name = name
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start draining in the background."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the background thread after its current round.
+
+        :param timeout: seconds to wait for the thread
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self) -> None:
+        """Start the next round right away."""
+        self._wake.set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as exc:
+                print(f"Error in background worker '{self.name}': {exc}")
+
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def run_once(self) -> int:
+        """Drain once, after the round of the background thread has finished."""
+        with self._lock:
+            return self.drain()
+
+    def drain(self) -> int:
+        raise NotImplementedError
@@ -0,0 +1,167 @@
+"""Measure how long the API takes to import and to answer its first request.
+
+Example:
+
+    python -m src.benchmark_startup --top 20 --runs 3
+
+The import report is parsed from 'python -X importtime' and lists the modules with
+the highest cumulative import time. Time-to-first-request starts the API with uvicorn
+and polls '/ready' until it answers with 200, i.e. until the models are loaded and
+warmed up. It needs the same settings as the API.
+"""
+from typing import Optional
+from argparse import ArgumentParser, Namespace
+from dataclasses import dataclass
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+@dataclass
+class ImportTime:
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def parse_importtime(stderr: str) -> list[ImportTime]:
+    """Parse the output of 'python -X importtime'.
+
+    :param stderr: stderr of the python process
+
+    Note: Lines look like 'import time:       123 |        456 |   package.module'.
+    """
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # header line
+            continue
+
+        times.append(
+            ImportTime(
+                module=fields[2].strip(),
+                self_us=int(fields[0]),
+                cumulative_us=int(fields[1]),
+            )
+        )
+
+    return times
+
+
+def measure_imports(module: str) -> tuple[float, list[ImportTime]]:
+    """Import a module in a fresh interpreter and return wall time and import times.
+
+    :param module: module to import
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    duration = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing '{module}' failed:\n{process.stderr[-2000:]}")
+
+    return duration, parse_importtime(process.stderr)
+
+
+def measure_first_request(
+    app: str, port: int, path: str = "/ready", timeout: float = 300
+) -> float:
+    """Start the API and return the seconds until it answers a request with 200.
+
+    :param app: uvicorn app, e.g. 'api:APP'
+    :param port: port to bind the API to
+    :param path: cheap path to request, '/ready' answers 503 until the warm-up is done
+    :param timeout: seconds to wait for the API
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"The API exited with code {process.returncode}.")
+
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+            except OSError:
+                time.sleep(0.05)
+            else:
+                if response.status == 200:
+                    return time.perf_counter() - start
+
+                time.sleep(0.05)
+            finally:
+                connection.close()
+
+        raise TimeoutError(f"The API wasn't ready within {timeout} seconds.")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def get_parser() -> ArgumentParser:
+    """Return the command line arguments."""
+    parser = ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--module", default="api", help="module to import")
+    parser.add_argument("--app", default="api:APP", help="app for uvicorn")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--path", default="/ready", help="path to poll for a 200")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=20, help="modules to report")
+    parser.add_argument(
+        "--skip-request", action="store_true", help="only measure the imports"
+    )
+    return parser
+
+
+def main(args: Optional[Namespace] = None) -> None:
+    args = args or get_parser().parse_args()
+    # run from the repository root, so 'settings' and 'api' are importable
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    durations = []
+    imports: list[ImportTime] = []
+    for _ in range(args.runs):
+        duration, imports = measure_imports(args.module)
+        durations.append(duration)
+
+    print(
+        f"Import of '{args.module}': median {statistics.median(durations):.3f}s "
+        f"over {args.runs} runs"
+    )
+    print(f"{'cumulative [ms]':>16} {'self [ms]':>10}  module")
+    for entry in sorted(imports, key=lambda entry: -entry.cumulative_us)[: args.top]:
+        print(
+            f"{entry.cumulative_us / 1000:16.1f} {entry.self_us / 1000:10.1f}  "
+            f"{entry.module}"
+        )
+
+    if not args.skip_request:
+        durations = [
+            measure_first_request(args.app, args.port, args.path)
+            for _ in range(args.runs)
+        ]
+        print(
+            f"Time to first request: median {statistics.median(durations):.3f}s "
+            f"over {args.runs} runs"
+        )
+
+
+if __name__ == "__main__":
+    main()
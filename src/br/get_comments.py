@@ -1,15 +1,17 @@
-from settings import BR_COMMENT_ENDPOINT, BR_COMMENT_ENDPOINT_TOKEN
+import settings
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
+from src.metrics import timed
+from src.models import MediaHouse
 from src.tools import request
 
 
 class BRCommentGetter(BaseModel):
     """Get comment from br comment endpoint."""
 
-    url: str = BR_COMMENT_ENDPOINT
-    token: str = BR_COMMENT_ENDPOINT_TOKEN
+    url: str = Field(default_factory=lambda: settings.BR_COMMENT_ENDPOINT)
+    token: str = Field(default_factory=lambda: settings.BR_COMMENT_ENDPOINT_TOKEN)
 
     def get_comments(self, lookback: int) -> list[Optional[dict]]:
         """Get commens for a specified timeframe.
@@ -18,7 +20,9 @@ class BRCommentGetter(BaseModel):
         """
         query = {"lookback": lookback}
         headers = {"Authorization": f"Bearer {self.token}"}
-        response = request(self.url, method="Get", body=query, headers=headers)
+        with timed("fetch", media_house=MediaHouse.BR.value):
+            response = request(self.url, method="Get", body=query, headers=headers)
+
         return response["result"]
 
     __call__ = get_comments
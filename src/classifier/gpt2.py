@@ -1,18 +1,30 @@
+from typing import Optional
+import os
+
 from transformers import (
     AutoModelForSequenceClassification,
     AutoTokenizer,
     pipeline,
 )
 
-from settings import GPT2_MODEL_PATH
+from settings import GPT2_MODEL_PATH, GPT2_WEIGHTS_PATH
 from src.classifier.preprocess import preprocess_comment_text
 
 
 class GPT2:
-    def __init__(self, model_path: str = GPT2_MODEL_PATH) -> None:
+    def __init__(
+        self,
+        model_path: str = GPT2_MODEL_PATH,
+        weights_path: Optional[str] = GPT2_WEIGHTS_PATH,
+    ) -> None:
         """Initialise model.
 
         :param model_path: path to the model source files
+        :param weights_path: memory mapped copy of the weights, see 'map_weights'
+
+        Note: The weights file is written, when it is missing or older than the model.
+              Afterwards the weights of all processes, that load the model, share the
+              same memory.
         """
         self._model_path = model_path
         self._tokenizer = AutoTokenizer.from_pretrained(self._model_path)
@@ -20,6 +32,21 @@ class GPT2:
         self._model = AutoModelForSequenceClassification.from_pretrained(
             self._model_path
         )
+        # required to pad batches of texts
+        self._model.config.pad_token_id = self._tokenizer.eos_token_id
+        if weights_path:
+            from src.classifier.weights import map_weights, read_metadata, save_weights
+
+            source = {
+                "model_path": os.path.abspath(model_path),
+                "modified": str(
+                    max(entry.stat().st_mtime for entry in os.scandir(model_path))
+                ),
+            }
+            if read_metadata(weights_path) != source:
+                save_weights(self._model, weights_path, source)
+
+            map_weights(self._model, weights_path)
         self._pipe = pipeline(
             "text-classification", model=self._model, tokenizer=self._tokenizer
         )
@@ -37,12 +64,46 @@ class GPT2:
                 return False
 
         result = self._pipe(text)
-        label = result[0]["label"]
-        if label == "LABEL_1":
-            return True
-        elif label == "LABEL_0":
-            return False
-        else:
-            raise ValueError(f"Got unknown classification label: {label}")
+        return _has_mentions(result[0]["label"])
+
+    def classify_batch(
+        self, texts: list[str], batch_size: int = 32, preprocess_text: bool = True
+    ) -> list[bool]:
+        """Classify several texts at once, see 'classify'.
+
+        :param texts: texts to classify
+        :param batch_size: number of texts per forward pass
+        :param preprocess_text: preprocess text before training, if true
+        """
+        results = [False] * len(texts)
+        indices, valid = [], []
+        for index, text in enumerate(texts):
+            if preprocess_text:
+                try:
+                    text = preprocess_comment_text(text)
+                except (ValueError, TypeError):
+                    continue
+
+            indices.append(index)
+            valid.append(text)
+
+        if valid:
+            for index, result in zip(indices, self._pipe(valid, batch_size=batch_size)):
+                results[index] = _has_mentions(result["label"])
+
+        return results
 
     __call__ = classify
+
+
+def _has_mentions(label: str) -> bool:
+    """Map a classification label.
+
+    :param label: label predicted by the model
+    """
+    if label == "LABEL_1":
+        return True
+    elif label == "LABEL_0":
+        return False
+    else:
+        raise ValueError(f"Got unknown classification label: {label}")
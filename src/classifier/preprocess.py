@@ -3,6 +3,8 @@ import re
 
 from cleantext import clean
 
+from src.metrics import timed
+
 REMOVE_HTML = re.compile(r"<.*?>")
 POINTS = re.compile(r"\.+")
 LINES = re.compile(r"--+")
@@ -15,6 +17,7 @@ FORMATTING_FRAGMENTS = [
 GAP = re.compile(r"\s\s+")
 
 
+@timed("preprocess_text")
 def preprocess_comment_text(text: str) -> str:
     """Perform text preprocessing steps.
 
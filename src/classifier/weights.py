@@ -0,0 +1,137 @@
+"""Store model weights in one flat file and map them into memory.
+
+The file follows the safetensors layout: 8 bytes header length (little endian), a json
+header with dtype, shape and byte offsets of each tensor, and the raw tensor data.
+Mapped tensors are backed by the page cache, so all processes, that map the same file,
+share one copy of the weights instead of holding a private copy each.
+"""
+from typing import Any, Optional
+import json
+import mmap
+import os
+import struct
+
+import torch
+
+DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+DTYPE_NAMES = {dtype: name for name, dtype in DTYPES.items()}
+# tensors start at multiples of this, so they can be viewed without copying
+ALIGNMENT = 64
+
+
+def get_tensors(model: torch.nn.Module) -> dict[str, torch.Tensor]:
+    """Return parameters and buffers of a model by name.
+
+    :param model: torch model
+
+    Note: Tied weights are returned once.
+    """
+    tensors = dict(model.named_parameters())
+    tensors.update(model.named_buffers())
+    return tensors
+
+
+def read_metadata(path: str) -> Optional[dict[str, str]]:
+    """Return the metadata of a weights file or None, if there is no such file.
+
+    :param path: path of the weights file
+    """
+    try:
+        with open(path, "rb") as file:
+            (length,) = struct.unpack("<Q", file.read(8))
+            return json.loads(file.read(length)).get("__metadata__", {})
+    except (OSError, struct.error, ValueError):
+        return None
+
+
+def save_weights(
+    model: torch.nn.Module, path: str, metadata: Optional[dict[str, str]] = None
+) -> None:
+    """Write the weights of a model to a file, see 'map_weights'.
+
+    :param model: torch model
+    :param path: path of the weights file
+    :param metadata: e.g. the source of the weights, see 'read_metadata'
+    """
+    header: dict[str, Any] = {"__metadata__": metadata or {}}
+    chunks = []
+    offset = 0
+    for name, tensor in get_tensors(model).items():
+        dtype = tensor.dtype
+        tensor = tensor.detach().cpu().contiguous()
+        if dtype == torch.bfloat16:
+            # numpy has no bfloat16, the bytes are the same
+            tensor = tensor.view(torch.int16)
+
+        data = tensor.numpy().tobytes()
+        header[name] = {
+            "dtype": DTYPE_NAMES[dtype],
+            "shape": list(tensor.shape),
+            "data_offsets": [offset, offset + len(data)],
+        }
+        padding = -len(data) % ALIGNMENT
+        chunks.append(data + b"\0" * padding)
+        offset += len(data) + padding
+
+    encoded = json.dumps(header).encode("utf-8")
+    # the data starts aligned as well
+    encoded += b" " * (-(8 + len(encoded)) % ALIGNMENT)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(struct.pack("<Q", len(encoded)))
+        file.write(encoded)
+        for chunk in chunks:
+            file.write(chunk)
+
+    os.replace(tmp_path, path)
+
+
+def map_weights(model: torch.nn.Module, path: str) -> int:
+    """Replace the weights of a model by tensors mapped from a file.
+
+    :param model: torch model, its weights are replaced in place
+    :param path: path of a file written by 'save_weights'
+
+    Note: The mapping is copy on write, a process, that changes a weight, gets a private
+          copy of the changed pages, the file is never written.
+    """
+    with open(path, "rb") as file:
+        (length,) = struct.unpack("<Q", file.read(8))
+        header = json.loads(file.read(length))
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    start = 8 + length
+    tensors = get_tensors(model)
+    missing = set(tensors) - set(header)
+    if missing:
+        raise ValueError(f"The weights in '{path}' miss {sorted(missing)}.")
+
+    mapped = 0
+    for name, tensor in tensors.items():
+        entry = header[name]
+        begin, end = entry["data_offsets"]
+        dtype = DTYPES[entry["dtype"]]
+        if list(tensor.shape) != entry["shape"] or tensor.dtype != dtype:
+            raise ValueError(f"The weights in '{path}' don't match '{name}'.")
+
+        if end > begin:
+            size = torch.empty(0, dtype=dtype).element_size()
+            data = torch.frombuffer(
+                buffer, dtype=dtype, count=(end - begin) // size, offset=start + begin
+            )
+            tensor.data = data.view(entry["shape"])
+        mapped += end - begin
+
+    return mapped
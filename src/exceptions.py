@@ -2,3 +2,12 @@ class PreprocessingError(Exception):
     """Throw, if preprocessing of text results in error."""
 
     pass
+
+
+class JobLocked(Exception):
+    """Throw, if a singleton job already runs on another replica."""
+
+    def __init__(self, name: str, holder: str):
+        super().__init__(f"Job '{name}' is already running on '{holder}'.")
+        self.name = name
+        self.holder = holder
@@ -1,15 +1,99 @@
+from typing import Any, Iterable, Union
+from functools import partial
+from threading import Lock
 import uuid
 
 from sqlalchemy.orm import relationship  # type: ignore
 
-from src.recogniser.mer_recogniser import recognise_mer
-from src.recogniser.pattern_recogniser import MentionRegexRecogniser
-from src.classifier.gpt2 import GPT2
-from src.models import RecognitionResult, ModelType
+from src.models import Comment, RecognitionResult, ModelType, Status
+from src.exceptions import PreprocessingError
+from src.metrics import timed
 from settings import BASELINE_SOURCE
 
-BASELINE_RECOGNISER = MentionRegexRecogniser.from_file(BASELINE_SOURCE)
-GPT2_CLASSIFIER = GPT2()
+# models are loaded on first use or by 'preload_models', not on import
+MODELS: dict[ModelType, Any] = {}
+MODELS_LOCK = Lock()
+
+
+def load_model(type_: ModelType) -> Any:
+    """Load a model and return it.
+
+    :param type_: model type
+
+    Note: The model libraries are imported here, so processes, that don't need a
+          model, don't pay for importing spacy, transformers or torch.
+    """
+    if type_ == ModelType.SPACY_MODEL_A:
+        from src.recogniser.mer_recogniser import load_spacy_model, recognise_mer
+
+        return partial(recognise_mer, model=load_spacy_model())
+    elif type_ == ModelType.PATTERN_BASELINE:
+        from src.recogniser.pattern_recogniser import MentionRegexRecogniser
+
+        return MentionRegexRecogniser.from_file(BASELINE_SOURCE)
+    elif type_ == ModelType.GPT2:
+        from src.classifier.gpt2 import GPT2
+
+        return GPT2()
+    else:
+        raise NotImplementedError(f"Model type '{type_.value}' is not implemented yet.")
+
+
+def get_model(type_: ModelType) -> Any:
+    """Return a model, load it on first use.
+
+    :param type_: model type
+    """
+    model = MODELS.get(type_)
+    if model is None:
+        with MODELS_LOCK:
+            if type_ not in MODELS:
+                MODELS[type_] = load_model(type_)
+
+            model = MODELS[type_]
+
+    return model
+
+
+def preload_models(types: Iterable[ModelType]) -> None:
+    """Load models ahead of their first use.
+
+    :param types: model types to load
+    """
+    for type_ in types:
+        get_model(type_)
+
+
+def reload_models() -> list[ModelType]:
+    """Load the models in use again from disk and return their types.
+
+    Note: The running models are replaced, after all of them are loaded.
+    """
+    types = list(MODELS)
+    models = {type_: load_model(type_) for type_ in types}
+    with MODELS_LOCK:
+        MODELS.update(models)
+
+    return types
+
+
+def warm_up_model(type_: ModelType, texts: list[str], batch_size: int = 32) -> None:
+    """Run texts through a model, so that later requests don't pay for first calls.
+
+    :param type_: model type
+    :param texts: sample texts
+    :param batch_size: number of texts per forward pass
+
+    Note: The calls aren't counted as inference in the metrics.
+    """
+    for text in texts:
+        try:
+            _find_mention(type_, text, "warmup")
+        except (PreprocessingError, ValueError):
+            continue
+
+    if type_ == ModelType.GPT2:
+        get_model(type_).classify_batch(texts, batch_size=batch_size)
 
 
 def find_mention(
@@ -21,12 +105,28 @@ def find_mention(
     :param text: text, that might hold mentions
     :param comment_id: id of comment, that is related to text
     """
+    with timed("inference", model_type=type_.value):
+        results = _find_mention(type_, text, comment_id)
+
+    return [
+        RecognitionResult(
+            id=str(uuid.uuid4()),
+            comment_id=comment_id,
+            extracted_from=type_.value,
+            **result,
+        )
+        for result in results
+    ]
+
+
+def _find_mention(type_: ModelType, text: str, comment_id: str) -> list[dict]:
+    """Return the raw results of a model, see 'find_mention'."""
     if type_ == ModelType.SPACY_MODEL_A:
-        results = recognise_mer(text, comment_id)
+        results = get_model(type_)(text, comment_id)
     elif type_ == ModelType.PATTERN_BASELINE:
-        results = BASELINE_RECOGNISER(text, comment_id)
+        results = get_model(type_)(text, comment_id)
     elif type_ == ModelType.GPT2:
-        got_mentions = GPT2_CLASSIFIER(text)
+        got_mentions = get_model(type_)(text)
         results = []
         if got_mentions:
             # Classification doesn't point to text position but classifies the whole text.
@@ -35,15 +135,58 @@ def find_mention(
     else:
         raise NotImplementedError(f"Model type '{type_.value}' is not implemented yet.")
 
-    return [
-        RecognitionResult(
-            id=str(uuid.uuid4()),
-            comment_id=comment_id,
-            extracted_from=type_.value,
-            **result,
-        )
-        for result in results
-    ]
+    return results
+
+
+def find_mentions_batch(
+    type_: ModelType, texts: list[str], comment_ids: list[str], batch_size: int = 32
+) -> list[Union[list[RecognitionResult], Exception]]:
+    """Recognise mentions in several texts, see 'find_mention'.
+
+    :param type_: model type
+    :param texts: texts, that might hold mentions
+    :param comment_ids: ids of comments, that are related to the texts
+    :param batch_size: number of texts per forward pass
+
+    Note: Returns the exception instead of the results for texts, that failed. If a
+          batched forward pass fails, its texts are retried one by one to find them.
+    """
+    if type_ == ModelType.GPT2:
+        try:
+            with timed("inference", model_type=type_.value, items=len(texts)):
+                got_mentions = get_model(type_).classify_batch(
+                    texts, batch_size=batch_size
+                )
+        except (PreprocessingError, ValueError) as exc:
+            print(f"Retrying batch one by one because of: {exc}")
+        else:
+            return [
+                [
+                    RecognitionResult(
+                        id=str(uuid.uuid4()),
+                        comment_id=comment_id,
+                        extracted_from=type_.value,
+                        start=-1,
+                        offset=0,
+                        body=text,
+                        label="MENTION",
+                    )
+                ]
+                if got_mention
+                else []
+                for text, comment_id, got_mention in zip(
+                    texts, comment_ids, got_mentions
+                )
+            ]
+
+    results: list[Union[list[RecognitionResult], Exception]] = []
+    for text, comment_id in zip(texts, comment_ids):
+        try:
+            results.append(find_mention(type_, text, comment_id))
+        except (PreprocessingError, ValueError) as exc:
+            results.append(exc)
+
+    return results
 
 
 def includes_mentions(type_: ModelType, text: str, comment_id: str) -> bool:
@@ -54,3 +197,42 @@ def includes_mentions(type_: ModelType, text: str, comment_id: str) -> bool:
     :param comment_id: id of comment, that is related to text
     """
     return True if find_mention(type_, text, comment_id) else False
+
+
+def add_mentions(type_: ModelType, comments: list[Comment]) -> None:
+    """Recognise mentions in comments and set their status accordingly.
+
+    :param type_: model type
+    :param comments: comments to process, changed in place
+    """
+    for comment in comments:
+        try:
+            results = find_mention(type_, comment.body, comment.id)
+        except PreprocessingError as exc:
+            set_mentions(type_, comment, exc)
+        else:
+            set_mentions(type_, comment, results)
+
+
+def set_mentions(
+    type_: ModelType,
+    comment: Comment,
+    results: Union[list[RecognitionResult], Exception],
+) -> None:
+    """Set the mentions of a comment and its status accordingly.
+
+    :param type_: model type
+    :param comment: processed comment, changed in place
+    :param results: mentions found in the comment or the exception, that prevented it,
+                    see 'find_mentions_batch'
+    """
+    comment.model_type = type_.value
+    if isinstance(results, Exception):
+        print(f"Caught exception for comment with id: '{comment.id}': {results}")
+        comment.status = Status.ERROR
+        comment.note = str(results)
+    elif results:
+        comment.status = Status.TO_BE_PUBLISHED
+        comment.mentions = results
+    else:
+        comment.status = Status.NO_MENTIONS
@@ -0,0 +1,155 @@
+from typing import Any, Callable, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import asyncio
+import threading
+import time
+
+from settings import (
+    INFERENCE_QUEUE_SIZE,
+    INFERENCE_RETRY_AFTER_SECONDS,
+    INFERENCE_TIMEOUT_SECONDS,
+    INFERENCE_WORKERS,
+)
+
+
+class Overloaded(Exception):
+    """Raised, if the admission queue of the executor is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference is overloaded, retry after {retry_after} seconds.")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Raised, if inference didn't finish before the deadline of its request."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(
+            f"Inference didn't finish in time, retry after {retry_after} seconds."
+        )
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """Run model inference on a fixed number of threads with a bounded queue.
+
+    :param max_workers: number of concurrent forward passes
+    :param max_queue: number of calls, that may wait for a worker
+    :param retry_after: seconds a rejected client is asked to wait
+
+    Note: Calls beyond workers and queue are rejected right away instead of piling up,
+          and queued calls are dropped, when their deadline passed before they started.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = INFERENCE_WORKERS,
+        max_queue: int = INFERENCE_QUEUE_SIZE,
+        retry_after: int = INFERENCE_RETRY_AFTER_SECONDS,
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="inference"
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._expired = 0
+
+    def submit(
+        self, deadline: Optional[float], fn: Callable, *args: Any, **kwargs: Any
+    ) -> Future:
+        """Admit a call and return its future.
+
+        :param deadline: 'time.monotonic' after which the call isn't started anymore
+        :param fn: function to call
+        """
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise Overloaded(self.retry_after)
+
+            self._in_flight += 1
+            self._admitted += 1
+
+        def run() -> Any:
+            if deadline is not None and time.monotonic() > deadline:
+                with self._lock:
+                    self._expired += 1
+                raise DeadlineExceeded(self.retry_after)
+
+            return fn(*args, **kwargs)
+
+        future = self._pool.submit(run)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def run_sync(
+        self,
+        fn: Callable,
+        *args: Any,
+        timeout: float = INFERENCE_TIMEOUT_SECONDS,
+        **kwargs: Any,
+    ) -> Any:
+        """Call a function on the executor and wait for the result.
+
+        :param fn: function to call
+        :param timeout: seconds until the call is given up
+        """
+        future = self.submit(time.monotonic() + timeout, fn, *args, **kwargs)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise DeadlineExceeded(self.retry_after)
+
+    async def run(
+        self,
+        fn: Callable,
+        *args: Any,
+        timeout: float = INFERENCE_TIMEOUT_SECONDS,
+        **kwargs: Any,
+    ) -> Any:
+        """Call a function on the executor without blocking the event loop.
+
+        :param fn: function to call
+        :param timeout: seconds until the call is given up
+        """
+        future = self.submit(time.monotonic() + timeout, fn, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise DeadlineExceeded(self.retry_after)
+
+    def is_full(self) -> bool:
+        """True, if a new call would be rejected right now."""
+        with self._lock:
+            return self._in_flight >= self.max_workers + self.max_queue
+
+    def get_status(self) -> dict[str, int]:
+        """Return the load and counters of the executor."""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "queue_size": self.max_queue,
+                "in_flight": self._in_flight,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "expired": self._expired,
+            }
+
+    def shutdown(self) -> None:
+        """Drop queued calls and wait for running ones."""
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+INFERENCE_EXECUTOR = InferenceExecutor()
@@ -1,16 +1,18 @@
-from settings import MDR_COMMENT_ENDPOINT, MDR_COMMENT_ENDPOINT_TOKEN
+import settings
 from datetime import datetime
-from typing import Union
-from pydantic import BaseModel
+from typing import Iterator, Union
+from pydantic import BaseModel, Field
 
+from src.metrics import timed
+from src.models import MediaHouse
 from src.tools import request
 
 
 class MDRCommentGetter(BaseModel):
     """Get comment from mdr comment endpoint."""
 
-    url: str = MDR_COMMENT_ENDPOINT
-    token: str = MDR_COMMENT_ENDPOINT_TOKEN
+    url: str = Field(default_factory=lambda: settings.MDR_COMMENT_ENDPOINT)
+    token: str = Field(default_factory=lambda: settings.MDR_COMMENT_ENDPOINT_TOKEN)
 
     def get_comments(
         self,
@@ -30,20 +32,44 @@ class MDRCommentGetter(BaseModel):
         :param max_pages: max number of pages to iterate through
         """
         items = []
+        for page in self.iter_pages(from_, to, size, start_page, max_pages, verbose):
+            items.extend(page)
+
+        return items
+
+    def iter_pages(
+        self,
+        from_: datetime,
+        to: datetime,
+        size: int = 500,
+        start_page: int = 1,
+        max_pages: int = 50,
+        verbose: bool = True,
+    ) -> Iterator[list[dict[str, Union[str, int]]]]:
+        """Yield the comments of a timeframe page by page, see 'get_comments'.
+
+        :param from_: begin of timeframe
+        :param to: end of timeframe
+        :param size: max number of return comments
+        :param start_page: start page for result iteration
+        :param max_pages: max number of pages to iterate through
+        """
         query = self._get_filter(from_, to, size, start_page)
-        headers = {"Authorization": f"Bearer {MDR_COMMENT_ENDPOINT_TOKEN}"}
-        response = request(self.url, body=query, headers=headers)
+        headers = {"Authorization": f"Bearer {self.token}"}
+        with timed("fetch", media_house=MediaHouse.MDR.value):
+            response = request(self.url, body=query, headers=headers)
+
         response_items = response["items"]
         while response_items and query["page"] < max_pages:
             if verbose:
                 print(f"Got {len(response_items)} from page {query['page']}")
 
-            items.extend(response["items"])
+            yield response["items"]
             query["page"] += 1
-            response = request(self.url, body=query, headers=headers)
-            response_items = response["items"]
+            with timed("fetch", media_house=MediaHouse.MDR.value):
+                response = request(self.url, body=query, headers=headers)
 
-        return items
+            response_items = response["items"]
 
     def _get_filter(
         self, from_: datetime, to: datetime, size: int = 20, page: int = 1
@@ -2,9 +2,11 @@ from typing import Any
 from datetime import datetime
 from dateutil.parser import parse
 
+from src.metrics import timed
 from src.models import MediaHouse, Status
 
 
+@timed("preprocess", media_house=MediaHouse.MDR.value)
 def preprocess_mdr_comment(raw: dict[str, Any]) -> dict[str, Any]:
     """Preprocess comment.
 
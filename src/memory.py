@@ -0,0 +1,105 @@
+from typing import Iterator, Optional, Union
+import os
+
+from prometheus_client import REGISTRY  # type: ignore
+from prometheus_client.core import GaugeMetricFamily  # type: ignore
+
+# set by 'src.serve' for its workers
+MASTER_PID_VARIABLE = "SERVE_MASTER_PID"
+SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared",
+    "Shared_Dirty": "shared",
+    "Private_Clean": "private",
+    "Private_Dirty": "private",
+}
+
+
+def get_memory(pid: int) -> dict[str, int]:
+    """Return resident memory of a process in bytes, split by shared and private pages.
+
+    :param pid: process id
+
+    Note: 'pss' splits shared pages between the processes, that map them, so the sum
+          over all workers is their actual memory usage. Needs linux 4.14 or newer.
+    """
+    memory = {"rss": 0, "pss": 0, "shared": 0, "private": 0}
+    with open(f"/proc/{pid}/smaps_rollup") as file:
+        for line in file:
+            field, _, value = line.partition(":")
+            if field in SMAPS_FIELDS:
+                # values are in kB
+                memory[SMAPS_FIELDS[field]] += int(value.split()[0]) * 1024
+
+    return memory
+
+
+def get_master_pid() -> Optional[int]:
+    """Return the pid of the 'src.serve' master, if this process is one of its workers."""
+    pid = os.environ.get(MASTER_PID_VARIABLE)
+    return int(pid) if pid else None
+
+
+def get_worker_pids(master_pid: int) -> list[int]:
+    """Return the pids of the child processes of a process.
+
+    :param master_pid: pid of the parent
+    """
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+
+        try:
+            with open(f"/proc/{entry}/stat") as file:
+                # the name in parentheses might contain spaces, the parent id follows it
+                ppid = int(file.read().rpartition(")")[2].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+
+        if ppid == master_pid:
+            pids.append(int(entry))
+
+    return sorted(pids)
+
+
+def get_workers_memory() -> dict[str, dict[str, Union[str, int]]]:
+    """Return the memory of this process or, when served by 'src.serve', of the master
+    and all its workers by role and pid.
+    """
+    master_pid = get_master_pid()
+    if master_pid is None:
+        processes = [("worker", os.getpid())]
+    else:
+        processes = [("master", master_pid)]
+        processes += [("worker", pid) for pid in get_worker_pids(master_pid)]
+
+    memory: dict[str, dict[str, Union[str, int]]] = {}
+    for role, pid in processes:
+        try:
+            memory[str(pid)] = {"role": role, **get_memory(pid)}
+        except OSError:
+            # exited meanwhile or not on linux
+            continue
+
+    return memory
+
+
+class MemoryCollector:
+    """Report shared and private memory of the master and the workers."""
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        memory = GaugeMetricFamily(
+            "wtwm_process_memory_bytes",
+            "Resident memory of a serving process.",
+            labels=["role", "pid", "kind"],
+        )
+        for pid, entry in get_workers_memory().items():
+            for kind in ("rss", "pss", "shared", "private"):
+                memory.add_metric([entry["role"], pid, kind], entry[kind])
+
+        yield memory
+
+
+REGISTRY.register(MemoryCollector())
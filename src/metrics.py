@@ -0,0 +1,122 @@
+from typing import Any, Callable, Iterator, Optional
+from contextlib import ContextDecorator
+import time
+
+from prometheus_client import (  # type: ignore
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily  # type: ignore
+
+STAGE_LABELS = ["stage", "model_type", "media_house"]
+STAGE_SECONDS = Histogram(
+    "wtwm_stage_duration_seconds",
+    "Duration of a pipeline stage call.",
+    STAGE_LABELS,
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+STAGE_ITEMS = Counter(
+    "wtwm_stage_items_total", "Items handled by a pipeline stage.", STAGE_LABELS
+)
+STAGE_ERRORS = Counter(
+    "wtwm_stage_errors_total", "Failed calls of a pipeline stage.", STAGE_LABELS
+)
+QUEUE_DEPTH = Gauge("wtwm_queue_depth", "Items waiting in a queue.", ["queue"])
+WARMUP_SECONDS = Gauge(
+    "wtwm_warmup_duration_seconds", "Duration of a warm-up step.", ["step"]
+)
+READY = Gauge("wtwm_ready", "1, if this process accepts traffic, 0 otherwise.")
+
+
+class timed(ContextDecorator):
+    """Measure a stage as context manager or decorator.
+
+    :param stage: name of the stage, e.g. 'fetch' or 'inference'
+    :param model_type: model type, if the stage depends on it
+    :param media_house: media house, if the stage depends on it
+    :param items: number of items handled by the call, can be set within the block
+
+    Note: Exceptions are counted as errors of the stage and raised again.
+    """
+
+    def __init__(
+        self, stage: str, model_type: str = "", media_house: str = "", items: int = 1
+    ):
+        self.labels = (stage, model_type, media_house)
+        self.items = items
+        self._start = 0.0
+
+    def _recreate_cm(self) -> "timed":
+        # a fresh instance per decorated call keeps concurrent calls apart
+        return timed(*self.labels, items=self.items)
+
+    def __enter__(self) -> "timed":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, *args: Any) -> None:
+        STAGE_SECONDS.labels(*self.labels).observe(time.perf_counter() - self._start)
+        if exc_type is not None:
+            STAGE_ERRORS.labels(*self.labels).inc()
+        elif self.items:
+            STAGE_ITEMS.labels(*self.labels).inc(self.items)
+
+
+def register_queue(name: str, get_depth: Callable[[], float]) -> None:
+    """Report the depth of a queue, read when the metrics are scraped.
+
+    :param name: name of the queue
+    :param get_depth: returns the current number of waiting items
+
+    Note: If 'get_depth' fails, e.g. because the database is down, the depth is
+          reported as NaN instead of failing the whole scrape.
+    """
+
+    def get_depth_or_nan() -> float:
+        try:
+            return get_depth()
+        except Exception as exc:
+            print(f"Could not get the depth of queue '{name}' because of: {exc}")
+            return float("nan")
+
+    QUEUE_DEPTH.labels(name).set_function(get_depth_or_nan)
+
+
+class CacheCollector:
+    """Report hit and miss counters of caches, that count them on their own."""
+
+    def __init__(self) -> None:
+        self.caches: dict[str, Callable[[], dict[str, int]]] = {}
+
+    def collect(self) -> Iterator[CounterMetricFamily]:
+        lookups = CounterMetricFamily(
+            "wtwm_cache_lookups", "Lookups of a cache.", labels=["cache", "result"]
+        )
+        for name, get_stats in self.caches.items():
+            stats = get_stats()
+            lookups.add_metric([name, "hit"], stats["hits"])
+            lookups.add_metric([name, "miss"], stats["misses"])
+
+        yield lookups
+
+
+CACHE_COLLECTOR = CacheCollector()
+REGISTRY.register(CACHE_COLLECTOR)
+
+
+def register_cache(name: str, get_stats: Callable[[], dict[str, int]]) -> None:
+    """Report the hit rate of a cache.
+
+    :param name: name of the cache
+    :param get_stats: returns a dict with the keys 'hits' and 'misses'
+    """
+    CACHE_COLLECTOR.caches[name] = get_stats
+
+
+def render_metrics(registry: Optional[Any] = None) -> tuple[bytes, str]:
+    """Return all metrics in the prometheus text format and its content type."""
+    return generate_latest(registry or REGISTRY), CONTENT_TYPE_LATEST
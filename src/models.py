@@ -5,14 +5,20 @@ from enum import Enum
 import uuid
 
 from sqlalchemy.ext.declarative import declarative_base  # type: ignore
-from sqlalchemy.orm import relationship  # type: ignore
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, Text
+from sqlalchemy.orm import column_property, relationship  # type: ignore
+from sqlalchemy.orm.attributes import get_history  # type: ignore
+from sqlalchemy import event  # type: ignore
+from sqlalchemy import Boolean, Column, Date, DateTime, ForeignKey, Integer, Text
 from sqlalchemy import Enum as SQLEnum
 
-from settings import MDR_TARGET, BR_TARGET, TEST_TARGET
+import settings
 
 
 BASE = declarative_base()
+LIVE_RESULTS = (
+    "and_(Comment.id == foreign(RecognitionResult.comment_id), "
+    "RecognitionResult.model_version.is_(None))"
+)
 
 
 class Status(Enum):
@@ -66,11 +72,11 @@ class MediaHouse(Enum):
         Note: The target points to channel webhook to distribute to. It serves as a address to publish to.
         """
         if self == MediaHouse.TEST:
-            return TEST_TARGET
+            return settings.TEST_TARGET
         elif self == MediaHouse.MDR:
-            return MDR_TARGET
+            return settings.MDR_TARGET
         elif self == MediaHouse.BR:
-            return BR_TARGET
+            return settings.BR_TARGET
         elif self == MediaHouse.BR_YOUR_ARGUMENT:
             return BR_YOUR_ARGUMENT_TARGET
         else:
@@ -93,9 +99,14 @@ class RecognitionResult(BASE):
     offset = Column(Integer, unique=False)
     label = Column(Text, unique=False)
     extracted_from = Column(Text, unique=False)
+    # copy of the comment's creation time, used as partition key
+    comment_created_at = Column(DateTime, unique=False)
+    # set for results of replays, that are kept apart from the live results
+    model_version = Column(Text, unique=False)
     comment = relationship(
         "Comment",
         back_populates="mentions",
+        primaryjoin=LIVE_RESULTS,
         passive_deletes=True,  # if True entry is delete if parent is deleted
     )
 
@@ -131,7 +142,8 @@ class ReportTimestamp(BaseModel):
 class Comment(BASE):
     __tablename__ = "comments"
     id = Column(Text, primary_key=True)
-    status = Column(SQLEnum(Status), unique=False)
+    # the previous value is loaded, even if expired, to keep 'status_counts' right
+    status = column_property(Column(SQLEnum(Status), unique=False), active_history=True)
     body = Column(Text, unique=False)
     asset_id = Column(Text, unique=False)  # article id the comment belongs to
     asset_url = Column(Text, unique=False)  # article url the comment belongs to
@@ -143,9 +155,14 @@ class Comment(BASE):
         DateTime, unique=False
     )  # meant as database update of this comment
     media_house = Column(SQLEnum(MediaHouse), unique=False)
+    claimed_by = Column(Text, unique=False)  # worker currently processing the comment
+    claimed_until = Column(DateTime, unique=False)  # claim expires afterwards (utc)
+    # model, that classified the comment
+    model_type = column_property(Column(Text, unique=False), active_history=True)
     mentions = relationship(
         "RecognitionResult",
         back_populates="comment",
+        primaryjoin=LIVE_RESULTS,
         cascade="all, delete",  # if this is delete, child object is also deleted
     )
 
@@ -185,3 +202,73 @@ class Comment(BASE):
             mentions=mentions,
             media_house=self.media_house.value,
         )
+
+
+class StatusCount(BASE):
+    """Number of comments per creation day, media house, status and model type."""
+
+    __tablename__ = "status_counts"
+    day = Column(Date, primary_key=True)
+    media_house = Column(SQLEnum(MediaHouse), primary_key=True)
+    status = Column(SQLEnum(Status), primary_key=True)
+    model_type = Column(Text, primary_key=True)  # empty, if not classified yet
+    count = Column(Integer, unique=False, nullable=False, default=0)
+
+    def as_dict(self) -> dict[str, Union[int, str]]:
+        return dict(
+            day=self.day.isoformat(),
+            media_house=self.media_house.value,
+            status=self.status.value,
+            model_type=self.model_type,
+            count=self.count,
+        )
+
+
+class OutboxState(Enum):
+    PENDING = "PENDING"
+    DELIVERED = "DELIVERED"
+    FAILED = "FAILED"
+    EXPIRED = "EXPIRED"
+
+
+class OutboxEntry(BASE):
+    """Comment waiting to be published to the teams channel of its media house."""
+
+    __tablename__ = "outbox"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    comment_id = Column(Text, unique=True, index=True, nullable=False)
+    media_house = Column(SQLEnum(MediaHouse), unique=False)
+    comment_created_at = Column(DateTime, unique=False)  # used for the expiry (utc)
+    state = Column(SQLEnum(OutboxState), unique=False, index=True)
+    attempts = Column(Integer, unique=False, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, unique=False)  # utc
+    claimed_until = Column(DateTime, unique=False)  # utc
+    enqueued_at = Column(DateTime, unique=False)  # utc
+    delivered_at = Column(DateTime, unique=False)  # utc
+    last_error = Column(Text, unique=False)
+
+
+class SyncState(BASE):
+    """Watermark of an export, e.g. to BigQuery."""
+
+    __tablename__ = "sync_state"
+    name = Column(Text, primary_key=True)
+    synced_until = Column(DateTime, unique=False)
+
+
+@event.listens_for(Comment, "before_update")
+def _set_last_updated_at(mapper, connection, target: Comment) -> None:
+    """Mark comments as updated, when their status changes.
+
+    Note: Bulk updates with 'Query.update' bypass this hook, so they must set
+          'last_updated_at' themselves, if they change exported columns.
+    """
+    if get_history(target, "status").has_changes():
+        target.last_updated_at = datetime.now()
+
+
+@event.listens_for(RecognitionResult, "before_insert")
+def _set_comment_created_at(mapper, connection, target: RecognitionResult) -> None:
+    """Copy the creation time of the related comment into the mention."""
+    if target.comment_created_at is None and target.comment is not None:
+        target.comment_created_at = target.comment.created_at
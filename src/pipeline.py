@@ -0,0 +1,189 @@
+from typing import Any, Callable, Iterable
+import time
+
+from sqlalchemy.engine import Engine  # type: ignore
+from sqlalchemy.orm import Session  # type: ignore
+
+from src.background import BackgroundWorker
+from src.finder import ModelType, find_mentions_batch, set_mentions
+from src.inference import (
+    INFERENCE_EXECUTOR,
+    DeadlineExceeded,
+    InferenceExecutor,
+    Overloaded,
+)
+from src.models import Comment, Status
+from src.storage.postgres import (
+    SESSION,
+    TableWriter,
+    get_unprocessed_chunks,
+    release_claims,
+)
+from settings import (
+    INFERENCE_TIMEOUT_SECONDS,
+    PIPELINE_SWEEP_SECONDS,
+    PROCESSING_CHUNK_SIZE,
+    PROCESSING_MAX_ROWS,
+    PROCESSING_MAX_SECONDS,
+)
+
+
+def to_comments(
+    raw_comments: Iterable[dict[str, Any]],
+    preprocess: Callable[[dict[str, Any]], dict[str, Any]],
+) -> list[Comment]:
+    """Preprocess raw comments of a source, skipping broken ones.
+
+    :param raw_comments: comments as returned by the source
+    :param preprocess: preprocessing of the source, e.g. 'preprocess_mdr_comment'
+    """
+    comments = []
+    for raw_comment in raw_comments:
+        try:
+            comment = Comment(**preprocess(raw_comment))
+        except (IndexError, AttributeError, KeyError, ValueError) as exc:
+            print(f"Skipping comment because of: {exc}")
+        else:
+            comments.append(comment)
+
+    return comments
+
+
+def classify_chunk(
+    writer: TableWriter,
+    chunk: list[Comment],
+    type_: ModelType = ModelType.GPT2,
+    executor: InferenceExecutor = INFERENCE_EXECUTOR,
+    timeout: float = INFERENCE_TIMEOUT_SECONDS,
+) -> int:
+    """Add extraction results to claimed comments, commit them and return the number
+    of comments with mentions.
+
+    :param writer: database interface
+    :param chunk: claimed comments
+    :param type_: model type
+    :param executor: runs the forward pass, shared with the requests
+    :param timeout: seconds until the forward pass is given up
+
+    Note: Only texts and ids are passed to the executor, the comments are changed in
+          the calling thread. If the executor is overloaded or the deadline passes,
+          the claims are released and 'Overloaded' or 'DeadlineExceeded' is raised.
+    """
+    if not chunk:
+        return 0
+
+    try:
+        results = executor.run_sync(
+            find_mentions_batch,
+            type_,
+            [comment.body for comment in chunk],
+            [comment.id for comment in chunk],
+            timeout=timeout,
+        )
+    except (Overloaded, DeadlineExceeded):
+        release_claims(chunk)
+        for comment in chunk:
+            writer.update(comment)
+
+        writer.commit()
+        raise
+
+    release_claims(chunk)
+    mentions = 0
+    for comment, result in zip(chunk, results):
+        set_mentions(type_, comment, result)
+        mentions += comment.status == Status.TO_BE_PUBLISHED
+        writer.update(comment)
+
+    writer.commit()
+    return mentions
+
+
+def process_backlog(
+    engine: Engine,
+    session: Session,
+    chunk_size: int,
+    max_rows: int,
+    max_seconds: float,
+    type_: ModelType = ModelType.GPT2,
+    executor: InferenceExecutor = INFERENCE_EXECUTOR,
+) -> int:
+    """Add extraction results to unprocessed comments and return their number.
+
+    :param engine: db communication engine
+    :param session: running postgress connection
+    :param chunk_size: max number of comments per chunk
+    :param max_rows: max number of comments to process
+    :param max_seconds: time budget, checked after each chunk
+    :param type_: model type
+    :param executor: runs the forward passes, shared with the requests
+
+    Note: Comments are classified and committed chunk by chunk until the backlog is
+          empty or the row or time budget is used up. Each chunk takes a slot of the
+          executor on its own, so requests are served in between. The backlog stops
+          early, if the executor is overloaded or a chunk misses the deadline.
+    """
+    start = time.monotonic()
+    processed = 0
+    with TableWriter(engine, session=session, purge=False) as writer:
+        for chunk in get_unprocessed_chunks(session, chunk_size, max_rows=max_rows):
+            remaining = max_seconds - (time.monotonic() - start)
+            try:
+                classify_chunk(
+                    writer,
+                    chunk,
+                    type_,
+                    executor,
+                    timeout=max(remaining, INFERENCE_TIMEOUT_SECONDS),
+                )
+            except (Overloaded, DeadlineExceeded) as exc:
+                print(f"Stopping because of: {exc}")
+                break
+
+            # drop committed comments from the session to keep memory bounded
+            session.expunge_all()
+            processed += len(chunk)
+            elapsed = time.monotonic() - start
+            print(f"Processed {processed} comments after {elapsed:.1f} seconds.")
+            if elapsed >= max_seconds:
+                print("Stopping because the time budget is used up.")
+                break
+
+    return processed
+
+
+class ClassifierWorker(BackgroundWorker):
+    """Classify new comments in a background thread.
+
+    :param engine: database engine to open sessions on
+    :param poll_seconds: seconds between sweeps for comments without notification
+    :param chunk_size: max number of comments per chunk
+    :param max_rows: max number of comments per round
+    :param max_seconds: time budget per round
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        poll_seconds: float = PIPELINE_SWEEP_SECONDS,
+        chunk_size: int = PROCESSING_CHUNK_SIZE,
+        max_rows: int = PROCESSING_MAX_ROWS,
+        max_seconds: float = PROCESSING_MAX_SECONDS,
+    ):
+        super().__init__("classifier-worker", poll_seconds)
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+
+    def drain(self) -> int:
+        """Classify the backlog within the budget and return the number of comments."""
+        session = SESSION(bind=self.engine)
+        processed = process_backlog(
+            self.engine, session, self.chunk_size, self.max_rows, self.max_seconds
+        )
+        if processed >= self.max_rows:
+            # more might be waiting, continue without waiting for the next sweep
+            self.wake()
+
+        return processed
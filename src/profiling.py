@@ -0,0 +1,231 @@
+from typing import Optional
+from collections import Counter
+from datetime import datetime
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+# leaf frames of threads, that wait for work instead of doing it
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("base_events.py", "_run_once"),
+}
+REPORT_ID = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$")
+
+Frame = tuple[str, str, int]
+
+
+class StackSampler:
+    """Sample the stacks of all busy threads in a background thread.
+
+    :param interval: seconds between samples
+
+    Note: Sampling reaches the threadpool, that runs the sync endpoints, which a
+          deterministic profiler in the request's own thread would miss. Concurrent
+          requests show up in the samples as well.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "StackSampler":
+        """Start sampling."""
+        self.started_at = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampling thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def snapshot(self, reset: bool = False) -> tuple[Counter, int, float]:
+        """Return the stacks, the number of samples and the seconds sampled.
+
+        :param reset: start a new aggregation afterwards, if true
+        """
+        with self._lock:
+            result = (
+                self.stacks.copy(),
+                self.samples,
+                time.monotonic() - self.started_at,
+            )
+            if reset:
+                self.stacks.clear()
+                self.samples = 0
+                self.started_at = time.monotonic()
+
+        return result
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            stacks = [
+                stack
+                for thread_id, frame in frames.items()
+                if thread_id != own_id
+                for stack in [_get_stack(frame)]
+                if not _is_idle(stack)
+            ]
+            with self._lock:
+                self.samples += 1
+                self.stacks.update(stacks)
+
+
+def _get_stack(frame) -> tuple[Frame, ...]:
+    """Return the stack of a frame, outermost call first."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_filename, code.co_name, code.co_firstlineno))
+        frame = frame.f_back
+
+    return tuple(reversed(stack))
+
+
+def _is_idle(stack: tuple[Frame, ...]) -> bool:
+    filename, name, _ = stack[-1]
+    return (os.path.basename(filename), name) in IDLE_FRAMES
+
+
+def _format_frame(frame: Frame) -> str:
+    filename, name, line = frame
+    return f"{name} ({filename}:{line})"
+
+
+def render_report(stacks: Counter, samples: int, seconds: float, top: int = 30) -> str:
+    """Render sampled stacks as top functions and call tree.
+
+    :param stacks: number of samples per stack
+    :param samples: number of sampling rounds
+    :param seconds: sampled time
+    :param top: number of functions to list
+    """
+    total = sum(stacks.values())
+    lines = [f"{samples} samples of busy threads in {seconds:.2f} seconds", ""]
+    if not total:
+        return "\n".join(lines + ["No busy threads were sampled."])
+
+    own: Counter = Counter()
+    cumulative: Counter = Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for frame in set(stack):
+            cumulative[frame] += count
+
+    for title, counter in [("Own time", own), ("Cumulative time", cumulative)]:
+        lines.append(f"{title}:")
+        for frame, count in counter.most_common(top):
+            lines.append(f"{100 * count / total:6.1f}%  {_format_frame(frame)}")
+
+        lines.append("")
+
+    lines.append("Call tree:")
+    tree: dict = {}
+    for stack, count in stacks.items():
+        node = tree
+        for frame in stack:
+            child = node.setdefault(frame, [0, {}])
+            child[0] += count
+            node = child[1]
+
+    _render_tree(tree, total, 0, lines)
+    return "\n".join(lines)
+
+
+def _render_tree(
+    tree: dict, total: int, depth: int, lines: list[str], min_share: float = 0.01
+) -> None:
+    for frame, (count, children) in sorted(tree.items(), key=lambda i: -i[1][0]):
+        if count / total < min_share:
+            continue
+
+        lines.append(
+            f"{100 * count / total:6.1f}%  {'  ' * depth}{_format_frame(frame)}"
+        )
+        _render_tree(children, total, depth + 1, lines, min_share)
+
+
+def render_folded(stacks: Counter) -> str:
+    """Render sampled stacks in the folded format used by flame graph tools.
+
+    :param stacks: number of samples per stack
+    """
+    return "\n".join(
+        ";".join(name for _, name, _ in stack) + f" {count}"
+        for stack, count in stacks.items()
+    )
+
+
+def new_report_id() -> str:
+    return f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+
+def write_report(folder: str, report_id: str, title: str, sampler: StackSampler) -> str:
+    """Write the report and folded stacks of a sampler and return the report path.
+
+    :param folder: folder to store the reports in
+    :param report_id: id of the report, see 'new_report_id'
+    :param title: first line of the report, e.g. the profiled request
+    :param sampler: stopped sampler
+    """
+    stacks, samples, seconds = sampler.snapshot()
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, report_id + ".txt")
+    with open(path, "w") as handle:
+        handle.write(title + "\n" + render_report(stacks, samples, seconds) + "\n")
+
+    with open(os.path.join(folder, report_id + ".folded"), "w") as handle:
+        handle.write(render_folded(stacks) + "\n")
+
+    return path
+
+
+def list_reports(folder: str) -> list[str]:
+    """Return the ids of stored reports, newest first.
+
+    :param folder: folder the reports are stored in
+    """
+    if not os.path.isdir(folder):
+        return []
+
+    return sorted(
+        (name[:-4] for name in os.listdir(folder) if name.endswith(".txt")),
+        reverse=True,
+    )
+
+
+def read_report(folder: str, report_id: str) -> Optional[str]:
+    """Return a stored report or None, if it doesn't exist.
+
+    :param folder: folder the reports are stored in
+    :param report_id: id of the report
+    """
+    if not REPORT_ID.match(report_id):
+        return None
+
+    path = os.path.join(folder, report_id + ".txt")
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as handle:
+        return handle.read()
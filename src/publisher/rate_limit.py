@@ -0,0 +1,39 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Allow a steady rate of calls with short bursts, shared between threads.
+
+    :param rate: tokens added per second
+    :param capacity: max number of tokens, i.e. the burst size
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def try_acquire(self) -> float:
+        """Take a token if there is one and return 0, else the seconds to wait."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> None:
+        """Block until a token is available."""
+        while (wait := self.try_acquire()) > 0:
+            time.sleep(wait)
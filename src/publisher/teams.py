@@ -1,23 +1,55 @@
-from typing import Any
-from requests.exceptions import HTTPError
+from typing import Any, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
 
+from src.metrics import timed
 from src.tools import request
+from src.publisher.rate_limit import TokenBucket
 
-from src.models import MediaHouse, Comment, Status
-from src.storage.postgres import TableWriter
+from src.models import MediaHouse, Comment
+from settings import TEAMS_HTTP_POOL_SIZE
+
+
+def get_http_session(pool_size: int = TEAMS_HTTP_POOL_SIZE) -> requests.Session:
+    """Return a http session, that keeps connections to the webhooks open.
+
+    :param pool_size: number of connections kept per host
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+HTTP_SESSION = get_http_session()
 
 
 class TeamsConnector:
-    def __init__(self, media_house: MediaHouse):
+    def __init__(
+        self,
+        media_house: MediaHouse,
+        session: Optional[requests.Session] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+    ):
         self.media_house = media_house
+        self.session = session
+        self.rate_limiter = rate_limiter
 
     def send(self, comments: list[Comment]) -> None:
         """Publish a list of comments to teams.
 
         :param comments: list of comments to publish
         """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
         request_body = _get_request_body(comments)
-        _ = request(self.media_house.get_target(), body=request_body)
+        with timed("publish", media_house=self.media_house.value, items=len(comments)):
+            _ = request(
+                self.media_house.get_target(), body=request_body, session=self.session
+            )
 
     __call__ = send
 
@@ -40,28 +72,24 @@ def _get_request_body(comments: list[Comment]) -> dict[str, list[dict[str, Any]]
     }
 
 
-def send_comments(
-    connector: TeamsConnector,
-    comments: list[Comment],
-    writer: TableWriter,
-    max_number_to_publish: int,
-) -> None:
-    """Send comments to teams.
+def send_batches(
+    connector: TeamsConnector, comments: list[Comment], batch_size: int
+) -> list[Comment]:
+    """Send comments in batches and return the delivered ones.
 
     :param connector: teams connection interface
     :param comments: comments to send
-    :param writer: database interface
-    :param max_number_to_publish: max number of comments to publish each session
+    :param batch_size: max number of comments per webhook call
     """
-    for comment_entry in comments[: max_number_to_publish + 1]:
-        # send one comment at once for now to ensure db update of status
+    delivered = []
+    for start in range(0, len(comments), batch_size):
+        batch = comments[start : start + batch_size]
         try:
-            connector.send([comment_entry])
-        except HTTPError as exc:
+            connector.send(batch)
+        except RequestException as exc:
             print(f"Error while sending to {connector.media_house.value} at {exc}")
-            print(f"Skipping comments")
+            print(f"Skipping {len(batch)} comments")
         else:
-            comment_entry.status = Status.WAIT_FOR_EVALUATION
-            # update status everytime to prevent status update fail in case of crash
-            # if necessary build pub/sub after prototype phase
-            writer.update(comment_entry)
+            delivered.extend(batch)
+
+    return delivered
@@ -0,0 +1,160 @@
+from typing import Optional
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from sqlalchemy.engine import Engine  # type: ignore
+from sqlalchemy.orm import Session  # type: ignore
+
+from src.background import BackgroundWorker
+from src.models import Comment, MediaHouse, OutboxEntry, OutboxState, Status
+from src.publisher.rate_limit import TokenBucket
+from src.publisher.teams import HTTP_SESSION, TeamsConnector, send_batches
+from src.storage.outbox import claim_outbox, expire_outbox
+from src.storage.postgres import SESSION
+from settings import (
+    CLAIM_LEASE_SECONDS,
+    OUTBOX_BACKOFF_SECONDS,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_MAX_BACKOFF_SECONDS,
+    OUTBOX_POLL_SECONDS,
+    PUBLISH_EXPIRY_MINUTES,
+    TEAMS_BATCH_SIZE,
+    TEAMS_RATE_BURST,
+    TEAMS_RATE_PER_SECOND,
+)
+
+
+def get_backoff(
+    attempts: int,
+    base_seconds: float = OUTBOX_BACKOFF_SECONDS,
+    max_seconds: float = OUTBOX_MAX_BACKOFF_SECONDS,
+) -> timedelta:
+    """Return the exponential delay before the next delivery attempt.
+
+    :param attempts: number of failed attempts so far
+    :param base_seconds: delay after the first failure
+    :param max_seconds: upper bound of the delay
+    """
+    return timedelta(seconds=min(base_seconds * 2 ** (attempts - 1), max_seconds))
+
+
+class OutboxWorker(BackgroundWorker):
+    """Publish the outbox to teams in a background thread.
+
+    :param engine: database engine to open sessions on
+    :param batch_size: max number of entries claimed per round
+    :param poll_seconds: seconds to sleep when the outbox is empty
+    :param max_attempts: failed deliveries after which an entry is given up
+    :param expiry_minutes: age of comments after which they are not published
+    :param http_session: http session to reuse connections from
+
+    Note: Each media house gets its own token bucket, so a backlog in one channel
+          neither floods its webhook nor holds up the others.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_seconds: float = OUTBOX_POLL_SECONDS,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        expiry_minutes: int = PUBLISH_EXPIRY_MINUTES,
+        http_session: Optional[requests.Session] = HTTP_SESSION,
+    ):
+        super().__init__("outbox-worker", poll_seconds)
+        self.engine = engine
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.expiry_minutes = expiry_minutes
+        self.connectors = {
+            media_house: TeamsConnector(
+                media_house,
+                http_session,
+                TokenBucket(TEAMS_RATE_PER_SECOND, TEAMS_RATE_BURST),
+            )
+            for media_house in MediaHouse
+        }
+
+    def drain(self) -> int:
+        """Publish due entries until the outbox is empty and return the delivered ones."""
+        delivered = 0
+        with SESSION(bind=self.engine) as session:
+            expire_outbox(session, self.expiry_minutes)
+            while not self._stop.is_set():
+                entries = claim_outbox(
+                    session,
+                    self.batch_size,
+                    CLAIM_LEASE_SECONDS,
+                    self.expiry_minutes,
+                )
+                if not entries:
+                    break
+
+                delivered += self._publish(session, entries)
+
+        return delivered
+
+    def _publish(self, session: Session, entries: list[OutboxEntry]) -> int:
+        query = session.query(Comment).filter(
+            Comment.id.in_([entry.comment_id for entry in entries])
+        )
+        created_at = [entry.comment_created_at for entry in entries]
+        if None not in created_at:
+            # skips older partitions of partitioned tables
+            query = query.filter(Comment.created_at >= min(created_at))
+
+        comments = {comment.id: comment for comment in query}
+        by_media_house: dict[MediaHouse, list[Comment]] = {}
+        for entry in entries:
+            if entry.comment_id in comments:
+                by_media_house.setdefault(entry.media_house, []).append(
+                    comments[entry.comment_id]
+                )
+
+        # no transaction is kept open, while the webhooks are called
+        for comment in comments.values():
+            session.expunge(comment)
+        session.commit()
+
+        with ThreadPoolExecutor(max_workers=max(len(by_media_house), 1)) as pool:
+            futures = [
+                pool.submit(
+                    send_batches,
+                    self.connectors[media_house],
+                    media_house_comments,
+                    TEAMS_BATCH_SIZE,
+                )
+                for media_house, media_house_comments in by_media_house.items()
+            ]
+            delivered = {
+                comment.id for future in futures for comment in future.result()
+            }
+
+        if delivered:
+            # the comments are read again, they may have changed in the meantime
+            for comment in query.filter(Comment.id.in_(delivered)):
+                if comment.status == Status.TO_BE_PUBLISHED:
+                    comment.status = Status.WAIT_FOR_EVALUATION
+
+        now = datetime.utcnow()
+        for entry in entries:
+            entry.claimed_until = None
+            if entry.comment_id in delivered:
+                entry.state = OutboxState.DELIVERED
+                entry.delivered_at = now
+                continue
+
+            entry.attempts += 1
+            if entry.comment_id not in comments:
+                entry.state = OutboxState.FAILED
+                entry.last_error = "Comment does not exist."
+            elif entry.attempts >= self.max_attempts:
+                entry.state = OutboxState.FAILED
+                entry.last_error = "Delivery failed too often."
+            else:
+                entry.next_attempt_at = now + get_backoff(entry.attempts)
+                entry.last_error = "Delivery failed."
+
+        session.commit()
+        return len(delivered)
@@ -1,15 +1,29 @@
 from typing import Optional, Union
+from functools import lru_cache
 from settings import BUGG_MODEL_V1_PATH
 
 import spacy
+from spacy.language import Language
 
 from src.tools import normalize_query_pattern
 
-SPACY_MODEL = spacy.load(BUGG_MODEL_V1_PATH)
+
+def load_spacy_model(path: str = BUGG_MODEL_V1_PATH) -> Language:
+    """Load the spacy model from disk.
+
+    :param path: path to the model folder
+    """
+    return spacy.load(path)
+
+
+@lru_cache(maxsize=None)
+def get_spacy_model() -> Language:
+    """Return the default spacy model, load it on first use."""
+    return load_spacy_model()
 
 
 def recognise_mer(
-    text: str, comment_id: str, model: Optional[SPACY_MODEL] = None
+    text: str, comment_id: str, model: Optional[Language] = None
 ) -> list[dict[str, Union[str, int]]]:
     """Recognise mentions in text.
 
@@ -17,7 +31,7 @@ def recognise_mer(
     :param comment_id: id of the object the query belongs to
     :param model: recognizer model
     """
-    model = model or SPACY_MODEL
+    model = model or get_spacy_model()
     text = normalize_query_pattern(text, comment_id)
     doc = model(text)
     return [
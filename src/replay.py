@@ -0,0 +1,383 @@
+"""Re-run past comments through a (new) model without touching their live status.
+
+Example:
+
+    python -m src.replay --from 2022-01-01 --to 2023-01-01 --model-version v2 --workers 4
+
+Results with mentions are stored as additional 'RecognitionResult' rows tagged with the
+model version. The run writes a checkpoint after each batch and resumes from it, when
+started again with the same arguments. Comments, that couldn't be classified or are not
+stored in postgres anymore, are listed in a '_failures.jsonl' file next to the
+checkpoint instead of stopping the run.
+"""
+from typing import Any, Iterator, Optional
+from argparse import ArgumentParser, Namespace
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date, datetime, time
+import json
+import os
+import uuid
+
+from src.models import Comment, ModelType, RecognitionResult
+from src.storage.parquet import iter_comment_dicts
+from src.storage.postgres import SESSION, TableWriter, get_engine
+from src.tools import dumps_line
+import settings
+from settings import BACKUP_PATH, GPT2_MODEL_PATH
+
+REPLAY_COLUMNS = ["id", "body", "created_at"]
+# classifier of a worker process, loaded once by the pool initializer
+WORKER_CLASSIFIER = None
+
+
+def _init_worker(model_path: str, threads: int) -> None:
+    """Load the classifier in a worker process.
+
+    :param model_path: path to the model source files
+    :param threads: number of torch threads per worker
+    """
+    global WORKER_CLASSIFIER
+    import torch  # type: ignore
+    from src.classifier.gpt2 import GPT2
+
+    torch.set_num_threads(threads)
+    WORKER_CLASSIFIER = GPT2(model_path)
+
+
+def _classify(texts: list[str], batch_size: int) -> list[Optional[bool]]:
+    """Classify texts in a worker process.
+
+    :param texts: texts to classify
+    :param batch_size: number of texts per forward pass
+
+    Note: If the batch fails, its texts are retried one by one like in
+          'find_mentions_batch' and texts, that fail again, get None.
+    """
+    try:
+        return WORKER_CLASSIFIER.classify_batch(  # type: ignore
+            texts, batch_size=batch_size
+        )
+    except Exception as exc:
+        print(f"Retrying batch one by one because of: {exc}")
+
+    results: list[Optional[bool]] = []
+    for text in texts:
+        try:
+            results.extend(WORKER_CLASSIFIER.classify_batch([text]))  # type: ignore
+        except Exception as exc:
+            print(f"Could not classify a text because of: {exc}")
+            results.append(None)
+
+    return results
+
+
+class Checkpoint:
+    def __init__(self, path: str, run: dict[str, Any]) -> None:
+        """Progress of a replay run, persisted as json file.
+
+        :param path: path of the checkpoint file
+        :param run: arguments identifying the run
+        """
+        self.path = path
+        self.run = run
+        self.position: Optional[list[Any]] = None
+        self.processed = 0
+        self.found = 0
+        self.failed = 0
+
+    @classmethod
+    def load(cls, path: str, run: dict[str, Any]) -> "Checkpoint":
+        """Load the checkpoint of a run or start a new one.
+
+        :param path: path of the checkpoint file
+        :param run: arguments identifying the run
+        """
+        checkpoint = cls(path, run)
+        if os.path.exists(path):
+            with open(path, "r") as handle:
+                stored = json.load(handle)
+
+            if stored["run"] != run:
+                raise ValueError(f"Checkpoint '{path}' belongs to another run.")
+
+            checkpoint.position = stored["position"]
+            checkpoint.processed = stored["processed"]
+            checkpoint.found = stored["found"]
+            checkpoint.failed = stored.get("failed", 0)
+
+        return checkpoint
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as handle:
+            json.dump(
+                dict(
+                    run=self.run,
+                    position=self.position,
+                    processed=self.processed,
+                    found=self.found,
+                    failed=self.failed,
+                ),
+                handle,
+            )
+
+        os.replace(tmp_path, self.path)
+
+    @property
+    def failures_path(self) -> str:
+        return os.path.splitext(self.path)[0] + "_failures.jsonl"
+
+    def add_failures(self, ids: list[str], reason: str) -> None:
+        """Count comments, that couldn't be replayed, and list them in a file.
+
+        :param ids: ids of the comments
+        :param reason: why they failed
+        """
+        if not ids:
+            return
+
+        self.failed += len(ids)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.failures_path, "ab") as handle:
+            for id_ in ids:
+                handle.write(dumps_line({"id": id_, "reason": reason}))
+
+
+def iter_postgres_batches(
+    engine: Any,
+    from_: datetime,
+    to: datetime,
+    batch_size: int,
+    position: Optional[list[Any]] = None,
+) -> Iterator[tuple[list[dict[str, Any]], list[Any]]]:
+    """Yield batches of comments created in a time range ordered by time and id.
+
+    :param engine: db communication engine
+    :param from_: begin of timeframe
+    :param to: end of timeframe
+    :param batch_size: max number of comments per batch
+    :param position: creation time and id of the last processed comment
+
+    Note: Uses keyset pagination, so each batch is a cheap range scan of the index
+          'ix_comments_created_at_id'.
+    """
+    session = SESSION(bind=engine)
+    try:
+        last = (datetime.fromisoformat(position[0]), position[1]) if position else None
+        while True:
+            query = session.query(Comment.id, Comment.body, Comment.created_at).filter(
+                Comment.created_at >= from_, Comment.created_at < to
+            )
+            if last is not None:
+                query = query.filter(
+                    (Comment.created_at > last[0])
+                    | ((Comment.created_at == last[0]) & (Comment.id > last[1]))
+                )
+
+            rows = (
+                query.order_by(Comment.created_at, Comment.id).limit(batch_size).all()
+            )
+            if not rows:
+                return
+
+            last = (rows[-1].created_at, rows[-1].id)
+            yield [row._asdict() for row in rows], [last[0].isoformat(), last[1]]
+    finally:
+        session.close()
+
+
+def iter_parquet_batches(
+    folder: str,
+    from_: datetime,
+    to: datetime,
+    batch_size: int,
+    position: Optional[list[Any]] = None,
+) -> Iterator[tuple[list[dict[str, Any]], list[Any]]]:
+    """Yield batches of comments created in a time range from a parquet backup.
+
+    :param folder: root folder of the parquet dataset
+    :param from_: begin of timeframe
+    :param to: end of timeframe
+    :param batch_size: max number of comments per batch
+    :param position: number of comments already processed
+
+    Note: The dataset is read in file order, which is stable as long as no files
+          are added to the days in question.
+    """
+    skip = position[0] if position else 0
+    read = 0
+    batch: list[dict[str, Any]] = []
+    records = iter_comment_dicts(
+        folder, columns=REPLAY_COLUMNS, from_=from_.date(), to=to.date()
+    )
+    for record in records:
+        if not from_ <= record["created_at"] < to:
+            continue
+
+        read += 1
+        if read <= skip:
+            continue
+
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch, [read]
+            batch = []
+
+    if batch:
+        yield batch, [read]
+
+
+def write_results(
+    engine: Any,
+    records: list[dict[str, Any]],
+    found: list[Optional[bool]],
+    model_version: str,
+) -> tuple[int, list[str]]:
+    """Store a result for each record with mentions, skipping stored ones, and return
+    the number of records with mentions and the ids of those without stored comment.
+
+    :param engine: db communication engine
+    :param records: comments with id, body and created_at
+    :param found: classification per record
+    :param model_version: tag of the model version
+
+    Note: Results reference their comment, so comments of a parquet backup, that were
+          archived or deleted meanwhile, are skipped and returned instead.
+    """
+    hits = [record for record, has_mentions in zip(records, found) if has_mentions]
+    if not hits:
+        return 0, []
+
+    ids = [record["id"] for record in hits]
+    session = SESSION(bind=engine)
+    existing = {id_ for id_, in session.query(Comment.id).filter(Comment.id.in_(ids))}
+    missing = [id_ for id_ in ids if id_ not in existing]
+    hits = [record for record in hits if record["id"] in existing]
+    stored = {
+        id_
+        for id_, in session.query(RecognitionResult.comment_id).filter(
+            RecognitionResult.comment_id.in_([record["id"] for record in hits]),
+            RecognitionResult.model_version == model_version,
+        )
+    }
+    with TableWriter(engine, session=session, purge=False) as writer:
+        writer.write_many(
+            [
+                RecognitionResult(
+                    id=str(uuid.uuid4()),
+                    comment_id=record["id"],
+                    comment_created_at=record["created_at"],
+                    extracted_from=ModelType.GPT2.value,
+                    model_version=model_version,
+                    start=-1,
+                    offset=0,
+                    body=record["body"],
+                    label="MENTION",
+                )
+                for record in hits
+                if record["id"] not in stored
+            ]
+        )
+
+    return len(hits), missing
+
+
+def replay(args: Namespace) -> Checkpoint:
+    """Classify all comments of a time range with multiple worker processes.
+
+    :param args: command line arguments, see 'get_parser'
+    """
+    from_ = datetime.combine(args.from_, time.min)
+    to = datetime.combine(args.to, time.min)
+    run = dict(
+        source=args.source,
+        from_=args.from_.isoformat(),
+        to=args.to.isoformat(),
+        model_version=args.model_version,
+    )
+    checkpoint_path = args.checkpoint or os.path.join(
+        BACKUP_PATH,
+        "replay",
+        f"{args.model_version}_{args.source}_{args.from_}_{args.to}.json",
+    )
+    checkpoint = Checkpoint.load(checkpoint_path, run)
+    engine = get_engine(settings.POSTGRES_URI)
+    if args.source == "postgres":
+        batches = iter_postgres_batches(
+            engine, from_, to, args.batch_size, checkpoint.position
+        )
+    else:
+        batches = iter_parquet_batches(
+            args.parquet_path, from_, to, args.batch_size, checkpoint.position
+        )
+
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    pending: deque[tuple[list[dict[str, Any]], list[Any], Future]] = deque()
+    with ProcessPoolExecutor(
+        args.workers,
+        initializer=_init_worker,
+        initargs=(args.model_path, threads),
+    ) as pool:
+
+        def complete_oldest() -> None:
+            # batches complete in order, so the checkpoint never skips a batch
+            records, position, future = pending.popleft()
+            found = future.result()
+            checkpoint.add_failures(
+                [record["id"] for record, hit in zip(records, found) if hit is None],
+                "classification failed",
+            )
+            hits, missing = write_results(engine, records, found, args.model_version)
+            checkpoint.add_failures(missing, "comment not stored")
+            checkpoint.found += hits
+            checkpoint.processed += len(records)
+            checkpoint.position = position
+            checkpoint.save()
+            print(
+                f"Replayed {checkpoint.processed} comments, "
+                f"{checkpoint.found} with mentions, {checkpoint.failed} failed."
+            )
+
+        for records, position in batches:
+            texts = [record["body"] for record in records]
+            pending.append(
+                (records, position, pool.submit(_classify, texts, args.batch_size))
+            )
+            # bound the number of batches in flight to keep memory flat
+            if len(pending) >= 2 * args.workers:
+                complete_oldest()
+
+        while pending:
+            complete_oldest()
+
+    return checkpoint
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--from", dest="from_", type=date.fromisoformat, required=True)
+    parser.add_argument("--to", type=date.fromisoformat, required=True)
+    parser.add_argument("--source", choices=["postgres", "parquet"], default="postgres")
+    parser.add_argument("--parquet-path", default=BACKUP_PATH + "parquet/")
+    parser.add_argument("--model-path", default=GPT2_MODEL_PATH)
+    parser.add_argument(
+        "--model-version",
+        help="tag of the stored results, defaults to the model folder name",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--checkpoint", help="path of the checkpoint file")
+    return parser
+
+
+if __name__ == "__main__":
+    arguments = get_parser().parse_args()
+    if arguments.model_version is None:
+        arguments.model_version = os.path.basename(
+            os.path.normpath(arguments.model_path)
+        )
+
+    result = replay(arguments)
+    print(f"Finished replay of {result.processed} comments.")
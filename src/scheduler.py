@@ -0,0 +1,258 @@
+from typing import Any, Callable, Iterator, Optional
+from collections import deque
+from datetime import datetime, timedelta
+from queue import Empty, Full, Queue
+import threading
+import uuid
+
+from sqlalchemy.engine import Engine  # type: ignore
+
+from src.br.get_comments import BRCommentGetter
+from src.br.preprocess import preprocess_br_comment
+from src.mdr.get_comments import MDRCommentGetter
+from src.mdr.preprocess import preprocess_mdr_comment
+from src.inference import DeadlineExceeded, Overloaded
+from src.models import MediaHouse, Status
+from src.pipeline import classify_chunk, to_comments
+from src.storage.leader import LeaderElector
+from src.storage.postgres import SESSION, TableWriter, claim_comments
+from settings import (
+    SCHEDULER_BR_INTERVAL,
+    SCHEDULER_HISTORY_SIZE,
+    SCHEDULER_LOOKBACK_HOURS,
+    SCHEDULER_MDR_INTERVAL,
+    SCHEDULER_QUEUE_SIZE,
+)
+
+PREPROCESS = {
+    MediaHouse.MDR: preprocess_mdr_comment,
+    MediaHouse.BR: preprocess_br_comment,
+}
+
+
+class PipelineScheduler:
+    """Fetch, store and classify comments in stages, that run concurrently.
+
+    :param engine: database engine to open sessions on
+    :param backup_writer: writer for the raw comment backup
+    :param intervals: seconds between fetches per source
+    :param queue_size: max number of pages waiting between two stages
+    :param history_size: number of runs to remember
+    :param on_classified: called after a page was classified, e.g. to wake the publisher
+
+    Note: Each source is fetched page by page in its own thread. Stored pages are
+          classified, while later pages are still being downloaded. Full queues block
+          the previous stage, so a slow stage throttles the fetching. Only the leader
+          of a source fetches it, so replicas don't load the sources several times.
+          Storing and classifying run on every replica.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        backup_writer: Any,
+        intervals: Optional[dict[MediaHouse, float]] = None,
+        queue_size: int = SCHEDULER_QUEUE_SIZE,
+        history_size: int = SCHEDULER_HISTORY_SIZE,
+        on_classified: Optional[Callable[[], None]] = None,
+    ):
+        self.engine = engine
+        self.backup_writer = backup_writer
+        self.intervals = intervals or {
+            MediaHouse.MDR: SCHEDULER_MDR_INTERVAL,
+            MediaHouse.BR: SCHEDULER_BR_INTERVAL,
+        }
+        self.on_classified = on_classified
+        self.elector = LeaderElector(engine, list(self.jobs.values()))
+        self.history: deque = deque(maxlen=history_size)
+        self._pages: Queue = Queue(maxsize=queue_size)
+        self._stored: Queue = Queue(maxsize=queue_size)
+        self._fetched_until: dict[MediaHouse, datetime] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    @property
+    def jobs(self) -> dict[MediaHouse, str]:
+        """Names of the singleton fetch jobs per source."""
+        return {
+            media_house: f"fetch_{media_house.value}" for media_house in self.intervals
+        }
+
+    def start(self) -> None:
+        """Start all stages."""
+        self.elector.start()
+        self._stop.clear()
+        targets: list[tuple[str, Callable, tuple]] = [
+            (f"fetch-{media_house.value}", self._fetch, (media_house,))
+            for media_house in self.intervals
+        ]
+        targets += [("store", self._store, ()), ("classify", self._classify, ())]
+        self._threads = [
+            threading.Thread(target=target, args=args, name=name, daemon=True)
+            for name, target, args in targets
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop all stages after their current item.
+
+        :param timeout: seconds to wait for each thread
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+        self._threads = []
+        self.elector.stop(timeout)
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def get_status(self) -> dict[str, Any]:
+        """Return the queue depths and the latest runs, newest first."""
+        with self._lock:
+            history = [dict(run) for run in reversed(self.history)]
+
+        return {
+            "running": self.running,
+            "intervals": {
+                media_house.value: interval
+                for media_house, interval in self.intervals.items()
+            },
+            "queues": self.get_queue_depths(),
+            "history": history,
+        }
+
+    def get_queue_depths(self) -> dict[str, int]:
+        """Return the number of pages waiting for each stage."""
+        return {"pages": self._pages.qsize(), "stored": self._stored.qsize()}
+
+    def _put(self, queue: Queue, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                queue.put(item, timeout=1)
+                return True
+            except Full:
+                continue
+
+        return False
+
+    def _get(self, queue: Queue) -> Iterator[Any]:
+        while not self._stop.is_set():
+            try:
+                item = queue.get(timeout=1)
+            except Empty:
+                continue
+
+            yield item
+
+    def _update(self, run: dict[str, Any], **counts: int) -> None:
+        with self._lock:
+            for key, count in counts.items():
+                run[key] += count
+
+    def _iter_pages(self, media_house: MediaHouse) -> Iterator[list[dict]]:
+        if media_house == MediaHouse.BR:
+            yield BRCommentGetter()(SCHEDULER_LOOKBACK_HOURS)
+            return
+
+        to = datetime.now()
+        # overlap with the previous window, comments already in the db are skipped
+        from_ = self._fetched_until.get(
+            media_house, to - timedelta(hours=SCHEDULER_LOOKBACK_HOURS)
+        ) - timedelta(seconds=self.intervals[media_house])
+        yield from MDRCommentGetter().iter_pages(from_, to, verbose=False)
+        self._fetched_until[media_house] = to
+
+    def _fetch(self, media_house: MediaHouse) -> None:
+        while not self._stop.is_set():
+            if not self.elector.is_leader(self.jobs[media_house]):
+                self._stop.wait(self.elector.renew_seconds)
+                continue
+
+            run = {
+                "id": uuid.uuid4().hex[:8],
+                "source": media_house.value,
+                "started_at": datetime.now().isoformat(),
+                "fetched_at": None,
+                "status": "running",
+                "error": None,
+                "pages": 0,
+                "fetched": 0,
+                "stored": 0,
+                "classified": 0,
+                "mentions": 0,
+            }
+            with self._lock:
+                self.history.append(run)
+
+            try:
+                for page in self._iter_pages(media_house):
+                    self._update(run, pages=1, fetched=len(page))
+                    if not self._put(self._pages, (run, media_house, page)):
+                        break
+            except Exception as exc:
+                print(f"Error while fetching from {media_house.value}: {exc}")
+                status, error = "error", str(exc)
+            else:
+                status, error = "ok", None
+
+            with self._lock:
+                run.update(
+                    status=status, error=error, fetched_at=datetime.now().isoformat()
+                )
+
+            self._stop.wait(self.intervals[media_house])
+
+    def _store(self) -> None:
+        for run, media_house, page in self._get(self._pages):
+            try:
+                comments = to_comments(page, PREPROCESS[media_house])
+                for comment in comments:
+                    self.backup_writer.write(comment.as_dict())
+
+                ids = [comment.id for comment in comments]
+                # bounds the claim to the partitions of the page
+                created_after = min(
+                    (comment.created_at for comment in comments), default=None
+                )
+                with TableWriter(self.engine, purge=False) as writer:
+                    writer.write_many(comments)
+            except Exception as exc:
+                print(f"Error while storing comments of run {run['id']}: {exc}")
+                continue
+
+            self._update(run, stored=len(ids))
+            self._put(self._stored, (run, ids, created_after))
+
+    def _classify(self) -> None:
+        for run, ids, created_after in self._get(self._stored):
+            while not self._stop.is_set():
+                session = SESSION(bind=self.engine)
+                try:
+                    with TableWriter(
+                        self.engine, session=session, purge=False
+                    ) as writer:
+                        chunk = claim_comments(
+                            session,
+                            Status.TO_BE_PROCESSED,
+                            None,
+                            ids=ids,
+                            created_after=created_after,
+                        )
+                        mentions = classify_chunk(writer, chunk)
+                except (Overloaded, DeadlineExceeded) as exc:
+                    # the claims are released, requests go first, try again later
+                    self._stop.wait(exc.retry_after)
+                    continue
+                except Exception as exc:
+                    print(f"Error while classifying comments of run {run['id']}: {exc}")
+                    break
+
+                self._update(run, classified=len(chunk), mentions=mentions)
+                if mentions and self.on_classified is not None:
+                    self.on_classified()
+                break
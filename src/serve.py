@@ -0,0 +1,155 @@
+"""Serve the API with several worker processes, that share the models of their master.
+
+Example:
+
+    python -m src.serve --workers 4 --port 3000
+
+The master loads the models listed in 'PRELOAD_MODELS', freezes the garbage collector
+and forks the workers afterwards. The workers share the memory pages of the models
+with the master as long as nobody writes to them, so each additional worker costs
+little more than the memory of the requests it handles. '/v1/workers' and the
+metric 'wtwm_process_memory_bytes' show shared and private memory of each process.
+"""
+from typing import Optional
+from argparse import ArgumentParser, Namespace
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+from src.memory import MASTER_PID_VARIABLE
+from settings import PRELOAD_MODELS, SERVE_WORKERS
+
+# seconds to wait, before a crashed worker is started again
+RESTART_DELAY_SECONDS = 1
+
+
+def preload() -> None:
+    """Load the models and move all existing objects out of the garbage collector.
+
+    Note: Collecting reads and writes the header of every tracked object. Frozen
+          objects are never visited, so their pages stay shared with the workers.
+    """
+    from src.finder import ModelType, preload_models
+
+    start = time.time()
+    preload_models(ModelType(type_) for type_ in PRELOAD_MODELS)
+    gc.collect()
+    gc.freeze()
+    print(
+        f"Preloaded {PRELOAD_MODELS} in {time.time() - start:.1f}s, "
+        f"froze {gc.get_freeze_count()} objects."
+    )
+
+
+class Master:
+    def __init__(self, config: uvicorn.Config, workers: int) -> None:
+        """Fork workers, that serve the app, and start them again, if they crash.
+
+        :param config: uvicorn config of the workers, the app is imported by them
+        :param workers: number of worker processes
+        """
+        self.config = config
+        self.workers = workers
+        self.pids: dict[int, int] = {}
+        self.stopping = False
+        self._socket: Optional[socket.socket] = None
+
+    def spawn(self, index: int) -> None:
+        """Fork a worker.
+
+        :param index: number of the worker
+        """
+        pid = os.fork()
+        if pid:
+            self.pids[pid] = index
+            return
+
+        code = 0
+        try:
+            self.run_worker(index)
+        except BaseException as exc:
+            print(f"Worker {index} failed: '{exc}'")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def run_worker(self, index: int) -> None:
+        """Serve the app in a forked worker.
+
+        :param index: number of the worker
+        """
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        if "WORKER_ID" in os.environ:
+            # the default id contains the pid already
+            os.environ["WORKER_ID"] = f"{os.environ['WORKER_ID']}-{index}"
+
+        if "torch" in sys.modules:
+            # the workers share the cores instead of each one using all of them
+            import torch
+
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // self.workers))
+
+        uvicorn.Server(self.config).run(sockets=[self._socket])
+
+    def stop(self, signum: int, frame: object) -> None:
+        """Stop all workers, they finish their current requests first."""
+        self.stopping = True
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                continue
+
+    def run(self) -> None:
+        """Load the models, fork the workers and wait for them to exit."""
+        preload()
+        self._socket = self.config.bind_socket()
+        os.environ[MASTER_PID_VARIABLE] = str(os.getpid())
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.workers):
+            self.spawn(index)
+
+        print(f"Master {os.getpid()} started workers {sorted(self.pids)}.")
+        while self.pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+
+            index = self.pids.pop(pid, None)
+            if index is None or self.stopping:
+                continue
+
+            print(f"Worker {index} exited with status {status}, restarting it.")
+            time.sleep(RESTART_DELAY_SECONDS)
+            if not self.stopping:
+                self.spawn(index)
+
+        self._socket.close()
+
+
+def get_parser() -> ArgumentParser:
+    """Return the command line arguments."""
+    parser = ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--app", default="api:APP", help="app for uvicorn")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    return parser
+
+
+def main(args: Optional[Namespace] = None) -> None:
+    args = args or get_parser().parse_args()
+    config = uvicorn.Config(args.app, host=args.host, port=args.port)
+    Master(config, args.workers).run()
+
+
+if __name__ == "__main__":
+    main()
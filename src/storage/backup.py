@@ -0,0 +1,232 @@
+from typing import Any, BinaryIO, Iterable, Optional
+from datetime import datetime
+from queue import Empty, Queue
+from threading import Event, Lock, Thread
+import gzip
+import os
+import time
+
+from src.tools import dumps_line
+from src.metrics import timed
+from settings import (
+    BACKUP_COMPRESSION,
+    BACKUP_FLUSH_SECONDS,
+    BACKUP_ROTATE_BYTES,
+    BACKUP_ROTATE_SECONDS,
+    BACKUP_IN_BACKGROUND,
+)
+
+SUFFIXES = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst", "none": ".jsonl"}
+PART_SUFFIX = ".part"
+# seconds between checks of the background thread, whether to flush or rotate
+TICK_SECONDS = 1.0
+
+
+def open_compressed(path: str, compression: str) -> tuple[BinaryIO, BinaryIO]:
+    """Open a file for binary writing with compression.
+
+    :param path: path of the file
+    :param compression: 'gzip', 'zstd' or 'none'
+    :return: the compressing writer and the underlying file, which stays open, when
+             the writer is closed
+    """
+    if compression not in SUFFIXES:
+        raise ValueError(f"Unknown compression: '{compression}'")
+
+    file = open(path, "wb")
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=file, mode="wb", compresslevel=6), file
+    elif compression == "zstd":
+        import zstandard  # type: ignore
+
+        writer = zstandard.ZstdCompressor(level=3).stream_writer(file, closefd=False)
+        return writer, file
+    else:
+        return file, file
+
+
+class BackupWriter:
+    def __init__(
+        self,
+        folder: str,
+        prefix: str = "comment_backup",
+        compression: str = BACKUP_COMPRESSION,
+        rotate_bytes: int = BACKUP_ROTATE_BYTES,
+        rotate_seconds: int = BACKUP_ROTATE_SECONDS,
+        in_background: bool = BACKUP_IN_BACKGROUND,
+        flush_seconds: int = BACKUP_FLUSH_SECONDS,
+    ) -> None:
+        """Stream records into compressed jsonlines files, that rotate by size and age.
+
+        :param folder: folder to write the files to
+        :param prefix: file name prefix
+        :param compression: 'gzip', 'zstd' or 'none'
+        :param rotate_bytes: start a new file after this many uncompressed bytes
+        :param rotate_seconds: start a new file after this many seconds
+        :param in_background: write in a background thread, if true
+        :param flush_seconds: flush the compressor and sync the current file to disk
+                              after this many seconds, at least once per rotation
+
+        Note: The current file carries a '.part' suffix and is renamed when it is
+              rotated or the writer is closed, so finished files are always complete.
+              A background thread rotates and flushes idle files on time, too, so a
+              crash loses at most the records of the last 'flush_seconds'.
+        """
+        if compression not in SUFFIXES:
+            raise ValueError(f"Unknown compression: '{compression}'")
+
+        self._folder = folder
+        self._prefix = prefix
+        self._compression = compression
+        self._rotate_bytes = rotate_bytes
+        self._rotate_seconds = rotate_seconds
+        self._flush_seconds = min(flush_seconds, rotate_seconds)
+        self._lock = Lock()
+        self._handle: Optional[BinaryIO] = None
+        self._file: Optional[BinaryIO] = None
+        self._path: Optional[str] = None
+        self._opened_at = 0.0
+        self._flushed_at = 0.0
+        self._written = 0
+        self._queue: Optional[Queue] = None
+        self._stopped = Event()
+        if in_background:
+            self._queue = Queue()
+        self._thread: Optional[Thread] = Thread(
+            target=self._run if in_background else self._tick,
+            name="backup-writer",
+            daemon=True,
+        )
+        self._thread.start()
+
+    @timed("backup")
+    def write(self, record: dict[str, Any]) -> None:
+        """Write a single record.
+
+        :param record: json serializable record
+        """
+        self.write_many([record])
+
+    def write_many(self, records: Iterable[dict[str, Any]]) -> None:
+        """Write records, serialized right away to decouple them from the caller.
+
+        :param records: json serializable records
+        """
+        lines = [dumps_line(record) for record in records]
+        if not lines:
+            return
+
+        if self._queue is not None:
+            self._queue.put(lines)
+        else:
+            self._write_lines(lines)
+
+    @property
+    def pending(self) -> int:
+        """Number of writes waiting for the background thread."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def flush(self) -> None:
+        """Wait until all queued records are written."""
+        if self._queue is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        """Write pending records and finish the current file."""
+        if self._thread is not None:
+            if self._queue is not None:
+                self._queue.put(None)
+            self._stopped.set()
+            self._thread.join()
+            self._queue = None
+            self._thread = None
+
+        with self._lock:
+            self._finish()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                lines = self._queue.get(timeout=TICK_SECONDS)  # type: ignore
+            except Empty:
+                self._maintain()
+                continue
+
+            try:
+                if lines is None:
+                    return
+
+                self._write_lines(lines)
+            except OSError as exc:
+                print(f"Could not write {len(lines)} backup records because of: {exc}")
+            finally:
+                self._queue.task_done()  # type: ignore
+
+    def _tick(self) -> None:
+        while not self._stopped.wait(TICK_SECONDS):
+            self._maintain()
+
+    def _maintain(self) -> None:
+        """Rotate or flush the current file, if it is due, even without new records."""
+        try:
+            with self._lock:
+                self._rotate_or_flush()
+        except OSError as exc:
+            print(f"Could not flush the backup file because of: {exc}")
+
+    def _write_lines(self, lines: list[bytes]) -> None:
+        with self._lock:
+            if self._handle is None:
+                self._open()
+
+            for line in lines:
+                self._handle.write(line)  # type: ignore
+                self._written += len(line)
+
+            if self._written >= self._rotate_bytes:
+                self._finish()
+            else:
+                self._rotate_or_flush()
+
+    def _rotate_or_flush(self) -> None:
+        if self._handle is None:
+            return
+
+        now = time.monotonic()
+        if now - self._opened_at >= self._rotate_seconds:
+            self._finish()
+        elif now - self._flushed_at >= self._flush_seconds:
+            self._sync()
+
+    def _sync(self) -> None:
+        # gzip and zstd end their current block, so everything up to here is readable
+        self._handle.flush()  # type: ignore
+        if self._file is not self._handle:
+            self._file.flush()  # type: ignore
+        os.fsync(self._file.fileno())  # type: ignore
+        self._flushed_at = time.monotonic()
+
+    def _open(self) -> None:
+        os.makedirs(self._folder, exist_ok=True)
+        name = f"{self._prefix}_{datetime.now().strftime('%Y%m%dT%H%M%S%f')}"
+        self._path = os.path.join(self._folder, name + SUFFIXES[self._compression])
+        self._handle, self._file = open_compressed(
+            self._path + PART_SUFFIX, self._compression
+        )
+        self._opened_at = self._flushed_at = time.monotonic()
+        self._written = 0
+
+    def _finish(self) -> None:
+        if self._handle is None or self._file is None or self._path is None:
+            return
+
+        if self._handle is not self._file:
+            # writes the trailer, the file itself stays open
+            self._handle.close()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._path + PART_SUFFIX, self._path)
+        self._handle = None
+        self._file = None
+        self._path = None
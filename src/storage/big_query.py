@@ -1,91 +1,320 @@
+from typing import Any, Iterable, Optional
+from abc import ABC, abstractmethod
+from random import randint
+from datetime import datetime, timedelta
+import gzip
+import json
+import os
+import sqlite3
+
+from sqlalchemy.orm import Session, selectinload  # type: ignore
+from pytz import utc
+
+from src.models import Comment, SyncState
+from src.tools import dumps_line
 from settings import (
     BIGQUERY_PROJECT_ID,
     BIGQUERY_DATASET_ID,
     BIGQUERY_CREDENTIAL_PATH,
+    BIGQUERY_SYNC_PATH,
     TABLE_ID,
 )
-from google.oauth2 import service_account
-from google.cloud.bigquery import LoadJobConfig, SourceFormat, Client, Table
-from random import randint
-from datetime import datetime, timedelta
-from pytz import utc
 
-from src.models import Comment
 
+def read_schema(table_id: str) -> list[dict[str, Any]]:
+    """Read the schema of a table from 'schemas/'.
 
-class BigQueryWriter:
-    def __init__(self) -> None:
-        self.project_id = BIGQUERY_PROJECT_ID
-        self.dataset_id = BIGQUERY_DATASET_ID
+    :param table_id: id of the table
+    """
+    with open(os.path.join("schemas", table_id + ".json"), "r") as handle:
+        return json.load(handle)
+
+
+class WarehouseClient(ABC):
+    """Minimal interface of the data warehouse the comments are exported to."""
+
+    @abstractmethod
+    def load(self, file_path: str, table_id: str, schema: list[dict[str, Any]]) -> None:
+        """Load a gzip compressed jsonlines file into a new table.
+
+        :param file_path: path to file to load
+        :param table_id: id of the table to create
+        :param schema: table schema, see 'schemas/'
+        """
+
+    @abstractmethod
+    def merge(
+        self, source_id: str, target_id: str, columns: list[str], key: str = "id"
+    ) -> None:
+        """Upsert all rows of the source table into the target table.
+
+        :param source_id: id of the table to read from
+        :param target_id: id of the table to write into
+        :param columns: columns to copy
+        :param key: column identifying a row
+        """
+
+    @abstractmethod
+    def drop(self, table_id: str) -> None:
+        """Drop a table, if it exists.
+
+        :param table_id: id of the table
+        """
+
+
+class BigQueryClient(WarehouseClient):
+    def __init__(
+        self,
+        project_id: str = BIGQUERY_PROJECT_ID,
+        dataset_id: str = BIGQUERY_DATASET_ID,
+        credential_path: str = BIGQUERY_CREDENTIAL_PATH,
+    ) -> None:
+        """Google BigQuery as data warehouse.
+
+        :param project_id: google cloud project
+        :param dataset_id: dataset holding the tables
+        :param credential_path: path to the service account file
+        """
+        from google.oauth2 import service_account  # type: ignore
+        from google.cloud.bigquery import Client  # type: ignore
+
+        self.project_id = project_id
+        self.dataset_id = dataset_id
         self.credentials = service_account.Credentials.from_service_account_file(
-            BIGQUERY_CREDENTIAL_PATH
+            credential_path
         )
         self.client = Client(credentials=self.credentials, project=self.project_id)
 
-    def create_table(self, table_id: str, schema=None, expiracy_hours: int = None):
-        """Create a temporary table with a random id.
+    def _full_id(self, table_id: str) -> str:
+        return f"{self.project_id}.{self.dataset_id}.{table_id}"
 
-        :param table_id: id of the table to write into
-        :param schema: schema of the table
-        :param expiracy_hours: number of hours before the table expires
-        """
+    def load(self, file_path: str, table_id: str, schema: list[dict[str, Any]]) -> None:
+        from google.cloud.bigquery import (  # type: ignore
+            LoadJobConfig,
+            SchemaField,
+            SourceFormat,
+            WriteDisposition,
+        )
+
+        load_job_config = LoadJobConfig(
+            schema=[SchemaField.from_api_repr(field) for field in schema],
+            source_format=SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=WriteDisposition.WRITE_TRUNCATE,
+        )
+        with open(file_path, "rb") as handle:
+            job = self.client.load_table_from_file(
+                handle, self._full_id(table_id), job_config=load_job_config
+            )
+
+        job.result()
+        # staging tables clean up after themselves, if a sync fails halfway
+        table = self.client.get_table(self._full_id(table_id))
+        table.expires = datetime.now(utc) + timedelta(hours=1)
+        self.client.update_table(table, ["expires"])
+
+    def merge(
+        self, source_id: str, target_id: str, columns: list[str], key: str = "id"
+    ) -> None:
+        updates = ", ".join(f"`{c}` = S.`{c}`" for c in columns if c != key)
+        names = ", ".join(f"`{c}`" for c in columns)
+        values = ", ".join(f"S.`{c}`" for c in columns)
+        query = (
+            f"MERGE `{self._full_id(target_id)}` T "
+            f"USING `{self._full_id(source_id)}` S ON T.`{key}` = S.`{key}` "
+            f"WHEN MATCHED THEN UPDATE SET {updates} "
+            f"WHEN NOT MATCHED THEN INSERT ({names}) VALUES ({values})"
+        )
+        self.client.query(query).result()
 
-        if expiracy_hours is not None:
-            suffix = randint(10000, 99999)
-            table_id += "_temp_" + str(suffix)
-            expiracy_date = datetime.now(utc) + timedelta(hours=expiracy_hours)
+    def drop(self, table_id: str) -> None:
+        self.client.delete_table(self._full_id(table_id), not_found_ok=True)
 
-        table = Table(table_id, schema=schema)
-        if expiracy_hours is not None:
-            table.expires = expiracy_date
 
-        self.client.create_table(table)
-        if expiracy_hours is not None:
-            return table_id
+class SQLiteWarehouse(WarehouseClient):
+    def __init__(self, path: str = ":memory:") -> None:
+        """Local stand-in for BigQuery, e.g. for tests and benchmarks.
 
-    def write_file(self, file_path: str, table_id: str = TABLE_ID):
-        """Write comments into the BigQuery table specified by table_id.
+        :param path: path of the sqlite database, in memory by default
 
-        :param file_path: path to file to load to database
-        :param table_id: id of the table to write into
+        Note: Repeated and record fields are stored as json text.
         """
-        # create a dataset reference
-        dataset_ref = self.client.dataset(self.dataset_id)
-
-        # create destiny table reference
-        table_ref = dataset_ref.table(table_id)
-
-        # create temporary table
-        schema_path = "schemas/" + table_id + ".json"
-        schema = self.client.schema_from_json(schema_path)
-        temp_table_id = self.create_table(
-            f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET_ID}.{table_id}",
-            schema,
-            expiracy_hours=1,
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+
+    def _create(self, table_id: str, schema: list[dict[str, Any]]) -> None:
+        columns = ", ".join(
+            f'"{field["name"]}" TEXT PRIMARY KEY'
+            if field["name"] == "id"
+            else f'"{field["name"]}" TEXT'
+            for field in schema
         )
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS "{table_id}" ({columns})')
 
-        # create a load job config
-        load_job_config = LoadJobConfig()
-        load_job_config.source_format = SourceFormat.NEWLINE_DELIMITED_JSON
-        load_job_config.autodetect = True
+    def load(self, file_path: str, table_id: str, schema: list[dict[str, Any]]) -> None:
+        names = [field["name"] for field in schema]
+        self.drop(table_id)
+        self._create(table_id, schema)
+        with gzip.open(file_path, "rt", encoding="utf-8") as handle:
+            rows = [
+                [_to_text(json.loads(line).get(name)) for name in names]
+                for line in handle
+            ]
 
-        # load the data
-        job = self.client.load_table_from_file(
-            open(file_path, "rb"), temp_table_id, job_config=load_job_config
+        placeholders = ", ".join("?" for _ in names)
+        columns = ", ".join(f'"{name}"' for name in names)
+        self.connection.executemany(
+            f'INSERT INTO "{table_id}" ({columns}) VALUES ({placeholders})', rows
         )
-        job.result()
+        self.connection.commit()
+
+    def merge(
+        self, source_id: str, target_id: str, columns: list[str], key: str = "id"
+    ) -> None:
+        names = ", ".join(f'"{c}"' for c in columns)
+        updates = ", ".join(f'"{c}" = excluded."{c}"' for c in columns if c != key)
+        # 'WHERE true' resolves the parser ambiguity of 'ON CONFLICT' after a select
+        self.connection.execute(
+            f'INSERT INTO "{target_id}" ({names}) '
+            f'SELECT {names} FROM "{source_id}" WHERE true '
+            f'ON CONFLICT ("{key}") DO UPDATE SET {updates}'
+        )
+        self.connection.commit()
+
+    def drop(self, table_id: str) -> None:
+        self.connection.execute(f'DROP TABLE IF EXISTS "{table_id}"')
+        self.connection.commit()
+
+    def create_table(self, table_id: str, schema: list[dict[str, Any]]) -> None:
+        """Create the target table, BigQuery tables are created upfront.
+
+        :param table_id: id of the table
+        :param schema: table schema, see 'schemas/'
+        """
+        self._create(table_id, schema)
+
+    def rows(self, table_id: str) -> list[dict[str, Any]]:
+        """Return all rows of a table.
+
+        :param table_id: id of the table
+        """
+        cursor = self.connection.execute(f'SELECT * FROM "{table_id}"')
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def _to_text(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+
+    return json.dumps(value)
+
+
+def to_row(comment: Comment, schema: list[dict[str, Any]]) -> dict[str, Any]:
+    """Project a comment onto the fields of a table schema.
+
+    :param comment: comment to export
+    :param schema: table schema, see 'schemas/'
+    """
+    record = comment.as_dict()
+    row = {}
+    for field in schema:
+        value = record.get(field["name"])
+        if field["type"] == "RECORD" and value is not None:
+            names = [subfield["name"] for subfield in field["fields"]]
+            value = [{name: item.get(name) for name in names} for item in value]
 
-    def update_comments(self, comments: list[Comment]):
-        """Update comments in database.
+        row[field["name"]] = value
 
-        :param comments: comments to update"""
-        for comment in comments:
-            self.update_comment(comment)
+    return row
+
+
+class BigQueryWriter:
+    def __init__(
+        self,
+        client: Optional[WarehouseClient] = None,
+        table_id: str = TABLE_ID,
+        folder: str = BIGQUERY_SYNC_PATH,
+    ) -> None:
+        """Export comments into a data warehouse table.
+
+        :param client: data warehouse, BigQuery if None
+        :param table_id: id of the table to write into
+        :param folder: folder for the intermediate batch files
+        """
+        self.client = client or BigQueryClient()
+        self.table_id = table_id
+        self.schema = read_schema(table_id)
+        self.folder = folder
+
+    def update_comments(self, comments: Iterable[Comment]) -> int:
+        """Upsert comments into the table as one batch and return their number.
+
+        :param comments: comments to update
+
+        Note: The comments are written into one compressed file, loaded into a staging
+              table with the explicit schema and merged into the target with a single
+              'MERGE' statement.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        suffix = randint(10000, 99999)
+        staging_id = f"{self.table_id}_staging_{suffix}"
+        file_path = os.path.join(self.folder, f"{staging_id}.jsonl.gz")
+        count = 0
+        with gzip.open(file_path, "wb") as handle:
+            for comment in comments:
+                handle.write(dumps_line(to_row(comment, self.schema)))
+                count += 1
+
+        try:
+            if count:
+                self.client.load(file_path, staging_id, self.schema)
+                columns = [field["name"] for field in self.schema]
+                self.client.merge(staging_id, self.table_id, columns)
+        finally:
+            self.client.drop(staging_id)
+            os.remove(file_path)
+
+        return count
 
     def update_comment(self, comment: Comment) -> None:
         """Update comment in database.
 
         :param comment: comment to update
         """
-        # TODO
-        pass
+        self.update_comments([comment])
+
+
+def sync_comments(
+    session: Session,
+    writer: BigQueryWriter,
+    chunk_size: int = 1000,
+    lag_seconds: int = 60,
+) -> int:
+    """Export all comments changed since the last sync and return their number.
+
+    :param session: running postgress connection
+    :param writer: warehouse writer
+    :param chunk_size: number of comments loaded from postgres at once
+    :param lag_seconds: only export changes older than this
+
+    Note: The lag covers transactions, that set 'last_updated_at' but were not yet
+          committed when the sync started. 'last_updated_at' is only set by the orm,
+          when the status changes. Bulk updates like 'claim_comments' bypass it, so
+          they must not change exported columns. Deleted comments, e.g. by retention,
+          stay in the warehouse.
+    """
+    name = f"bigquery:{writer.table_id}"
+    state = session.get(SyncState, name) or SyncState(name=name)
+    until = datetime.now() - timedelta(seconds=lag_seconds)
+    query = session.query(Comment).options(selectinload(Comment.mentions))
+    query = query.filter(Comment.last_updated_at <= until)
+    if state.synced_until is not None:
+        query = query.filter(Comment.last_updated_at > state.synced_until)
+
+    count = writer.update_comments(
+        query.order_by(Comment.last_updated_at).yield_per(chunk_size)
+    )
+    if state.synced_until is None or until > state.synced_until:
+        state.synced_until = until
+    session.merge(state)
+    session.commit()
+    return count
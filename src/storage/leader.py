@@ -0,0 +1,212 @@
+from typing import Any, Iterator, Optional
+from contextlib import contextmanager
+import hashlib
+import threading
+
+from sqlalchemy.engine import Engine  # type: ignore
+
+from src.exceptions import JobLocked
+from settings import LEADER_RENEW_SECONDS, WORKER_ID
+
+# names of all singleton jobs of this process, reported by get_job_holders
+KNOWN_JOBS: set[str] = set()
+
+
+def get_lock_key(name: str) -> int:
+    """Return the postgres advisory lock key of a job.
+
+    :param name: name of the job
+    """
+    return int.from_bytes(
+        hashlib.sha256(name.encode()).digest()[:8], "big", signed=True
+    )
+
+
+def supports_locks(engine: Engine) -> bool:
+    """True, if the database supports advisory locks, false otherwise.
+
+    Note: Without them, e.g. on sqlite in local setups, every job runs unguarded.
+    """
+    return engine.dialect.name == "postgresql"
+
+
+def connect(engine: Engine, worker_id: str) -> Any:
+    """Open a connection outside of the pool, that holds advisory locks.
+
+    :param engine: postgres engine
+    :param worker_id: name of this replica, shown in 'pg_stat_activity'
+
+    Note: Session level advisory locks live as long as their connection, so returning
+          the connection to the pool would leak them. Closing it releases them all.
+    """
+    connection = engine.raw_connection()
+    connection.detach()
+    connection.connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute("SET application_name = %s", (worker_id,))
+
+    return connection
+
+
+def try_lock(connection: Any, name: str) -> bool:
+    """Try to lock a job without waiting and return, whether it worked.
+
+    :param connection: connection, that holds the lock
+    :param name: name of the job
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (get_lock_key(name),))
+        return cursor.fetchone()[0]
+
+
+def get_job_holders(engine: Engine, names: Optional[set[str]] = None) -> dict:
+    """Return the replica, that holds each job, or None, if the job is free.
+
+    :param engine: postgres engine
+    :param names: names of the jobs, all known jobs, if None
+    """
+    names = KNOWN_JOBS if names is None else names
+    if not supports_locks(engine):
+        return {name: None for name in names}
+
+    keys = {}
+    for name in names:
+        key = get_lock_key(name) & 0xFFFFFFFFFFFFFFFF
+        keys[(key >> 32, key & 0xFFFFFFFF)] = name
+
+    holders: dict[str, Optional[str]] = {name: None for name in names}
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(
+            "SELECT l.classid::bigint, l.objid::bigint, a.application_name "
+            "FROM pg_locks l JOIN pg_stat_activity a ON a.pid = l.pid "
+            "WHERE l.locktype = 'advisory' AND l.objsubid = 1 AND l.granted"
+        )
+        for classid, objid, application_name in rows:
+            if (classid, objid) in keys:
+                holders[keys[(classid, objid)]] = application_name
+
+    return holders
+
+
+@contextmanager
+def run_exclusive(
+    engine: Engine, name: str, worker_id: str = WORKER_ID
+) -> Iterator[None]:
+    """Run a block on one replica at a time.
+
+    :param engine: postgres engine
+    :param name: name of the job
+    :param worker_id: name of this replica
+
+    Note: Raises 'JobLocked', if another replica runs the job, instead of waiting.
+    """
+    KNOWN_JOBS.add(name)
+    if not supports_locks(engine):
+        yield
+        return
+
+    connection = connect(engine, worker_id)
+    try:
+        if not try_lock(connection, name):
+            holder = get_job_holders(engine, {name})[name] or "unknown"
+            raise JobLocked(name, holder)
+
+        yield
+    finally:
+        connection.close()
+
+
+class LeaderElector:
+    """Keep the leadership of jobs, that must run on one replica only.
+
+    :param engine: postgres engine
+    :param jobs: names of the jobs to lead
+    :param renew_seconds: seconds between checks of the leadership
+    :param worker_id: name of this replica
+
+    Note: Locks, that are free, are taken on each renewal. If the connection holding
+          the locks breaks, postgres releases them and the leadership moves to another
+          replica on its next renewal.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        jobs: list[str],
+        renew_seconds: float = LEADER_RENEW_SECONDS,
+        worker_id: str = WORKER_ID,
+    ):
+        self.engine = engine
+        self.jobs = jobs
+        self.renew_seconds = renew_seconds
+        self.worker_id = worker_id
+        self._held: set[str] = set()
+        self._connection: Any = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        KNOWN_JOBS.update(jobs)
+
+    def start(self) -> None:
+        """Start taking and renewing the leadership."""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="leader-elector", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Give up all leaderships.
+
+        :param timeout: seconds to wait for the thread
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+        self._drop()
+
+    def is_leader(self, job: str) -> bool:
+        """True, if this replica should run the job, false otherwise.
+
+        :param job: name of the job
+        """
+        if not supports_locks(self.engine):
+            return True
+
+        return job in self._held
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._renew()
+            except Exception as exc:
+                print(f"Lost the leadership of {sorted(self._held)}: {exc}")
+                self._drop()
+
+            self._stop.wait(self.renew_seconds)
+
+    def _renew(self) -> None:
+        if not supports_locks(self.engine):
+            return
+
+        if self._connection is None:
+            self._connection = connect(self.engine, self.worker_id)
+
+        with self._connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+        for job in self.jobs:
+            if job not in self._held and try_lock(self._connection, job):
+                print(f"Took the leadership of '{job}'.")
+                self._held.add(job)
+
+    def _drop(self) -> None:
+        self._held = set()
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+
+            self._connection = None
@@ -0,0 +1,149 @@
+from typing import Any, Callable, Optional
+import select
+import threading
+
+from sqlalchemy import event, inspect, text  # type: ignore
+from sqlalchemy.engine import Engine  # type: ignore
+from sqlalchemy.orm import Session  # type: ignore
+
+from src.models import Comment, Status
+from src.storage.outbox import get_publishable
+
+TO_BE_PROCESSED_CHANNEL = "comments_to_be_processed"
+TO_BE_PUBLISHED_CHANNEL = "comments_to_be_published"
+LATEST_MENTIONS_CHANNEL = "latest_mentions_changed"
+
+
+def changes_acceptance(comment: Comment) -> bool:
+    """Tell, whether a pending change accepts or unaccepts a comment.
+
+    :param comment: new or changed comment of a session
+    """
+    history = inspect(comment).attrs.status.history
+    return Status.ACCEPTED in list(history.added) + list(history.deleted)
+
+
+def get_channels(session: Session) -> set[str]:
+    """Return the channels to notify about the pending changes of a session.
+
+    :param session: session, that is being flushed
+    """
+    channels = set()
+    for entry in list(session.new) + list(session.dirty):
+        if not isinstance(entry, Comment):
+            continue
+
+        if entry.status == Status.TO_BE_PROCESSED:
+            channels.add(TO_BE_PROCESSED_CHANNEL)
+        if changes_acceptance(entry):
+            # every process caches the latest mentions on its own
+            channels.add(LATEST_MENTIONS_CHANNEL)
+
+    # outbox entries are inserted by a statement, the comments tell about them
+    if get_publishable(session):
+        channels.add(TO_BE_PUBLISHED_CHANNEL)
+
+    return channels
+
+
+def notify_channels(session: Session, flush_context: Any) -> None:
+    """Notify listeners about new work, once the transaction is committed.
+
+    Note: Registered for all sessions. Postgres delivers a notification only on commit
+          and merges equal notifications of one transaction, so every flush may notify.
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        return
+
+    for channel in get_channels(session):
+        session.connection().execute(
+            text("SELECT pg_notify(:channel, '')"), {"channel": channel}
+        )
+
+
+event.listen(Session, "after_flush", notify_channels)
+
+
+class NotificationListener:
+    """Call back, when one of the channels is notified.
+
+    :param engine: postgres engine to take the listening connection from
+    :param callbacks: callback per channel
+    :param timeout: seconds to wait for notifications before checking for a stop
+    :param reconnect_seconds: seconds to wait before reconnecting after an error
+
+    Note: All callbacks are called after (re)connecting, because notifications sent
+          while no connection was listening are lost.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        callbacks: dict[str, Callable[[], None]],
+        timeout: float = 1,
+        reconnect_seconds: float = 5,
+    ):
+        self.engine = engine
+        self.callbacks = callbacks
+        self.timeout = timeout
+        self.reconnect_seconds = reconnect_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start listening in the background."""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="notification-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop listening.
+
+        :param timeout: seconds to wait for the thread
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception as exc:
+                print(f"Error while listening for notifications: {exc}")
+                self._stop.wait(self.reconnect_seconds)
+
+    def _listen(self) -> None:
+        connection = self.engine.raw_connection()
+        # keep the connection with autocommit out of the pool
+        connection.detach()
+        try:
+            dbapi_connection = connection.connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                for channel in self.callbacks:
+                    cursor.execute(f'LISTEN "{channel}"')
+
+            for callback in self.callbacks.values():
+                callback()
+
+            while not self._stop.is_set():
+                if select.select([dbapi_connection], [], [], self.timeout) == (
+                    [],
+                    [],
+                    [],
+                ):
+                    continue
+
+                dbapi_connection.poll()
+                channels = set()
+                while dbapi_connection.notifies:
+                    channels.add(dbapi_connection.notifies.pop(0).channel)
+
+                for channel in channels:
+                    self.callbacks[channel]()
+        finally:
+            connection.close()
@@ -0,0 +1,174 @@
+from typing import Any
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, or_  # type: ignore
+from sqlalchemy.orm import Session  # type: ignore
+from sqlalchemy.orm.attributes import get_history  # type: ignore
+
+from src.models import Comment, OutboxEntry, OutboxState, Status
+from src.storage.stats import UPSERTS
+
+
+def new_entry(comment: Comment, now: datetime) -> dict[str, Any]:
+    return dict(
+        comment_id=comment.id,
+        media_house=comment.media_house,
+        comment_created_at=comment.created_at,
+        state=OutboxState.PENDING,
+        attempts=0,
+        next_attempt_at=now,
+        enqueued_at=now,
+    )
+
+
+def insert_entries(session: Session, entries: list[dict[str, Any]]) -> int:
+    """Insert outbox entries and return the number of inserted ones.
+
+    :param session: running postgress connection
+    :param entries: values of the entries, see 'new_entry'
+
+    Note: Comments, that have an entry already, e.g. added by another replica at the
+          same time, are skipped by the unique index on 'comment_id'.
+    """
+    if not entries:
+        return 0
+
+    insert = UPSERTS[session.get_bind().dialect.name]
+    stmt = insert(OutboxEntry).values(entries)
+    stmt = stmt.on_conflict_do_nothing(index_elements=["comment_id"])
+    return session.execute(stmt).rowcount
+
+
+def get_publishable(session: Session) -> list[Comment]:
+    """Return the comments of a flush, that become ready to be published.
+
+    :param session: session, that is being flushed
+    """
+    comments = []
+    for comment in list(session.new) + list(session.dirty):
+        if not isinstance(comment, Comment):
+            continue
+
+        if comment.status != Status.TO_BE_PUBLISHED:
+            continue
+
+        if comment in session.dirty and not get_history(comment, "status").added:
+            continue
+
+        comments.append(comment)
+
+    return comments
+
+
+def enqueue_publishable(session: Session, flush_context: Any, instances: Any) -> None:
+    """Add an outbox entry for each comment that becomes ready to be published.
+
+    Note: Registered for all sessions, so the entry is written in the same transaction
+          as the status change.
+    """
+    now = datetime.utcnow()
+    insert_entries(
+        session, [new_entry(comment, now) for comment in get_publishable(session)]
+    )
+
+
+event.listen(Session, "before_flush", enqueue_publishable)
+
+
+def enqueue_missing(session: Session, expiry_minutes: int) -> int:
+    """Add outbox entries for publishable comments without one, e.g. after an update.
+
+    :param session: running postgress connection
+    :param expiry_minutes: only consider comments younger than this
+    """
+    now = datetime.utcnow()
+    queued = session.query(OutboxEntry.comment_id)
+    comments = (
+        session.query(Comment)
+        .filter(
+            Comment.status == Status.TO_BE_PUBLISHED,
+            Comment.created_at >= now - timedelta(minutes=expiry_minutes),
+            Comment.mentions.any(),
+            Comment.id.notin_(queued),
+        )
+        .all()
+    )
+    added = insert_entries(session, [new_entry(comment, now) for comment in comments])
+    session.commit()
+    return added
+
+
+def expire_outbox(session: Session, expiry_minutes: int) -> int:
+    """Expire pending entries of comments older than the expiry.
+
+    :param session: running postgress connection
+    :param expiry_minutes: age of comments after which they are not published
+    """
+    cutoff = datetime.utcnow() - timedelta(minutes=expiry_minutes)
+    expired = (
+        session.query(OutboxEntry)
+        .filter(
+            OutboxEntry.state == OutboxState.PENDING,
+            OutboxEntry.comment_created_at < cutoff,
+        )
+        .update({OutboxEntry.state: OutboxState.EXPIRED}, synchronize_session=False)
+    )
+    session.commit()
+    return expired
+
+
+def claim_outbox(
+    session: Session, limit: int, lease_seconds: int, expiry_minutes: int
+) -> list[OutboxEntry]:
+    """Claim due, unexpired entries oldest first.
+
+    :param session: running postgress connection
+    :param limit: max number of entries to claim
+    :param lease_seconds: seconds until a claim expires
+    :param expiry_minutes: age of comments after which they are not published
+
+    Note: Uses 'FOR UPDATE SKIP LOCKED' like 'claim_comments', so several replicas can
+          drain the outbox without publishing a comment twice.
+    """
+    now = datetime.utcnow()
+    ids = [
+        id_
+        for id_, in session.query(OutboxEntry.id)
+        .filter(
+            OutboxEntry.state == OutboxState.PENDING,
+            OutboxEntry.next_attempt_at <= now,
+            OutboxEntry.comment_created_at >= now - timedelta(minutes=expiry_minutes),
+            or_(OutboxEntry.claimed_until.is_(None), OutboxEntry.claimed_until < now),
+        )
+        .order_by(OutboxEntry.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ]
+    if ids:
+        session.query(OutboxEntry).filter(OutboxEntry.id.in_(ids)).update(
+            {OutboxEntry.claimed_until: now + timedelta(seconds=lease_seconds)},
+            synchronize_session=False,
+        )
+
+    session.commit()
+    if not ids:
+        return []
+
+    return (
+        session.query(OutboxEntry)
+        .filter(OutboxEntry.id.in_(ids))
+        .order_by(OutboxEntry.id)
+        .all()
+    )
+
+
+def count_pending(session: Session) -> int:
+    """Return the number of entries waiting to be published.
+
+    :param session: running postgress connection
+    """
+    return (
+        session.query(OutboxEntry)
+        .filter(OutboxEntry.state == OutboxState.PENDING)
+        .count()
+    )
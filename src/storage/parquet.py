@@ -0,0 +1,273 @@
+from typing import Any, Iterable, Iterator, Optional
+from datetime import date, datetime
+from threading import Event, Lock, Thread
+import time
+import uuid
+
+import pyarrow as pa  # type: ignore
+import pyarrow.dataset as ds  # type: ignore
+
+from src.models import Comment, MediaHouse, RecognitionResult, Status
+from src.metrics import timed
+from src.storage.backup import TICK_SECONDS
+from settings import BACKUP_PARQUET_ROWS, BACKUP_ROTATE_SECONDS
+
+MENTION_TYPE = pa.struct(
+    [
+        ("id", pa.string()),
+        ("comment_id", pa.string()),
+        ("body", pa.string()),
+        ("start", pa.int64()),
+        ("offset", pa.int64()),
+        ("label", pa.string()),
+        ("extracted_from", pa.string()),
+    ]
+)
+COMMENT_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("status", pa.string()),
+        ("body", pa.string()),
+        ("asset_id", pa.string()),
+        ("asset_url", pa.string()),
+        ("author_id", pa.string()),
+        ("username", pa.string()),
+        ("created_at", pa.timestamp("us")),
+        ("last_updated_at", pa.timestamp("us")),
+        ("mentions", pa.list_(MENTION_TYPE)),
+        ("media_house", pa.string()),
+        ("date", pa.string()),
+    ]
+)
+# hive style folders, e.g. 'media_house=br/date=2022-11-30/'
+PARTITIONING = ds.partitioning(
+    pa.schema([("media_house", pa.string()), ("date", pa.string())]), flavor="hive"
+)
+
+
+def _to_row(record: dict[str, Any]) -> dict[str, Any]:
+    """Convert a serialized comment, see 'Comment.as_dict', into a parquet row.
+
+    :param record: serialized comment
+    """
+    row = {name: record.get(name) for name in COMMENT_SCHEMA.names}
+    for name in ("created_at", "last_updated_at"):
+        if isinstance(row[name], str):
+            row[name] = datetime.fromisoformat(row[name])
+
+    row["date"] = row["created_at"].date().isoformat()
+    row["mentions"] = row["mentions"] or []
+    return row
+
+
+def write_comments_parquet(folder: str, records: Iterable[dict[str, Any]]) -> int:
+    """Append comments to a parquet dataset partitioned by media house and day.
+
+    :param folder: root folder of the dataset
+    :param records: serialized comments, see 'Comment.as_dict'
+
+    Returns the number of written comments.
+    """
+    rows = [_to_row(record) for record in records]
+    if not rows:
+        return 0
+
+    table = pa.Table.from_pylist(rows, schema=COMMENT_SCHEMA)
+    ds.write_dataset(
+        table,
+        folder,
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    return len(rows)
+
+
+class ParquetBackupWriter:
+    def __init__(
+        self,
+        folder: str,
+        batch_rows: int = BACKUP_PARQUET_ROWS,
+        max_seconds: int = BACKUP_ROTATE_SECONDS,
+    ) -> None:
+        """Buffer comments and write them as parquet files in batches.
+
+        :param folder: root folder of the dataset
+        :param batch_rows: write a batch after this many comments
+        :param max_seconds: write a batch after this many seconds
+
+        Note: Offers the same interface as 'BackupWriter'. Buffered comments are
+              lost, if the process dies before the batch is written. A background
+              thread writes idle batches on time, too.
+        """
+        self._folder = folder
+        self._batch_rows = batch_rows
+        self._max_seconds = max_seconds
+        self._lock = Lock()
+        self._buffer: list[dict[str, Any]] = []
+        self._started_at = time.monotonic()
+        self._stopped = Event()
+        self._thread: Optional[Thread] = Thread(
+            target=self._tick, name="parquet-backup-writer", daemon=True
+        )
+        self._thread.start()
+
+    @timed("backup")
+    def write(self, record: dict[str, Any]) -> None:
+        """Write a single serialized comment.
+
+        :param record: serialized comment
+        """
+        self.write_many([record])
+
+    def write_many(self, records: Iterable[dict[str, Any]]) -> None:
+        """Write serialized comments.
+
+        :param records: serialized comments
+        """
+        with self._lock:
+            if not self._buffer:
+                self._started_at = time.monotonic()
+
+            self._buffer.extend(_to_row(record) for record in records)
+            if len(self._buffer) >= self._batch_rows:
+                self._write_buffer()
+            else:
+                self._write_if_due()
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered comments, that are not written yet."""
+        return len(self._buffer)
+
+    def flush(self) -> None:
+        """Write all buffered comments."""
+        with self._lock:
+            self._write_buffer()
+
+    def close(self) -> None:
+        """Stop the background thread and write all buffered comments."""
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+        self.flush()
+
+    def _tick(self) -> None:
+        while not self._stopped.wait(TICK_SECONDS):
+            try:
+                with self._lock:
+                    self._write_if_due()
+            except OSError as exc:
+                print(f"Could not write the parquet backup because of: {exc}")
+
+    def _write_if_due(self) -> None:
+        if self._buffer and time.monotonic() - self._started_at >= self._max_seconds:
+            self._write_buffer()
+
+    def _write_buffer(self) -> None:
+        if self._buffer:
+            write_comments_parquet(self._folder, self._buffer)
+            self._buffer = []
+
+
+def _filter(
+    from_: Optional[date], to: Optional[date], media_houses: Optional[list[MediaHouse]]
+) -> Optional[ds.Expression]:
+    """Build a partition filter.
+
+    :param from_: first day to include
+    :param to: last day to include
+    :param media_houses: media houses to include
+    """
+    expression = None
+    conditions = []
+    if from_ is not None:
+        conditions.append(ds.field("date") >= from_.isoformat())
+
+    if to is not None:
+        conditions.append(ds.field("date") <= to.isoformat())
+
+    if media_houses:
+        conditions.append(
+            ds.field("media_house").isin([house.value for house in media_houses])
+        )
+
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    return expression
+
+
+def iter_comment_batches(
+    folder: str,
+    columns: Optional[list[str]] = None,
+    from_: Optional[date] = None,
+    to: Optional[date] = None,
+    media_houses: Optional[list[MediaHouse]] = None,
+    batch_size: int = 10000,
+) -> Iterator[pa.RecordBatch]:
+    """Lazily read comments from a parquet dataset as record batches.
+
+    :param folder: root folder of the dataset
+    :param columns: columns to read, all if None
+    :param from_: first day to include
+    :param to: last day to include
+    :param media_houses: media houses to include, all if None
+    :param batch_size: max number of comments per batch
+
+    Note: Day and media house filters prune whole partition folders, so only the
+          matching files are opened.
+    """
+    dataset = ds.dataset(
+        folder, format="parquet", schema=COMMENT_SCHEMA, partitioning=PARTITIONING
+    )
+    yield from dataset.to_batches(
+        columns=columns,
+        filter=_filter(from_, to, media_houses),
+        batch_size=batch_size,
+    )
+
+
+def iter_comment_dicts(folder: str, **kwargs: Any) -> Iterator[dict[str, Any]]:
+    """Lazily read comments from a parquet dataset as dictionaries.
+
+    :param folder: root folder of the dataset
+    :param kwargs: see 'iter_comment_batches'
+    """
+    for batch in iter_comment_batches(folder, **kwargs):
+        yield from batch.to_pylist()
+
+
+def iter_comments(folder: str, **kwargs: Any) -> Iterator[Comment]:
+    """Lazily read comments from a parquet dataset as (transient) comments.
+
+    :param folder: root folder of the dataset
+    :param kwargs: see 'iter_comment_batches', columns must include 'id'
+    """
+    for record in iter_comment_dicts(folder, **kwargs):
+        yield to_comment(record)
+
+
+def to_comment(record: dict[str, Any]) -> Comment:
+    """Build a comment from a dictionary read from a backup.
+
+    :param record: comment dictionary, missing fields stay empty
+    """
+    fields = {
+        key: value
+        for key, value in record.items()
+        if key in Comment.__table__.columns.keys()
+    }
+    if fields.get("status") is not None:
+        fields["status"] = Status(fields["status"])
+
+    if fields.get("media_house") is not None:
+        fields["media_house"] = MediaHouse(fields["media_house"])
+
+    mentions = [
+        RecognitionResult(**mention) for mention in record.get("mentions") or []
+    ]
+    return Comment(mentions=mentions, **fields)
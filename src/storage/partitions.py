@@ -0,0 +1,359 @@
+from typing import Optional
+from datetime import datetime
+import os
+import re
+
+from sqlalchemy import bindparam, text  # type: ignore
+from sqlalchemy.engine.base import Connection, Engine  # type: ignore
+from sqlalchemy.orm import Session, selectinload  # type: ignore
+from sqlalchemy.schema import CreateColumn  # type: ignore
+
+from src.models import Comment, RecognitionResult, Status
+from src.tools import write_jsonlines_gzip
+
+RETENTION_STATUSES = [Status.NO_MENTIONS, Status.REJECTED]
+# ids per delete statement of archived comments
+DELETE_CHUNK_SIZE = 1000
+PARTITION_NAME = re.compile(r"^(comments|mentions)_(\d{4})_(\d{2})$")
+# partition key per partitioned table
+PARTITION_KEYS = {"comments": "created_at", "mentions": "comment_created_at"}
+
+
+def is_partitioned(conn: Connection, table: str) -> Optional[bool]:
+    """Return, whether a table is partitioned, or None, if it doesn't exist.
+
+    :param conn: db connection
+    :param table: name of the table
+    """
+    exists, partitioned = conn.execute(
+        text(
+            "SELECT to_regclass(:name) IS NOT NULL, EXISTS (SELECT FROM "
+            "pg_partitioned_table WHERE partrelid = to_regclass(:name))"
+        ),
+        {"name": table},
+    ).one()
+    return partitioned if exists else None
+
+
+def create_partitioned_tables(engine: Engine) -> bool:
+    """Create comments and mentions as tables partitioned by month, if missing, and
+    return, whether both are partitioned.
+
+    :param engine: db communication engine
+
+    Note: Postgres requires the partition key in every unique constraint, hence the
+          primary keys include the creation time. Mentions are partitioned by the
+          creation time of their comment, so both tables share partition bounds.
+          Existing, unpartitioned tables are left untouched, they have to be
+          migrated by hand, see 'Partitioning' in the README.
+    """
+    with engine.begin() as conn:
+        unpartitioned = [
+            table for table in PARTITION_KEYS if is_partitioned(conn, table) is False
+        ]
+        if unpartitioned:
+            print(
+                f"Skipping partitioning, because the tables {unpartitioned} exist "
+                "unpartitioned. See 'Partitioning' in the README to migrate them."
+            )
+            return False
+
+        for column in (Comment.__table__.c.status, Comment.__table__.c.media_house):
+            column.type.create(conn, checkfirst=True)
+
+        conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS comments ({_columns(conn, Comment)}, "
+                "PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)"
+            )
+        )
+        conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS mentions "
+                f"({_columns(conn, RecognitionResult)}, "
+                "PRIMARY KEY (id, comment_created_at), "
+                "FOREIGN KEY (comment_id, comment_created_at) "
+                "REFERENCES comments (id, created_at) ON DELETE CASCADE) "
+                "PARTITION BY RANGE (comment_created_at)"
+            )
+        )
+        for table in PARTITION_KEYS:
+            conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {table}_default "
+                    f"PARTITION OF {table} DEFAULT"
+                )
+            )
+
+    return True
+
+
+def _columns(conn: Connection, model: type) -> str:
+    """Render the column definitions of a model.
+
+    :param conn: db connection, defines the sql dialect
+    :param model: orm model
+    """
+    return ", ".join(
+        str(CreateColumn(column).compile(dialect=conn.dialect)).strip()
+        for column in model.__table__.columns
+    )
+
+
+def ensure_partitions(engine: Engine, months_ahead: int) -> None:
+    """Create monthly partitions from the current month on.
+
+    :param engine: db communication engine
+    :param months_ahead: number of future months to create partitions for
+
+    Note: Past months are not created, their rows live in the default partition.
+    """
+    month = month_start(datetime.utcnow())
+    with engine.begin() as conn:
+        for _ in range(months_ahead + 1):
+            name = partition_name("comments", month)
+            if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar():
+                month = add_months(month, 1)
+                continue
+
+            create_month_partitions(conn, month)
+            month = add_months(month, 1)
+
+
+def create_month_partitions(conn: Connection, month: datetime) -> None:
+    """Create the partitions of a month.
+
+    :param conn: db connection within a transaction
+    :param month: first day of the month
+
+    Note: Postgres refuses to create a partition, while the default partition holds
+          rows of its range. Such rows are moved into the new partitions.
+    """
+    upper = add_months(month, 1)
+    bounds = {"lower": month, "upper": upper}
+    for table, key in PARTITION_KEYS.items():
+        conn.execute(
+            text(
+                f"CREATE TEMP TABLE moved_{table} AS SELECT * FROM {table}_default "
+                f"WHERE {key} >= :lower AND {key} < :upper"
+            ),
+            bounds,
+        )
+
+    # mentions first, deleting their comments would cascade to them
+    for table, key in reversed(PARTITION_KEYS.items()):
+        conn.execute(
+            text(
+                f"DELETE FROM {table}_default WHERE {key} >= :lower AND {key} < :upper"
+            ),
+            bounds,
+        )
+
+    for table, key in PARTITION_KEYS.items():
+        conn.execute(
+            text(
+                f"CREATE TABLE {partition_name(table, month)} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+            )
+        )
+        conn.execute(text(f"INSERT INTO {table} SELECT * FROM moved_{table}"))
+        conn.execute(text(f"DROP TABLE moved_{table}"))
+
+
+def list_partitions(conn: Connection, table: str) -> list[tuple[str, datetime]]:
+    """Return name and month of all monthly partitions of a table, oldest first.
+
+    :param conn: db connection
+    :param table: name of the partitioned table
+    """
+    rows = conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :table"
+        ),
+        {"table": table},
+    )
+    partitions = []
+    for (name,) in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, datetime(int(match[2]), int(match[3]), 1)))
+
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def apply_retention(
+    engine: Engine,
+    session: Session,
+    retention_months: int,
+    archive_path: str,
+    statuses: list[Status] = RETENTION_STATUSES,
+) -> tuple[int, int]:
+    """Archive and remove finished comments older than the retention period.
+
+    :param engine: db communication engine
+    :param session: running postgress connection
+    :param retention_months: number of full months to keep
+    :param archive_path: folder to write the compressed archive files to
+    :param statuses: status of comments to archive
+
+    Returns the number of archived comments and dropped partitions.
+
+    Note: Comments with a retention status are written to gzip compressed jsonlines
+          files, one per month and run. Only comments, that were archived and still
+          have a retention status, are removed. Monthly partitions past the retention
+          period are dropped afterwards, the comments in them, that are kept, are moved
+          to the default partition first. Without partitions the comments are deleted.
+    """
+    cutoff = add_months(month_start(datetime.utcnow()), -retention_months)
+    archived = archive_comments(session, cutoff, archive_path, statuses)
+    session.commit()
+    dropped = 0
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            partitions = list_partitions(conn, "comments")
+
+        for name, month in partitions:
+            if add_months(month, 1) <= cutoff:
+                drop_partition(engine, month, archived, statuses)
+                dropped += 1
+
+    # rows of unpartitioned tables or the default partition
+    for start in range(0, len(archived), DELETE_CHUNK_SIZE):
+        chunk = archived[start : start + DELETE_CHUNK_SIZE]
+        ids = session.query(Comment.id).filter(
+            Comment.id.in_(chunk), Comment.status.in_(statuses)
+        )
+        session.query(RecognitionResult).filter(
+            RecognitionResult.comment_id.in_(ids)
+        ).delete(synchronize_session=False)
+        session.query(Comment).filter(
+            Comment.id.in_(chunk), Comment.status.in_(statuses)
+        ).delete(synchronize_session=False)
+
+    session.commit()
+    return len(archived), dropped
+
+
+def archive_comments(
+    session: Session,
+    cutoff: datetime,
+    archive_path: str,
+    statuses: list[Status] = RETENTION_STATUSES,
+    chunk_size: int = 1000,
+) -> list[str]:
+    """Write comments created before a cutoff into monthly archive files and return
+    their ids.
+
+    :param session: running postgress connection
+    :param cutoff: comments created before are archived
+    :param archive_path: folder to write the compressed archive files to
+    :param statuses: status of comments to archive
+    :param chunk_size: number of comments loaded at once
+
+    Note: Each run writes new files, named by month and start of the run, so archives
+          of earlier runs, whose comments were deleted, are never overwritten.
+    """
+    os.makedirs(archive_path, exist_ok=True)
+    run = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    comments = (
+        session.query(Comment)
+        .options(selectinload(Comment.mentions))
+        .filter(Comment.created_at < cutoff, Comment.status.in_(statuses))
+        .order_by(Comment.created_at)
+        .yield_per(chunk_size)
+    )
+    archived: list[str] = []
+    month: Optional[datetime] = None
+    batch: list[dict] = []
+    for comment in comments:
+        comment_month = month_start(comment.created_at)
+        if month is not None and comment_month != month:
+            _write_archive(archive_path, month, run, batch)
+            archived += [line["id"] for line in batch]
+            batch = []
+
+        month = comment_month
+        batch.append(comment.as_dict())
+
+    if month is not None:
+        _write_archive(archive_path, month, run, batch)
+        archived += [line["id"] for line in batch]
+
+    return archived
+
+
+def _write_archive(
+    archive_path: str, month: datetime, run: str, lines: list[dict]
+) -> int:
+    name = f"{partition_name('comments', month)}_{run}.jsonl.gz"
+    return write_jsonlines_gzip(os.path.join(archive_path, name), lines)
+
+
+def drop_partition(
+    engine: Engine,
+    month: datetime,
+    archived: list[str],
+    statuses: list[Status] = RETENTION_STATUSES,
+) -> None:
+    """Drop the partitions of a month and keep all comments, that weren't archived.
+
+    :param engine: db communication engine
+    :param month: first day of the month
+    :param archived: ids of the archived comments
+    :param statuses: status of comments to drop
+
+    Note: Comments are kept, unless they were archived and still have a retention
+          status. The partitions are detached before they are dropped, because the
+          foreign key of mentions depends on the comments partition.
+    """
+    comments = partition_name("comments", month)
+    mentions = partition_name("mentions", month)
+    with engine.begin() as conn:
+        conn.execute(
+            text("CREATE TEMP TABLE archived_ids (id TEXT PRIMARY KEY) ON COMMIT DROP")
+        )
+        if archived:
+            conn.execute(
+                text("INSERT INTO archived_ids VALUES (:id) ON CONFLICT DO NOTHING"),
+                [{"id": id_} for id_ in archived],
+            )
+
+        conn.execute(
+            text(
+                f"CREATE TEMP TABLE kept_comments ON COMMIT DROP AS "
+                f"SELECT * FROM {comments} WHERE status IS NULL "
+                "OR status NOT IN :statuses "
+                "OR id NOT IN (SELECT id FROM archived_ids)"
+            ).bindparams(bindparam("statuses", expanding=True)),
+            {"statuses": [status.name for status in statuses]},
+        )
+        conn.execute(
+            text(
+                f"CREATE TEMP TABLE kept_mentions ON COMMIT DROP AS "
+                f"SELECT {mentions}.* FROM {mentions} "
+                f"JOIN kept_comments ON kept_comments.id = {mentions}.comment_id"
+            )
+        )
+        conn.execute(text(f"ALTER TABLE mentions DETACH PARTITION {mentions}"))
+        conn.execute(text(f"DROP TABLE {mentions}"))
+        conn.execute(text(f"ALTER TABLE comments DETACH PARTITION {comments}"))
+        conn.execute(text(f"DROP TABLE {comments}"))
+        # the month's range is gone, so kept rows land in the default partitions
+        conn.execute(text("INSERT INTO comments SELECT * FROM kept_comments"))
+        conn.execute(text("INSERT INTO mentions SELECT * FROM kept_mentions"))
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_{month.year:04d}_{month.month:02d}"
+
+
+def month_start(timestamp: datetime) -> datetime:
+    return datetime(timestamp.year, timestamp.month, 1)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
@@ -1,14 +1,66 @@
-from typing import Any, Optional, Union
+from typing import Any, Iterator, Optional, Union
+from datetime import datetime, timedelta
+from threading import Lock
+import time
 
+from cachetools import TTLCache  # type: ignore
+from cachetools.keys import hashkey  # type: ignore
 from sqlalchemy.engine.base import Connection, Engine  # type: ignore
-from sqlalchemy.orm import sessionmaker  # type: ignore
+from sqlalchemy.orm import Session, selectinload, sessionmaker  # type: ignore
 from sqlalchemy.exc import IntegrityError, OperationalError  # type: ignore
-from sqlalchemy import create_engine, and_  # type: ignore
+from sqlalchemy.pool import QueuePool  # type: ignore
+from sqlalchemy import create_engine, and_, or_, select, text  # type: ignore
+from sqlalchemy.sql import Select  # type: ignore
 from src.models import BASE, Comment, RecognitionResult, Status, MediaHouse
+from src.metrics import timed
+from src.storage.partitions import create_partitioned_tables, ensure_partitions
+
+# register the status count rollup, the outbox and notifications on every flush
+import src.storage.stats  # noqa: F401
+import src.storage.outbox  # noqa: F401
+import src.storage.notify  # noqa: F401
+from settings import (
+    POSTGRES_POOL_SIZE,
+    POSTGRES_MAX_OVERFLOW,
+    POSTGRES_POOL_TIMEOUT,
+    POSTGRES_POOL_RECYCLE,
+    POSTGRES_POOL_PRE_PING,
+    WORKER_ID,
+    CLAIM_LEASE_SECONDS,
+    LATEST_MENTIONS_CACHE_TTL,
+    POSTGRES_PARTITIONED,
+    PARTITION_MONTHS_AHEAD,
+)
 
 
 SESSION = sessionmaker()
 POSTGRES_ENTRY_TYPES = Union[Comment, RecognitionResult]
+# idempotent statements for schema changes made after the tables were first created
+MIGRATIONS = [
+    "ALTER TABLE comments ADD COLUMN IF NOT EXISTS claimed_by TEXT",
+    "ALTER TABLE comments ADD COLUMN IF NOT EXISTS claimed_until TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS ix_comments_status_claimed_until "
+    "ON comments (status, claimed_until)",
+    "CREATE INDEX IF NOT EXISTS ix_comments_media_house_status_created_at "
+    "ON comments (media_house, status, created_at)",
+    "ALTER TABLE mentions ADD COLUMN IF NOT EXISTS comment_created_at TIMESTAMP",
+    "ALTER TABLE comments ADD COLUMN IF NOT EXISTS model_type TEXT",
+    "ALTER TABLE mentions ADD COLUMN IF NOT EXISTS model_version TEXT",
+    # keyset pagination of replays, see 'iter_postgres_batches'
+    "CREATE INDEX IF NOT EXISTS ix_comments_created_at_id "
+    "ON comments (created_at, id)",
+    # one outbox entry per comment, keeping the delivered or else the first duplicate
+    "DO $$ BEGIN IF to_regclass('ix_outbox_comment_id') IS NULL THEN "
+    "DELETE FROM outbox a USING outbox b WHERE a.comment_id = b.comment_id "
+    "AND (b.delivered_at IS NOT NULL, a.id) > (a.delivered_at IS NOT NULL, b.id); "
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_outbox_comment_id ON outbox (comment_id); "
+    "END IF; END $$",
+]
+LATEST_MENTIONS_CACHE = TTLCache(maxsize=16, ttl=LATEST_MENTIONS_CACHE_TTL)
+LATEST_MENTIONS_LOCK = Lock()
+LATEST_MENTIONS_STATS = {"hits": 0, "misses": 0}
+# incremented by each invalidation, lookups started before don't fill the cache
+LATEST_MENTIONS_GENERATION = 0
 
 
 class PSQLWriter:
@@ -40,7 +92,9 @@ class PSQLWriter:
 
     def __exit__(self, *args: list[Any]) -> None:
         if self._session is not None:
-            self._session.commit()
+            with timed("db_write"):
+                self._session.commit()
+
             self._session.close()
 
     def _purge_table(self) -> None:
@@ -62,9 +116,9 @@ class TableWriter(PSQLWriter):
         """
         if self._session is not None:
             return bool(
-                self._session.query(type(entry))
+                self._session.query(type(entry).id)
                 .filter(type(entry).id == entry.id)
-                .all()
+                .first()
             )
         else:
             raise ValueError("Session not initialized.")
@@ -74,7 +128,12 @@ class TableWriter(PSQLWriter):
 
         :param comment_id
         """
-        result = self._session.query(Comment).filter(Comment.id == comment_id).all()
+        result = (
+            self._session.query(Comment)
+            .options(selectinload(Comment.mentions))
+            .filter(Comment.id == comment_id)
+            .all()
+        )
         if result is None:
             return None
         elif result:
@@ -97,6 +156,41 @@ class TableWriter(PSQLWriter):
         else:
             raise ValueError("Session not initialized.")
 
+    def write_many(self, entries: list[POSTGRES_ENTRY_TYPES]) -> None:
+        """Add entries of one type to current session, skipping those already in db.
+
+        :param entries: entries to add
+
+        Note: Checks the existence of all entries with a single query.
+        """
+        if self._session is None:
+            raise ValueError("Session not initialized.")
+
+        if not entries:
+            return
+
+        type_ = type(entries[0])
+        ids = [entry.id for entry in entries]
+        existing = {
+            id_ for id_, in self._session.query(type_.id).filter(type_.id.in_(ids))
+        }
+        for entry in entries:
+            if entry.id in existing:
+                print(
+                    f"Skipping entry of type {type_} with id {entry.id} because it is already in db."
+                )
+            else:
+                existing.add(entry.id)
+                self._session.add(entry)
+
+    def commit(self) -> None:
+        """Commit the current session, e.g. after a chunk of updates."""
+        if self._session is not None:
+            with timed("db_write"):
+                self._session.commit()
+        else:
+            raise ValueError("Session not initialized.")
+
     def update(self, entry: POSTGRES_ENTRY_TYPES) -> None:
         """Merge entry with current session.
         :param entry: entry to merge
@@ -107,11 +201,109 @@ class TableWriter(PSQLWriter):
             raise ValueError("Session not initialized.")
 
 
-def get_engine(uri: str) -> Engine:
+class CheckoutStats:
+    """Collect the time callers waited for a connection from the pool."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def add(self, wait: float) -> None:
+        """Record a single checkout.
+
+        :param wait: seconds spent waiting for the connection
+        """
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self) -> dict[str, Union[int, float]]:
+        with self._lock:
+            mean_wait = self.total_wait / self.checkouts if self.checkouts else 0.0
+            return dict(
+                checkouts=self.checkouts,
+                total_wait_seconds=round(self.total_wait, 6),
+                mean_wait_seconds=round(mean_wait, 6),
+                max_wait_seconds=round(self.max_wait, 6),
+            )
+
+
+CHECKOUT_STATS = CheckoutStats()
+
+
+class TimedQueuePool(QueuePool):
+    """Queue pool, that records how long each checkout had to wait.
+
+    Note: The stats live on module level, so they survive a recreation of the pool after
+          a connection invalidation.
+    """
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            CHECKOUT_STATS.add(time.perf_counter() - start)
+
+
+def get_engine(
+    uri: str,
+    pool_size: int = POSTGRES_POOL_SIZE,
+    max_overflow: int = POSTGRES_MAX_OVERFLOW,
+    pool_timeout: int = POSTGRES_POOL_TIMEOUT,
+    pool_recycle: int = POSTGRES_POOL_RECYCLE,
+    pool_pre_ping: bool = POSTGRES_POOL_PRE_PING,
+) -> Engine:
     """Create and return a db communication engine.
     :param uri: db ressource identifier
+    :param pool_size: number of connections kept open in the pool
+    :param max_overflow: number of connections allowed on top of the pool size
+    :param pool_timeout: seconds to wait for a free connection before giving up
+    :param pool_recycle: seconds after which a connection is replaced
+    :param pool_pre_ping: test connections for liveness on checkout, if true
+    """
+    return create_engine(
+        uri,
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+    )
+
+
+def get_pool_status(engine: Engine) -> dict[str, Union[int, float]]:
+    """Return usage and checkout wait times of the engine's connection pool.
+
+    :param engine: db communication engine
+    """
+    pool = engine.pool
+    return dict(
+        size=pool.size(),
+        checked_in=pool.checkedin(),
+        checked_out=pool.checkedout(),
+        overflow=pool.overflow(),
+        **CHECKOUT_STATS.as_dict(),
+    )
+
+
+def session_scope(engine: Engine) -> Iterator[Session]:
+    """Yield a session bound to the engine and close it afterwards.
+
+    :param engine: db communication engine
+
+    Note: Meant to be used as FastAPI dependency, which guarantees the cleanup after
+          the request has been answered.
     """
-    return create_engine(uri)
+    session = SESSION(bind=engine)
+    try:
+        yield session
+    finally:
+        session.close()
 
 
 def get_connection(engine: Engine) -> Connection:
@@ -128,7 +320,31 @@ def get_connection(engine: Engine) -> Connection:
 
 def create_tables(engine) -> None:
     """Create database tables."""
+    partitioned = (
+        POSTGRES_PARTITIONED
+        and engine.dialect.name == "postgresql"
+        and create_partitioned_tables(engine)
+    )
     BASE.metadata.create_all(engine)
+    migrate(engine)
+    if partitioned:
+        ensure_partitions(engine, PARTITION_MONTHS_AHEAD)
+
+
+def migrate(engine: Engine, statements: list[str] = MIGRATIONS) -> None:
+    """Apply schema changes to existing tables.
+
+    :param engine: db communication engine
+    :param statements: idempotent ddl statements
+
+    Note: Statements are postgres specific and skipped for other dialects.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
 
 
 def get_unpublished(session) -> list[Comment]:
@@ -138,19 +354,153 @@ def get_unpublished(session) -> list[Comment]:
     """
     return (
         session.query(Comment)
-        .join(RecognitionResult)
-        .filter(Comment.status == Status.TO_BE_PUBLISHED)
+        .options(selectinload(Comment.mentions))
+        .filter(Comment.status == Status.TO_BE_PUBLISHED, Comment.mentions.any())
         .order_by(Comment.created_at.desc())
         .all()
     )
 
 
-def get_unprocessed(session) -> list[Comment]:
-    """Query the database for comments that are unprocessed by extraction model.
+def get_unprocessed_chunks(
+    session,
+    chunk_size: int,
+    max_rows: Optional[int] = None,
+    worker_id: str = WORKER_ID,
+    lease_seconds: int = CLAIM_LEASE_SECONDS,
+) -> Iterator[list[Comment]]:
+    """Claim and yield unprocessed comments in chunks, oldest first.
 
     :param session: running postgress connection
+    :param chunk_size: max number of comments per chunk
+    :param max_rows: max number of comments to yield in total, unlimited if None
+    :param worker_id: identifier of the claiming worker
+    :param lease_seconds: seconds until a claim expires
+
+    Note: Each chunk is claimed for this worker, so concurrent workers split the backlog
+          and a claimed comment is not fetched twice. The caller is expected to change
+          the status, release the claim and commit between chunks.
     """
-    return session.query(Comment).filter(Comment.status == Status.TO_BE_PROCESSED).all()
+    yielded = 0
+    while max_rows is None or yielded < max_rows:
+        limit = chunk_size if max_rows is None else min(chunk_size, max_rows - yielded)
+        chunk = claim_comments(
+            session,
+            Status.TO_BE_PROCESSED,
+            limit,
+            worker_id=worker_id,
+            lease_seconds=lease_seconds,
+        )
+        if not chunk:
+            return
+
+        yielded += len(chunk)
+        yield chunk
+
+
+def claim_unpublished(
+    session,
+    limit: Optional[int] = None,
+    worker_id: str = WORKER_ID,
+    lease_seconds: int = CLAIM_LEASE_SECONDS,
+) -> list[Comment]:
+    """Claim comments with mentions, that are ready to be published, newest first.
+
+    :param session: running postgress connection
+    :param limit: max number of comments to claim, unlimited if None
+    :param worker_id: identifier of the claiming worker
+    :param lease_seconds: seconds until a claim expires
+    """
+    return claim_comments(
+        session,
+        Status.TO_BE_PUBLISHED,
+        limit,
+        worker_id=worker_id,
+        lease_seconds=lease_seconds,
+        with_mentions=True,
+        newest_first=True,
+    )
+
+
+def claim_comments(
+    session,
+    status: Status,
+    limit: Optional[int],
+    worker_id: str = WORKER_ID,
+    lease_seconds: int = CLAIM_LEASE_SECONDS,
+    with_mentions: bool = False,
+    newest_first: bool = False,
+    ids: Optional[list[str]] = None,
+    created_after: Optional[datetime] = None,
+) -> list[Comment]:
+    """Claim comments with a status for a worker and return them.
+
+    :param session: running postgress connection
+    :param status: status of the comments to claim
+    :param limit: max number of comments to claim, unlimited if None
+    :param worker_id: identifier of the claiming worker
+    :param lease_seconds: seconds until a claim expires
+    :param with_mentions: only claim comments with at least one mention, if true
+    :param newest_first: claim the newest comments first, if true
+    :param ids: only claim comments with these ids, if given
+    :param created_after: only claim comments created at or after this time, if given,
+                          which skips older partitions of partitioned tables
+
+    Note: Rows are selected with 'FOR UPDATE SKIP LOCKED', so concurrent workers never
+          wait for or claim the same rows. Comments with an expired claim, e.g. of a
+          crashed worker, can be claimed again. The claim is committed right away.
+    """
+    now = datetime.utcnow()
+    created_at = Comment.created_at.desc() if newest_first else Comment.created_at
+    query = session.query(Comment.id).filter(
+        Comment.status == status,
+        or_(Comment.claimed_until.is_(None), Comment.claimed_until < now),
+    )
+    if with_mentions:
+        query = query.filter(Comment.mentions.any())
+
+    if ids is not None:
+        query = query.filter(Comment.id.in_(ids))
+
+    if created_after is not None:
+        query = query.filter(Comment.created_at >= created_after)
+
+    ids = [
+        id_
+        for id_, in query.order_by(created_at, Comment.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ]
+    if ids:
+        session.query(Comment).filter(Comment.id.in_(ids)).update(
+            {
+                Comment.claimed_by: worker_id,
+                Comment.claimed_until: now + timedelta(seconds=lease_seconds),
+            },
+            synchronize_session=False,
+        )
+
+    session.commit()
+    if not ids:
+        return []
+
+    # mentions are loaded along, because callers assign or serialize them
+    return (
+        session.query(Comment)
+        .options(selectinload(Comment.mentions))
+        .filter(Comment.id.in_(ids))
+        .order_by(created_at, Comment.id)
+        .all()
+    )
+
+
+def release_claims(comments: list[Comment]) -> None:
+    """Release the claims of comments, changes need to be written by the caller.
+
+    :param comments: claimed comments
+    """
+    for comment in comments:
+        comment.claimed_by = None
+        comment.claimed_until = None
 
 
 def get_latest_mentions(session, max_: int = 4) -> list[Optional[dict]]:
@@ -158,19 +508,73 @@ def get_latest_mentions(session, max_: int = 4) -> list[Optional[dict]]:
 
     :param session: running postgress connection
     :param max_: max number of comments to return
+
+    Note: Results are cached for 'LATEST_MENTIONS_CACHE_TTL' seconds. The cache is per
+          process, so accepting or unaccepting a comment notifies
+          'LATEST_MENTIONS_CHANNEL' on commit, whose listeners call
+          'invalidate_latest_mentions'. Without a listener, e.g. on sqlite, the ttl
+          bounds how stale the results get.
     """
-    comments = (
-        session.query(Comment)
-        .join(RecognitionResult)
+    cached, generation = lookup_latest_mentions(max_)
+    if cached is not None:
+        return cached
+
+    rows = session.execute(latest_mentions_statement(max_)).all()
+    latest_mentions = [
+        {"id": id_, "text": body, "timestamp": last_updated_at}
+        for id_, body, last_updated_at in rows
+    ]
+    store_latest_mentions(max_, generation, latest_mentions)
+    return latest_mentions
+
+
+def lookup_latest_mentions(max_: int) -> tuple[Optional[list[Optional[dict]]], int]:
+    """Return the cached latest mentions or None and the generation of the cache.
+
+    :param max_: max number of comments
+    """
+    with LATEST_MENTIONS_LOCK:
+        cached = LATEST_MENTIONS_CACHE.get(hashkey(max_))
+        LATEST_MENTIONS_STATS["misses" if cached is None else "hits"] += 1
+        return cached, LATEST_MENTIONS_GENERATION
+
+
+def store_latest_mentions(
+    max_: int, generation: int, latest_mentions: list[Optional[dict]]
+) -> None:
+    """Cache latest mentions, unless the cache was invalidated since their lookup.
+
+    :param max_: max number of comments
+    :param generation: generation returned by 'lookup_latest_mentions'
+    :param latest_mentions: queried latest mentions
+    """
+    with LATEST_MENTIONS_LOCK:
+        if generation == LATEST_MENTIONS_GENERATION:
+            LATEST_MENTIONS_CACHE[hashkey(max_)] = latest_mentions
+
+
+def latest_mentions_statement(max_: int) -> Select:
+    """Select id, text and update time of the latest, approved comments with mentions.
+
+    :param max_: max number of comments to select
+    """
+    return (
+        select(Comment.id, Comment.body, Comment.last_updated_at)
         .filter(
             and_(
-                Comment.status == Status.ACCEPTED, Comment.media_house == MediaHouse.BR
+                Comment.status == Status.ACCEPTED,
+                Comment.media_house == MediaHouse.BR,
+                Comment.mentions.any(),
             )
         )
         .order_by(Comment.created_at.desc())
-        .all()
+        .limit(max_)
     )
-    return [
-        {"id": comment.id, "text": comment.body, "timestamp": comment.last_updated_at}
-        for comment in comments[:max_]
-    ]
+
+
+def invalidate_latest_mentions() -> None:
+    """Drop all cached latest mentions, also those of lookups still running."""
+    global LATEST_MENTIONS_GENERATION
+    with LATEST_MENTIONS_LOCK:
+        LATEST_MENTIONS_GENERATION += 1
+        LATEST_MENTIONS_CACHE.clear()
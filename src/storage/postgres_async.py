@@ -0,0 +1,124 @@
+from typing import Any, Optional
+
+from sqlalchemy import select  # type: ignore
+from sqlalchemy.ext.asyncio import (  # type: ignore
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
+from sqlalchemy.orm import selectinload, sessionmaker  # type: ignore
+
+from src.models import Comment
+from src.storage.postgres import (
+    POSTGRES_ENTRY_TYPES,
+    latest_mentions_statement,
+    lookup_latest_mentions,
+    store_latest_mentions,
+)
+from settings import (
+    POSTGRES_POOL_SIZE,
+    POSTGRES_MAX_OVERFLOW,
+    POSTGRES_POOL_TIMEOUT,
+    POSTGRES_POOL_RECYCLE,
+    POSTGRES_POOL_PRE_PING,
+)
+
+ASYNC_SESSION = sessionmaker(class_=AsyncSession, expire_on_commit=False)
+
+
+class AsyncTableWriter:
+    def __init__(
+        self, engine: AsyncEngine, session: Optional[AsyncSession] = None
+    ) -> None:
+        """Write items to db without blocking the event loop.
+
+        :param engine: async db communication engine
+        :param session: async db session
+        """
+        self._engine = engine
+        self._session = session
+
+    async def __aenter__(self) -> "AsyncTableWriter":
+        if not self._session:
+            self._session = ASYNC_SESSION(bind=self._engine)
+
+        return self
+
+    async def __aexit__(self, *args: list[Any]) -> None:
+        if self._session is not None:
+            await self._session.commit()
+            await self._session.close()
+
+    async def get_comment(self, comment_id: str) -> Optional[Comment]:
+        """Find comment by id in database and return if found.
+
+        :param comment_id
+        """
+        if self._session is not None:
+            result = await self._session.execute(
+                select(Comment)
+                .options(selectinload(Comment.mentions))
+                .filter(Comment.id == comment_id)
+            )
+            return result.scalars().first()
+        else:
+            raise ValueError("Session not initialized.")
+
+    async def update(self, entry: POSTGRES_ENTRY_TYPES) -> None:
+        """Merge entry with current session.
+        :param entry: entry to merge
+        """
+        if self._session is not None:
+            await self._session.merge(entry)
+        else:
+            raise ValueError("Session not initialized.")
+
+
+def get_async_engine(
+    uri: str,
+    pool_size: int = POSTGRES_POOL_SIZE,
+    max_overflow: int = POSTGRES_MAX_OVERFLOW,
+    pool_timeout: int = POSTGRES_POOL_TIMEOUT,
+    pool_recycle: int = POSTGRES_POOL_RECYCLE,
+    pool_pre_ping: bool = POSTGRES_POOL_PRE_PING,
+) -> AsyncEngine:
+    """Create and return an async db communication engine.
+    :param uri: db ressource identifier with async driver, e.g. 'postgresql+asyncpg'
+    :param pool_size: number of connections kept open in the pool
+    :param max_overflow: number of connections allowed on top of the pool size
+    :param pool_timeout: seconds to wait for a free connection before giving up
+    :param pool_recycle: seconds after which a connection is replaced
+    :param pool_pre_ping: test connections for liveness on checkout, if true
+    """
+    return create_async_engine(
+        uri,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+    )
+
+
+async def get_latest_mentions(
+    session: AsyncSession, max_: int = 4
+) -> list[Optional[dict]]:
+    """Get latest, approved comments with mentions.
+
+    :param session: running async postgress connection
+    :param max_: max number of comments to return
+
+    Note: Shares the cache with the sync variant, so 'invalidate_latest_mentions'
+          applies to both.
+    """
+    cached, generation = lookup_latest_mentions(max_)
+    if cached is not None:
+        return cached
+
+    result = await session.execute(latest_mentions_statement(max_))
+    latest_mentions = [
+        {"id": id_, "text": body, "timestamp": last_updated_at}
+        for id_, body, last_updated_at in result.all()
+    ]
+    store_latest_mentions(max_, generation, latest_mentions)
+    return latest_mentions
@@ -0,0 +1,176 @@
+from typing import Any, Optional, Union
+from collections import Counter
+from datetime import date
+
+from sqlalchemy import event, func, insert, literal, select  # type: ignore
+from sqlalchemy.dialects import postgresql, sqlite  # type: ignore
+from sqlalchemy.orm import Session  # type: ignore
+from sqlalchemy.orm.attributes import get_history  # type: ignore
+
+from src.models import Comment, MediaHouse, Status, StatusCount
+
+STATUS_COUNT_KEY = tuple[date, MediaHouse, Status, str]
+UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _key(
+    comment: Comment, status: Status, model_type: Optional[str]
+) -> STATUS_COUNT_KEY:
+    return (comment.created_at.date(), comment.media_house, status, model_type or "")
+
+
+def _previous(comment: Comment, attribute: str) -> Any:
+    """Return the value of an attribute before the pending change.
+
+    :param comment: comment with pending changes
+    :param attribute: name of the attribute
+    """
+    history = get_history(comment, attribute)
+    if history.deleted:
+        return history.deleted[0]
+    elif history.unchanged:
+        return history.unchanged[0]
+    else:
+        return None
+
+
+def get_status_deltas(session: Session) -> Counter:
+    """Collect how the pending changes of a session shift the status counts.
+
+    :param session: session about to be flushed
+    """
+    deltas: Counter = Counter()
+    for comment in session.new:
+        if isinstance(comment, Comment) and comment.status is not None:
+            deltas[_key(comment, comment.status, comment.model_type)] += 1
+
+    for comment in session.dirty:
+        if not isinstance(comment, Comment):
+            continue
+
+        status = get_history(comment, "status")
+        model_type = get_history(comment, "model_type")
+        if not (status.has_changes() or model_type.has_changes()):
+            continue
+
+        previous_status = _previous(comment, "status")
+        if previous_status is not None:
+            previous_model_type = _previous(comment, "model_type")
+            deltas[_key(comment, previous_status, previous_model_type)] -= 1
+
+        if comment.status is not None:
+            deltas[_key(comment, comment.status, comment.model_type)] += 1
+
+    return deltas
+
+
+def update_status_counts(session: Session, flush_context: Any, instances: Any) -> None:
+    """Apply the status changes of a flush to the status count rollup.
+
+    Note: Registered for all sessions, so comments written by 'TableWriter' and
+          'AsyncTableWriter' keep the rollup up to date within the same transaction.
+          Bulk updates and deletes bypass the rollup.
+    """
+    deltas = {key: delta for key, delta in get_status_deltas(session).items() if delta}
+    if not deltas:
+        return
+
+    upsert = UPSERTS[session.get_bind().dialect.name]
+    for (day, media_house, status, model_type), delta in deltas.items():
+        stmt = upsert(StatusCount).values(
+            day=day,
+            media_house=media_house,
+            status=status,
+            model_type=model_type,
+            count=delta,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["day", "media_house", "status", "model_type"],
+            set_={"count": StatusCount.count + stmt.excluded.count},
+        )
+        session.execute(stmt)
+
+
+event.listen(Session, "before_flush", update_status_counts)
+
+
+def rebuild_status_counts(session: Session) -> int:
+    """Recompute the status count rollup from the comments table.
+
+    :param session: running postgress connection
+
+    Returns the number of rollup rows.
+
+    Note: Only the days, that still have comments, are recomputed. Retention archives
+          and deletes comments by creation time, so the rows of older days are the
+          only counts left of them and are kept.
+    """
+    day = func.date(Comment.created_at)
+    model_type = func.coalesce(Comment.model_type, literal(""))
+    counts = (
+        session.query(
+            day, Comment.media_house, Comment.status, model_type, func.count()
+        )
+        .filter(Comment.status.isnot(None), Comment.created_at.isnot(None))
+        .group_by(day, Comment.media_house, Comment.status, model_type)
+    )
+    days = select(day).where(Comment.created_at.isnot(None)).distinct()
+    session.query(StatusCount).filter(StatusCount.day.in_(days)).delete(
+        synchronize_session=False
+    )
+    session.execute(
+        insert(StatusCount).from_select(
+            ["day", "media_house", "status", "model_type", "count"], counts
+        )
+    )
+    session.commit()
+    return session.query(StatusCount).count()
+
+
+def get_status_counts(
+    session: Session,
+    from_: date,
+    to: date,
+    media_house: Optional[MediaHouse] = None,
+) -> list[StatusCount]:
+    """Return the rollup rows within a date range.
+
+    :param session: running postgress connection
+    :param from_: first day to include
+    :param to: last day to include
+    :param media_house: only return counts of this media house, all if None
+    """
+    query = session.query(StatusCount).filter(
+        StatusCount.day >= from_, StatusCount.day <= to, StatusCount.count != 0
+    )
+    if media_house is not None:
+        query = query.filter(StatusCount.media_house == media_house)
+
+    return query.order_by(StatusCount.day, StatusCount.media_house).all()
+
+
+def get_feedback_rates(
+    counts: list[StatusCount],
+) -> dict[str, dict[str, Union[int, float]]]:
+    """Sum up moderator feedback per media house.
+
+    :param counts: rollup rows
+    """
+    feedback: dict[str, Counter] = {}
+    for count in counts:
+        if count.status in (Status.ACCEPTED, Status.REJECTED):
+            house = feedback.setdefault(count.media_house.value, Counter())
+            house[count.status.value] += count.count
+
+    rates = {}
+    for media_house, house in feedback.items():
+        total = house[Status.ACCEPTED.value] + house[Status.REJECTED.value]
+        rates[media_house] = dict(
+            accepted=house[Status.ACCEPTED.value],
+            rejected=house[Status.REJECTED.value],
+            accept_rate=round(house[Status.ACCEPTED.value] / total, 4)
+            if total
+            else 0.0,
+        )
+
+    return rates
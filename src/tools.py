@@ -1,14 +1,19 @@
-from typing import Any, Optional
+from typing import Any, Iterable, Optional
+import gzip
+import os
 import jsonlines
 import requests
 from requests.exceptions import JSONDecodeError
-from datetime import datetime, timedelta
 import json
 import re
 from re import Pattern
 
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
 from src.exceptions import PreprocessingError
-from src.models import Comment
 
 
 def normalize_query_pattern(query: str, comment_id: str) -> str:
@@ -37,6 +42,39 @@ def write_jsonlines_to_bucket(path: str, lines: list[dict]) -> None:
             handle.write(line)
 
 
+def write_jsonlines_gzip(path: str, lines: Iterable[dict]) -> int:
+    """Stream dictionaries into a gzip compressed jsonlines file and return their count.
+
+    :param path: path of the file to write
+    :param lines: content to write to file
+
+    Note: The file is written next to its destination and renamed afterwards, so readers
+          never see a partial file.
+    """
+    count = 0
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wb") as handle:
+        for line in lines:
+            handle.write(dumps_line(line))
+            count += 1
+
+    os.replace(tmp_path, path)
+    return count
+
+
+def dumps_line(obj: Any) -> bytes:
+    """Serialize an object to a utf-8 encoded json line.
+
+    :param obj: object to serialize
+
+    Note: Uses 'orjson' if available, which is several times faster than the stdlib.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_APPEND_NEWLINE)
+
+    return (json.dumps(obj, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
 def read_jsonlines(path: str) -> list[dict]:
     """Read jsonlines from file.
 
@@ -52,6 +90,7 @@ def request(
     body: Optional[dict[str, Any]] = None,
     method: str = "Post",
     headers: Optional[dict[str, str]] = None,
+    session: Optional[requests.Session] = None,
 ) -> dict:
     """Request a given url.
 
@@ -60,33 +99,14 @@ def request(
     :param body: request body
     :param method: request type
     :param headers: header object
+    :param session: http session to reuse connections from, none if None
     """
     headers = headers or {}
     headers.update({"content-type": "application/json"})
-    response = requests.request(method, url, json=body, params=params, headers=headers)
+    send = session.request if session is not None else requests.request
+    response = send(method, url, json=body, params=params, headers=headers)
     response.raise_for_status()
     try:
         return response.json()
     except JSONDecodeError:
         return {}
-
-
-def check_expiration_time(
-    comments: list[Comment], lookback_minutes: int
-) -> list[Comment]:
-    """Filter all comments older than a lookback time.
-
-    :param comments: list of comments to filter
-    :param lookback_minutes: number of minutes to look back in time from now
-
-    Note: Filter criteria is the timestamp 'created_at' because 'last_updated_at' by hold alot of comments updated
-          the same second.
-    """
-    filtered_ = []
-    now = datetime.utcnow()
-    not_older_than = now - timedelta(minutes=lookback_minutes)
-    for comment in comments:
-        if comment.created_at >= not_older_than:
-            filtered_.append(comment)
-
-    return filtered_
@@ -0,0 +1,191 @@
+from typing import Optional
+from asyncio import AbstractEventLoop, run_coroutine_threadsafe
+from concurrent.futures import wait
+import threading
+import time
+
+from sqlalchemy import text  # type: ignore
+from sqlalchemy.engine import Engine  # type: ignore
+from sqlalchemy.ext.asyncio import AsyncEngine  # type: ignore
+
+from src.finder import get_model, warm_up_model
+from src.inference import INFERENCE_EXECUTOR
+from src.metrics import READY, WARMUP_SECONDS
+from src.models import ModelType
+from settings import FIND_MENTIONS_BATCH_SIZE, WARMUP_RETRY_SECONDS, WARMUP_ROUNDS
+
+# comments like the ones the api sees, short and long, with and without mentions
+WARMUP_TEXTS = [
+    "Danke für den Beitrag!",
+    "Liebe Redaktion, warum wird über dieses Thema so wenig berichtet?",
+    "@BR24 Könnt ihr bitte die Quelle für die Zahlen im Artikel nennen?",
+    "Das sehe ich anders. Die Kosten tragen am Ende wieder die Steuerzahler und "
+    "niemand in der Politik fühlt sich verantwortlich. Vielleicht sollte die "
+    "Redaktion einmal nachfragen, wer diese Entscheidung getroffen hat und warum "
+    "die Anwohner vorher nicht gefragt wurden.",
+    "Sehr guter Artikel, vielen Dank an das Team für die ausführliche Recherche.",
+    "Im Video ab Minute 3 ist der Ton weg, liebe Redaktion.",
+]
+
+
+class Warmup:
+    """Load and warm up the models and open the db pools in a background thread.
+
+    :param engine: db communication engine
+    :param async_engine: async db engine, its connections are opened on 'loop'
+    :param loop: event loop of the api
+    :param types: model types to warm up
+    :param rounds: number of times the sample texts are run through each model
+    :param retry_seconds: seconds to wait, before a failed warm-up is tried again
+
+    Note: The api reports ready, once the warm-up has finished. Liveness doesn't
+          depend on it, so a slow warm-up doesn't get the pod restarted.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        async_engine: Optional[AsyncEngine] = None,
+        loop: Optional[AbstractEventLoop] = None,
+        types: Optional[list[ModelType]] = None,
+        rounds: int = WARMUP_ROUNDS,
+        retry_seconds: float = WARMUP_RETRY_SECONDS,
+    ):
+        self.engine = engine
+        self.async_engine = async_engine
+        self.loop = loop
+        self.types = types or []
+        self.rounds = rounds
+        self.retry_seconds = retry_seconds
+        self.state = "pending"
+        self.steps: dict[str, float] = {}
+        self.error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        READY.set(0)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start(self) -> None:
+        """Start the warm-up in the background."""
+        self._stop.clear()
+        self.state = "warming"
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Report not ready anymore, e.g. while shutting down.
+
+        :param timeout: seconds to wait for a running warm-up
+        """
+        self.state = "stopping"
+        READY.set(0)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def get_status(self) -> dict:
+        """Return state, step durations in seconds and the last error of the warm-up."""
+        return {"state": self.state, "steps": self.steps, "error": self.error}
+
+    def _step(self, name: str, start: float) -> None:
+        self.steps[name] = time.perf_counter() - start
+        WARMUP_SECONDS.labels(name).set(self.steps[name])
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run()
+            except Exception as exc:
+                self.error = str(exc)
+                print(f"Warm-up failed, retrying in {self.retry_seconds}s: {exc}")
+                self._stop.wait(self.retry_seconds)
+            else:
+                if not self._stop.is_set():
+                    self.state = "ready"
+                    self.error = None
+                    READY.set(1)
+                    print(f"Warm-up finished: {self.steps}")
+
+                return
+
+    def run(self) -> None:
+        """Warm up models and db pools once."""
+        total = time.perf_counter()
+        for type_ in self.types:
+            start = time.perf_counter()
+            get_model(type_)
+            self._step(f"load_{type_.value}", start)
+
+            start = time.perf_counter()
+            for _ in range(self.rounds):
+                # each inference thread runs the samples once
+                futures = [
+                    INFERENCE_EXECUTOR.submit(
+                        None,
+                        warm_up_model,
+                        type_,
+                        WARMUP_TEXTS,
+                        FIND_MENTIONS_BATCH_SIZE,
+                    )
+                    for _ in range(INFERENCE_EXECUTOR.max_workers)
+                ]
+                wait(futures)
+                for future in futures:
+                    future.result()
+
+            self._step(f"warm_{type_.value}", start)
+
+        start = time.perf_counter()
+        open_pool(self.engine)
+        if self.async_engine is not None and self.loop is not None:
+            # asyncpg connections belong to the loop, that opened them
+            future = run_coroutine_threadsafe(
+                open_async_pool(self.async_engine), self.loop
+            )
+            future.result()
+
+        self._step("db_pool", start)
+        self._step("total", total)
+
+
+def open_pool(engine: Engine) -> int:
+    """Open as many connections as the pool keeps and return their number.
+
+    :param engine: db communication engine
+    """
+    size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    connections = []
+    try:
+        for _ in range(size):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+
+    return len(connections)
+
+
+async def open_async_pool(engine: AsyncEngine) -> int:
+    """Open as many connections as the async pool keeps, see 'open_pool'.
+
+    :param engine: async db engine
+    """
+    pool = engine.sync_engine.pool
+    size = pool.size() if hasattr(pool, "size") else 1
+    connections = []
+    try:
+        for _ in range(size):
+            connection = await engine.connect()
+            connections.append(connection)
+            await connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            await connection.close()
+
+    return len(connections)
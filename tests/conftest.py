@@ -0,0 +1,129 @@
+from typing import Any, Callable, Iterator, Optional
+from datetime import datetime
+import os
+import sys
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, event, text  # type: ignore
+from sqlalchemy.engine import Engine, make_url  # type: ignore
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import pipeline  # noqa: E402
+from src.models import Comment, RecognitionResult, Status  # noqa: E402
+from src.storage.postgres import SESSION, create_tables  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path) -> Iterator[Engine]:
+    """Sqlite database with all tables, the postgres specific parts are skipped."""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    create_tables(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine: Engine) -> Iterator:
+    with SESSION(bind=engine) as session:
+        yield session
+
+
+@pytest.fixture
+def new_comment() -> Callable[..., Comment]:
+    """Factory of comments based on 'Comment.dummy'.
+
+    The factory takes the id, status and creation time, which is also the time of the
+    last update, and any other attribute of the comment as keyword.
+    """
+
+    def new_comment(
+        id_: str = "c1",
+        status: Status = Status.TO_BE_PROCESSED,
+        created_at: Optional[datetime] = None,
+        **attributes: Any,
+    ) -> Comment:
+        comment = Comment.dummy()
+        comment.id = id_
+        comment.status = status
+        if created_at is not None:
+            comment.created_at = comment.last_updated_at = created_at
+
+        for name, value in attributes.items():
+            setattr(comment, name, value)
+
+        return comment
+
+    return new_comment
+
+
+def find_redaktion(type_, texts, comment_ids, batch_size=32):
+    return [
+        [RecognitionResult(id=f"m_{id_}", comment_id=id_, body=text, label="MENTION")]
+        if "Redaktion" in text
+        else []
+        for text, id_ in zip(texts, comment_ids)
+    ]
+
+
+@pytest.fixture
+def fake_model(monkeypatch) -> None:
+    """Replace the models of the pipeline, texts with 'Redaktion' have a mention."""
+    monkeypatch.setattr(pipeline, "find_mentions_batch", find_redaktion)
+
+
+@pytest.fixture
+def pg_engine() -> Iterator[Engine]:
+    """Empty postgres database, skipped unless 'TEST_POSTGRES_URI' points to a server.
+
+    Note: The uri needs the rights to create databases, e.g.
+          'postgresql://postgres@localhost/postgres'.
+    """
+    uri = os.environ.get("TEST_POSTGRES_URI")
+    if not uri:
+        pytest.skip("TEST_POSTGRES_URI is not set")
+
+    admin = create_engine(uri, isolation_level="AUTOCOMMIT")
+    name = f"wtwm_test_{uuid.uuid4().hex[:12]}"
+    with admin.connect() as conn:
+        conn.execute(text(f"CREATE DATABASE {name}"))
+
+    engine = create_engine(make_url(uri).set(database=name))
+    yield engine
+    engine.dispose()
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE {name}"))
+    admin.dispose()
+
+
+class StatementCounter:
+    """Count the sql statements an engine executes within a with block."""
+
+    def __init__(self, engine: Engine) -> None:
+        self._engine = engine
+        self.statements: list[str] = []
+
+    def __enter__(self) -> "StatementCounter":
+        self.statements = []
+        event.listen(self._engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        event.remove(self._engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+@pytest.fixture
+def statements(engine: Engine) -> StatementCounter:
+    """Count the statements of the sqlite engine, use as context manager."""
+    return StatementCounter(engine)
@@ -0,0 +1,28 @@
+import jwt
+import pytest
+
+from src.auth import auth_handler
+from src.auth.auth_handler import decodeJWT, signJWT
+
+SECRET = "a-secret-of-at-least-32-bytes-for-hs256"
+
+
+@pytest.fixture(autouse=True)
+def jwt_key(monkeypatch):
+    monkeypatch.setenv("JWT_SECRET", SECRET)
+    monkeypatch.setenv("JWT_ALGORITHM", "HS256")
+    monkeypatch.setattr(auth_handler, "JWT_SECRET", None)
+    monkeypatch.setattr(auth_handler, "JWT_ALGORITHM", None)
+
+
+def test_tokens_are_signed_with_the_secret():
+    token = signJWT("user")["access_token"]
+
+    assert decodeJWT(token)["user_id"] == "user"
+    assert jwt.decode(token, SECRET, algorithms=["HS256"])["user_id"] == "user"
+
+
+def test_tokens_signed_with_the_algorithm_name_are_rejected():
+    token = jwt.encode({"user_id": "user", "expires": 2**40}, "HS256", "HS256")
+
+    assert decodeJWT(token) is None
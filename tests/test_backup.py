@@ -0,0 +1,72 @@
+import gzip
+import os
+import time
+import zlib
+
+import pytest
+
+from src.storage import backup, parquet
+from src.storage.backup import PART_SUFFIX, BackupWriter
+from src.storage.parquet import ParquetBackupWriter, iter_comment_dicts
+
+
+@pytest.fixture(autouse=True)
+def fast_ticks(monkeypatch):
+    monkeypatch.setattr(backup, "TICK_SECONDS", 0.05)
+    monkeypatch.setattr(parquet, "TICK_SECONDS", 0.05)
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+
+    return False
+
+
+def get_files(folder) -> list[str]:
+    return sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+
+
+@pytest.mark.parametrize("in_background", [True, False])
+def test_idle_file_rotates_on_time(tmp_path, in_background):
+    writer = BackupWriter(str(tmp_path), rotate_seconds=1, in_background=in_background)
+    writer.write({"id": "c1"})
+
+    assert wait_for(
+        lambda: get_files(tmp_path) and not get_files(tmp_path)[0].endswith(PART_SUFFIX)
+    )
+    (name,) = get_files(tmp_path)
+    with gzip.open(tmp_path / name) as file:
+        assert file.read() == b'{"id":"c1"}\n'
+    writer.close()
+
+
+def test_idle_file_is_flushed(tmp_path):
+    writer = BackupWriter(str(tmp_path), rotate_seconds=3600, flush_seconds=0)
+    writer.write({"id": "c1"})
+
+    def read_part() -> bytes:
+        files = get_files(tmp_path)
+        if not files:
+            return b""
+        with open(tmp_path / files[0], "rb") as file:
+            # the gzip trailer is missing until the file is finished
+            return zlib.decompressobj(wbits=31).decompress(file.read())
+
+    assert wait_for(lambda: read_part() == b'{"id":"c1"}\n')
+    assert get_files(tmp_path)[0].endswith(PART_SUFFIX)
+    writer.close()
+    assert not get_files(tmp_path)[0].endswith(PART_SUFFIX)
+
+
+def test_idle_parquet_batch_is_written_on_time(tmp_path, new_comment):
+    writer = ParquetBackupWriter(str(tmp_path), batch_rows=100, max_seconds=1)
+    writer.write(new_comment().as_dict())
+
+    assert writer.pending == 1
+    assert wait_for(lambda: writer.pending == 0)
+    assert [row["id"] for row in iter_comment_dicts(str(tmp_path))] == ["c1"]
+    writer.close()
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.models import Comment, Status
+from src.storage.big_query import BigQueryWriter, SQLiteWarehouse, sync_comments
+from src.storage.postgres import claim_comments
+
+TABLE_ID = "comments"
+PROCESSED = Status.TO_BE_PROCESSED.value
+PUBLISHED = Status.TO_BE_PUBLISHED.value
+# out of the lag of the syncs
+BEFORE = datetime.now() - timedelta(hours=1)
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch) -> BigQueryWriter:
+    # the schemas are read relative to the repository
+    monkeypatch.chdir(__file__.rsplit("/tests/", 1)[0])
+    warehouse = SQLiteWarehouse()
+    writer = BigQueryWriter(warehouse, TABLE_ID, str(tmp_path / "sync"))
+    warehouse.create_table(TABLE_ID, writer.schema)
+    return writer
+
+
+def get_statuses(writer: BigQueryWriter) -> dict[str, str]:
+    return {row["id"]: row["status"] for row in writer.client.rows(TABLE_ID)}
+
+
+def test_sync_exports_changes_since_the_last_sync(session, writer, new_comment):
+    session.add_all(
+        [new_comment("c1", created_at=BEFORE), new_comment("c2", created_at=BEFORE)]
+    )
+    session.commit()
+
+    assert sync_comments(session, writer, lag_seconds=0) == 2
+    assert get_statuses(writer) == {"c1": PROCESSED, "c2": PROCESSED}
+
+    # nothing changed since
+    assert sync_comments(session, writer, lag_seconds=0) == 0
+
+    session.get(Comment, "c2").status = Status.TO_BE_PUBLISHED
+    session.commit()
+    assert sync_comments(session, writer, lag_seconds=0) == 1
+    assert get_statuses(writer) == {"c1": PROCESSED, "c2": PUBLISHED}
+
+    assert sync_comments(session, writer, lag_seconds=0) == 0
+
+
+def test_sync_skips_changes_within_the_lag(session, writer, new_comment):
+    session.add(new_comment("c1", created_at=BEFORE))
+    session.commit()
+    assert sync_comments(session, writer, lag_seconds=0) == 1
+
+    session.get(Comment, "c1").status = Status.TO_BE_PUBLISHED
+    session.commit()
+    assert sync_comments(session, writer, lag_seconds=600) == 0
+    assert sync_comments(session, writer, lag_seconds=0) == 1
+    assert get_statuses(writer) == {"c1": PUBLISHED}
+
+
+def test_claims_are_not_exported(session, writer, new_comment):
+    session.add(new_comment("c1", created_at=BEFORE))
+    session.commit()
+    assert sync_comments(session, writer, lag_seconds=0) == 1
+
+    # bulk updates bypass the orm hook, claims aren't part of the export anyway
+    assert len(claim_comments(session, Status.TO_BE_PROCESSED, 1)) == 1
+    assert sync_comments(session, writer, lag_seconds=0) == 0
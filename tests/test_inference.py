@@ -0,0 +1,65 @@
+from threading import Event
+import asyncio
+import time
+
+import pytest
+
+from src.inference import DeadlineExceeded, InferenceExecutor, Overloaded
+
+
+@pytest.fixture
+def executor():
+    executor = InferenceExecutor(max_workers=1, max_queue=1, retry_after=3)
+    yield executor
+    executor.shutdown()
+
+
+def block(event: Event) -> str:
+    event.wait(5)
+    return "done"
+
+
+def test_calls_beyond_workers_and_queue_are_rejected(executor):
+    release = Event()
+    running = executor.submit(None, block, release)
+    queued = executor.submit(None, block, release)
+
+    assert executor.is_full()
+    with pytest.raises(Overloaded) as info:
+        executor.submit(None, block, release)
+    assert info.value.retry_after == 3
+
+    release.set()
+    assert running.result() == queued.result() == "done"
+    assert executor.get_status()["rejected"] == 1
+    assert not executor.is_full()
+
+
+def test_run_sync_gives_up_at_the_deadline(executor):
+    release = Event()
+    with pytest.raises(DeadlineExceeded):
+        executor.run_sync(block, release, timeout=0.1)
+
+    release.set()
+
+
+def test_queued_calls_past_their_deadline_are_dropped(executor):
+    release = Event()
+    called = []
+    executor.submit(None, block, release)
+    queued = executor.submit(time.monotonic() + 0.05, called.append, "queued")
+
+    time.sleep(0.1)
+    release.set()
+    with pytest.raises(DeadlineExceeded):
+        queued.result(5)
+    assert called == []
+    assert executor.get_status()["expired"] == 1
+
+
+def test_run_gives_up_at_the_deadline(executor):
+    release = Event()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(executor.run(block, release, timeout=0.1))
+
+    release.set()
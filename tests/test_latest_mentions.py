@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from src.models import Comment, MediaHouse, RecognitionResult, Status
+from src.storage.notify import (
+    LATEST_MENTIONS_CHANNEL,
+    NotificationListener,
+    get_channels,
+)
+from src.storage import postgres
+from src.storage.postgres import (
+    SESSION,
+    create_tables,
+    get_latest_mentions,
+    invalidate_latest_mentions,
+    lookup_latest_mentions,
+    store_latest_mentions,
+)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    invalidate_latest_mentions()
+    yield
+    invalidate_latest_mentions()
+
+
+@pytest.fixture
+def add_accepted(new_comment):
+    """Store an accepted comment with a mention."""
+
+    def add_accepted(session, id_: str) -> None:
+        session.add(new_comment(id_, Status.ACCEPTED, media_house=MediaHouse.BR))
+        session.flush()
+        session.add(RecognitionResult(id=f"m_{id_}", comment_id=id_, body="Redaktion"))
+        session.commit()
+
+    return add_accepted
+
+
+def test_latest_mentions_are_cached_until_invalidated(session, add_accepted):
+    add_accepted(session, "c1")
+    hits = postgres.LATEST_MENTIONS_STATS["hits"]
+    assert [m["id"] for m in get_latest_mentions(session)] == ["c1"]
+
+    add_accepted(session, "c2")
+    assert [m["id"] for m in get_latest_mentions(session)] == ["c1"]
+    assert postgres.LATEST_MENTIONS_STATS["hits"] == hits + 1
+
+    invalidate_latest_mentions()
+    assert len(get_latest_mentions(session)) == 2
+
+
+def test_lookup_before_invalidation_does_not_fill_cache():
+    cached, generation = lookup_latest_mentions(4)
+    assert cached is None
+
+    invalidate_latest_mentions()
+    store_latest_mentions(4, generation, [{"id": "stale"}])
+
+    assert lookup_latest_mentions(4)[0] is None
+
+
+def test_only_acceptance_changes_notify(session, add_accepted):
+    add_accepted(session, "c1")
+    comment = session.get(Comment, "c1")
+    comment.body = "Liebe BR-Redaktion"
+    assert LATEST_MENTIONS_CHANNEL not in get_channels(session)
+
+    comment.status = Status.REJECTED
+    assert LATEST_MENTIONS_CHANNEL in get_channels(session)
+
+
+def test_feedback_in_another_process_invalidates(pg_engine, add_accepted):
+    create_tables(pg_engine)
+    listener = NotificationListener(
+        pg_engine, {LATEST_MENTIONS_CHANNEL: invalidate_latest_mentions}, timeout=0.1
+    )
+    listener.start()
+    with SESSION(bind=pg_engine) as session:
+        add_accepted(session, "c1")
+        time.sleep(0.5)
+        assert len(get_latest_mentions(session)) == 1
+
+        # e.g. the feedback endpoint of another worker
+        session.get(Comment, "c1").status = Status.REJECTED
+        session.commit()
+        deadline = time.monotonic() + 5
+        while lookup_latest_mentions(4)[0] is not None:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+        assert get_latest_mentions(session) == []
+
+    listener.stop(timeout=5)
@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from src.exceptions import JobLocked
+from src.storage.leader import LeaderElector, get_job_holders, run_exclusive
+
+
+def wait_until_free(engine, name: str, timeout: float = 5.0) -> None:
+    """Closed connections release their locks, once their backend has exited."""
+    deadline = time.monotonic() + timeout
+    while get_job_holders(engine, {name}) != {name: None}:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_second_elector_gets_no_leadership(pg_engine):
+    first = LeaderElector(pg_engine, ["fetch_mdr"], worker_id="replica-1")
+    second = LeaderElector(pg_engine, ["fetch_mdr"], worker_id="replica-2")
+    first._renew()
+    second._renew()
+
+    assert first.is_leader("fetch_mdr")
+    assert not second.is_leader("fetch_mdr")
+    assert get_job_holders(pg_engine, {"fetch_mdr"}) == {"fetch_mdr": "replica-1"}
+
+    # the leadership moves, once the leader is gone
+    first.stop()
+    wait_until_free(pg_engine, "fetch_mdr")
+    second._renew()
+    assert second.is_leader("fetch_mdr")
+
+    second.stop()
+    wait_until_free(pg_engine, "fetch_mdr")
+
+
+def test_run_exclusive_raises_for_held_jobs(pg_engine):
+    with run_exclusive(pg_engine, "ingest", worker_id="replica-1"):
+        with pytest.raises(JobLocked) as info:
+            with run_exclusive(pg_engine, "ingest", worker_id="replica-2"):
+                pass
+
+        assert info.value.holder == "replica-1"
+
+    wait_until_free(pg_engine, "ingest")
+    with run_exclusive(pg_engine, "ingest", worker_id="replica-2"):
+        pass
+
+    wait_until_free(pg_engine, "ingest")
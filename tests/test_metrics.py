@@ -0,0 +1,14 @@
+from src.metrics import register_queue, render_metrics
+
+
+def fail() -> int:
+    raise ConnectionError("database is down")
+
+
+def test_failing_queue_depth_is_nan():
+    register_queue("test_failing", fail)
+    register_queue("test_working", lambda: 3)
+
+    lines = render_metrics()[0].decode().splitlines()
+    assert 'wtwm_queue_depth{queue="test_failing"} NaN' in lines
+    assert 'wtwm_queue_depth{queue="test_working"} 3.0' in lines
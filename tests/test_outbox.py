@@ -0,0 +1,104 @@
+from datetime import datetime
+
+from sqlalchemy import text  # type: ignore
+
+from src.models import (
+    BASE,
+    Comment,
+    MediaHouse,
+    OutboxEntry,
+    OutboxState,
+    RecognitionResult,
+    Status,
+)
+from src.publisher.worker import OutboxWorker
+from src.storage.notify import TO_BE_PUBLISHED_CHANNEL, get_channels
+from src.storage.outbox import claim_outbox, enqueue_missing, insert_entries, new_entry
+from src.storage.postgres import migrate
+
+
+def get_entries(session) -> list[str]:
+    return [id_ for id_, in session.query(OutboxEntry.comment_id)]
+
+
+def test_publishable_comment_is_enqueued_once(session, new_comment):
+    comment = new_comment("c1", Status.TO_BE_PUBLISHED)
+    session.add(comment)
+    assert TO_BE_PUBLISHED_CHANNEL in get_channels(session)
+    session.add(
+        RecognitionResult(id="m1", comment_id="c1", body="Redaktion", label="MENTION")
+    )
+    session.commit()
+    assert get_entries(session) == ["c1"]
+
+    # e.g. another replica enqueued it meanwhile
+    assert insert_entries(session, [new_entry(comment, datetime.utcnow())]) == 0
+    assert enqueue_missing(session, 60) == 0
+    assert get_entries(session) == ["c1"]
+
+
+def test_enqueue_missing_adds_comments_without_entry(session, new_comment):
+    comment = new_comment("c1", Status.TO_BE_PROCESSED)
+    session.add(comment)
+    session.add(
+        RecognitionResult(id="m1", comment_id="c1", body="Redaktion", label="MENTION")
+    )
+    session.commit()
+    session.query(Comment).update({Comment.status: Status.TO_BE_PUBLISHED})
+    session.commit()
+
+    assert enqueue_missing(session, 60) == 1
+    assert enqueue_missing(session, 60) == 0
+    assert get_entries(session) == ["c1"]
+
+
+class RecordingConnector:
+    """Record, whether the session was in a transaction, while sending."""
+
+    media_house = MediaHouse.TEST
+
+    def __init__(self, session):
+        self.session = session
+        self.in_transaction: list[bool] = []
+
+    def send(self, comments: list[Comment]) -> None:
+        self.in_transaction.append(self.session.in_transaction())
+
+
+def test_publish_sends_outside_of_a_transaction(engine, session, new_comment):
+    session.add(new_comment("c1", Status.TO_BE_PUBLISHED))
+    session.add(
+        RecognitionResult(id="m1", comment_id="c1", body="Redaktion", label="MENTION")
+    )
+    session.commit()
+    worker = OutboxWorker(engine, http_session=None)
+    connector = worker.connectors[MediaHouse.TEST] = RecordingConnector(session)
+
+    entries = claim_outbox(session, 10, 60, 60)
+    assert worker._publish(session, entries) == 1
+    assert connector.in_transaction == [False]
+
+    session.expire_all()
+    assert session.get(Comment, "c1").status == Status.WAIT_FOR_EVALUATION
+    assert session.query(OutboxEntry.state).scalar() == OutboxState.DELIVERED
+
+
+def test_migration_removes_duplicates(pg_engine):
+    BASE.metadata.create_all(pg_engine)
+    with pg_engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_outbox_comment_id"))
+        conn.execute(
+            text(
+                "INSERT INTO outbox (id, comment_id, attempts, delivered_at) VALUES "
+                "(1, 'c1', 0, NULL), (2, 'c1', 1, now()), (3, 'c1', 0, NULL), "
+                "(4, 'c2', 0, NULL), (5, 'c2', 0, NULL)"
+            )
+        )
+
+    migrate(pg_engine)
+    migrate(pg_engine)
+
+    with pg_engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, comment_id FROM outbox ORDER BY id"))
+        assert rows.all() == [(2, "c1"), (4, "c2")]
+        assert conn.execute(text("SELECT to_regclass('ix_outbox_comment_id')")).scalar()
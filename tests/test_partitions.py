@@ -0,0 +1,189 @@
+from datetime import datetime
+import gzip
+import json
+import os
+
+from sqlalchemy import text  # type: ignore
+
+from src.models import BASE, Comment, RecognitionResult, Status
+from src.storage.partitions import (
+    PARTITION_KEYS,
+    add_months,
+    apply_retention,
+    create_partitioned_tables,
+    drop_partition,
+    ensure_partitions,
+    is_partitioned,
+    month_start,
+    partition_name,
+)
+from src.storage import postgres
+from src.storage.postgres import SESSION, create_tables
+
+OLD = datetime(2020, 3, 5)
+
+
+def new_mention(id_: str, comment: Comment) -> RecognitionResult:
+    return RecognitionResult(
+        id=id_,
+        comment_id=comment.id,
+        comment_created_at=comment.created_at,
+        body="Redaktion",
+    )
+
+
+def read_archives(folder) -> dict[str, list[str]]:
+    archives = {}
+    for name in sorted(os.listdir(folder)):
+        with gzip.open(folder / name) as file:
+            archives[name] = [json.loads(line)["id"] for line in file]
+
+    return archives
+
+
+def test_retention_never_overwrites_archives(engine, session, tmp_path, new_comment):
+    folder = tmp_path / "archive"
+    session.add_all(
+        [
+            new_comment("rejected", Status.REJECTED, OLD),
+            new_comment("accepted", Status.ACCEPTED, OLD),
+        ]
+    )
+    session.commit()
+
+    assert apply_retention(engine, session, 1, str(folder)) == (1, 0)
+    first = read_archives(folder)
+    assert list(first.values()) == [["rejected"]]
+    assert [id_ for (id_,) in session.query(Comment.id)] == ["accepted"]
+
+    # a kept comment gets a retention status later
+    session.query(Comment).filter(
+        Comment.id == "accepted"
+    ).one().status = Status.REJECTED
+    session.commit()
+    assert apply_retention(engine, session, 1, str(folder)) == (1, 0)
+
+    archives = read_archives(folder)
+    assert len(archives) == 2
+    assert sorted(sum(archives.values(), [])) == ["accepted", "rejected"]
+    assert session.query(Comment).count() == 0
+
+
+def create_partitioned(engine, month: datetime) -> None:
+    create_partitioned_tables(engine)
+    BASE.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for table in PARTITION_KEYS:
+            conn.execute(
+                text(
+                    f"CREATE TABLE {partition_name(table, month)} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') "
+                    f"TO ('{add_months(month, 1).isoformat()}')"
+                )
+            )
+
+
+def get_rows(engine, table: str) -> dict[str, str]:
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT id, tableoid::regclass FROM {table}"))
+        return {id_: str(partition) for id_, partition in rows}
+
+
+def test_drop_partition_keeps_comments_not_archived(pg_engine, new_comment):
+    month = month_start(OLD)
+    create_partitioned(pg_engine, month)
+    with SESSION(bind=pg_engine) as session:
+        comments = [
+            new_comment("archived", Status.REJECTED, OLD),
+            new_comment("rejected_later", Status.REJECTED, OLD),
+            new_comment("accepted", Status.ACCEPTED, OLD),
+        ]
+        session.add_all(comments)
+        session.flush()
+        session.add_all([new_mention(f"m_{c.id}", c) for c in comments])
+        session.commit()
+
+    drop_partition(pg_engine, month, ["archived"])
+
+    assert get_rows(pg_engine, "comments") == {
+        "rejected_later": "comments_default",
+        "accepted": "comments_default",
+    }
+    assert get_rows(pg_engine, "mentions") == {
+        "m_rejected_later": "mentions_default",
+        "m_accepted": "mentions_default",
+    }
+
+
+def test_ensure_partitions_moves_rows_of_default_partition(pg_engine, new_comment):
+    create_partitioned_tables(pg_engine)
+    BASE.metadata.create_all(pg_engine)
+    now = datetime.utcnow()
+    with SESSION(bind=pg_engine) as session:
+        comment = new_comment("current", Status.TO_BE_PROCESSED, now)
+        session.add(comment)
+        session.flush()
+        session.add(new_mention("m_current", comment))
+        session.commit()
+
+    ensure_partitions(pg_engine, 1)
+    ensure_partitions(pg_engine, 1)
+
+    month = month_start(now)
+    assert get_rows(pg_engine, "comments") == {
+        "current": partition_name("comments", month)
+    }
+    assert get_rows(pg_engine, "mentions") == {
+        "m_current": partition_name("mentions", month)
+    }
+
+
+MIGRATION = [
+    "CREATE SCHEMA unpartitioned",
+    "ALTER TABLE comments SET SCHEMA unpartitioned",
+    "ALTER TABLE mentions SET SCHEMA unpartitioned",
+]
+COPY = [
+    "INSERT INTO comments (id, status, body, asset_id, asset_url, author_id, "
+    "username, created_at, note, last_updated_at, media_house, claimed_by, "
+    "claimed_until, model_type) "
+    "SELECT id, status, body, asset_id, asset_url, author_id, username, created_at, "
+    "note, last_updated_at, media_house, claimed_by, claimed_until, model_type "
+    "FROM unpartitioned.comments",
+    'INSERT INTO mentions (id, comment_id, body, start, "offset", label, '
+    "extracted_from, comment_created_at, model_version) "
+    'SELECT m.id, m.comment_id, m.body, m.start, m."offset", m.label, '
+    "m.extracted_from, c.created_at, m.model_version FROM unpartitioned.mentions m "
+    "JOIN unpartitioned.comments c ON c.id = m.comment_id",
+]
+
+
+def test_unpartitioned_tables_are_skipped_and_migrated(
+    pg_engine, monkeypatch, new_comment
+):
+    create_tables(pg_engine)
+    with SESSION(bind=pg_engine) as session:
+        comment = new_comment("old", Status.ACCEPTED, OLD)
+        session.add(comment)
+        session.flush()
+        session.add(new_mention("m_old", comment))
+        session.commit()
+
+    monkeypatch.setattr(postgres, "POSTGRES_PARTITIONED", True)
+    create_tables(pg_engine)
+    with pg_engine.connect() as conn:
+        assert not is_partitioned(conn, "comments")
+
+    # the migration of the readme
+    with pg_engine.begin() as conn:
+        for statement in MIGRATION:
+            conn.execute(text(statement))
+    create_tables(pg_engine)
+    with pg_engine.begin() as conn:
+        for statement in COPY:
+            conn.execute(text(statement))
+
+    with pg_engine.connect() as conn:
+        assert is_partitioned(conn, "comments") and is_partitioned(conn, "mentions")
+    assert get_rows(pg_engine, "comments") == {"old": "comments_default"}
+    assert get_rows(pg_engine, "mentions") == {"m_old": "mentions_default"}
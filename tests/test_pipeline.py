@@ -0,0 +1,50 @@
+from threading import Event
+
+from src.inference import InferenceExecutor
+from src.models import Comment, Status
+from src.pipeline import process_backlog
+
+
+def get_statuses(session) -> dict[str, Status]:
+    session.expire_all()
+    return {c.id: c.status for c in session.query(Comment)}
+
+
+def test_backlog_is_classified_chunk_by_chunk(engine, session, new_comment, fake_model):
+    session.add_all(
+        [
+            new_comment(f"c{i}", body="Liebe Redaktion" if i % 2 else "Hallo")
+            for i in range(5)
+        ]
+    )
+    session.commit()
+    executor = InferenceExecutor(max_workers=1, max_queue=0)
+
+    assert process_backlog(engine, session, 2, 100, 60, executor=executor) == 5
+    assert executor.get_status()["admitted"] == 3
+    assert get_statuses(session) == {
+        "c0": Status.NO_MENTIONS,
+        "c1": Status.TO_BE_PUBLISHED,
+        "c2": Status.NO_MENTIONS,
+        "c3": Status.TO_BE_PUBLISHED,
+        "c4": Status.NO_MENTIONS,
+    }
+    executor.shutdown()
+
+
+def test_backlog_stops_and_releases_claims_when_overloaded(
+    engine, session, new_comment
+):
+    session.add(new_comment("c1", body="Liebe Redaktion"))
+    session.commit()
+    executor = InferenceExecutor(max_workers=1, max_queue=0)
+    release = Event()
+    executor.submit(None, release.wait, 5)
+
+    assert process_backlog(engine, session, 2, 100, 60, executor=executor) == 0
+    release.set()
+    session.expire_all()
+    comment = session.get(Comment, "c1")
+    assert comment.status == Status.TO_BE_PROCESSED
+    assert comment.claimed_by is None
+    executor.shutdown()
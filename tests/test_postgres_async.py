@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine  # type: ignore
+
+from src.models import Comment, MediaHouse, RecognitionResult, Status
+from src.storage.postgres import invalidate_latest_mentions
+from src.storage.postgres_async import (
+    ASYNC_SESSION,
+    AsyncTableWriter,
+    get_latest_mentions,
+)
+
+
+@pytest.fixture
+def async_engine(engine, tmp_path):
+    """Async engine on the sqlite database of 'engine'."""
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    yield async_engine
+    asyncio.run(async_engine.dispose())
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    invalidate_latest_mentions()
+    yield
+    invalidate_latest_mentions()
+
+
+def add_comment(session, comment: Comment) -> None:
+    session.add(comment)
+    session.flush()
+    session.add(
+        RecognitionResult(id=f"m_{comment.id}", comment_id=comment.id, body="Redaktion")
+    )
+    session.commit()
+
+
+def test_get_latest_mentions(async_engine, session, new_comment):
+    add_comment(
+        session, new_comment("accepted", Status.ACCEPTED, media_house=MediaHouse.BR)
+    )
+    add_comment(
+        session, new_comment("rejected", Status.REJECTED, media_house=MediaHouse.BR)
+    )
+
+    async def get_ids() -> list[str]:
+        async with ASYNC_SESSION(bind=async_engine) as async_session:
+            return [m["id"] for m in await get_latest_mentions(async_session)]
+
+    assert asyncio.run(get_ids()) == ["accepted"]
+
+
+def test_update_writes_the_changed_status(async_engine, session, new_comment):
+    add_comment(
+        session,
+        new_comment("c1", Status.WAIT_FOR_EVALUATION, media_house=MediaHouse.BR),
+    )
+
+    async def accept() -> None:
+        async with AsyncTableWriter(async_engine) as writer:
+            comment = await writer.get_comment("c1")
+            assert [m.id for m in comment.mentions] == ["m_c1"]
+            comment.status = Status.ACCEPTED
+            await writer.update(comment)
+
+    asyncio.run(accept())
+    session.expire_all()
+    assert session.get(Comment, "c1").status == Status.ACCEPTED
@@ -0,0 +1,69 @@
+from datetime import datetime
+import json
+
+from sqlalchemy import text  # type: ignore
+
+from src import replay
+from src.models import RecognitionResult, Status
+from src.replay import Checkpoint, write_results
+from src.storage.postgres import create_tables
+
+CREATED_AT = datetime(2022, 5, 1)
+
+
+class FailingClassifier:
+    """Finds mentions in texts with 'Redaktion' and fails on empty texts."""
+
+    def classify_batch(self, texts: list[str], batch_size: int = 32) -> list[bool]:
+        if not all(texts):
+            raise ValueError("empty text")
+
+        return ["Redaktion" in text for text in texts]
+
+
+def to_record(id_: str, body: str = "Liebe Redaktion") -> dict:
+    return {"id": id_, "body": body, "created_at": CREATED_AT}
+
+
+def test_classify_retries_a_failed_batch_one_by_one(monkeypatch):
+    monkeypatch.setattr(replay, "WORKER_CLASSIFIER", FailingClassifier())
+
+    assert replay._classify(["Liebe Redaktion", "", "Hallo"], 8) == [True, None, False]
+
+
+def test_write_results_skips_comments_not_stored(engine, session, new_comment):
+    session.add(new_comment("stored", Status.ACCEPTED, CREATED_AT))
+    session.commit()
+    records = [to_record("stored"), to_record("archived"), to_record("no_hit")]
+
+    assert write_results(engine, records, [True, True, None], "v2") == (1, ["archived"])
+    # stored results are skipped when a batch is replayed again
+    assert write_results(engine, records, [True, True, None], "v2") == (1, ["archived"])
+    assert [
+        (r.comment_id, r.model_version) for r in session.query(RecognitionResult)
+    ] == [("stored", "v2")]
+
+
+def test_checkpoint_lists_failures(tmp_path):
+    path = str(tmp_path / "run.json")
+    checkpoint = Checkpoint(path, {"model_version": "v2"})
+    checkpoint.add_failures(["c1", "c2"], "classification failed")
+    checkpoint.save()
+
+    with open(tmp_path / "run_failures.jsonl") as handle:
+        assert [json.loads(line)["id"] for line in handle] == ["c1", "c2"]
+    assert Checkpoint.load(path, {"model_version": "v2"}).failed == 2
+
+
+def test_postgres_batches_scan_the_index(pg_engine):
+    create_tables(pg_engine)
+    with pg_engine.connect() as conn:
+        conn.execute(text("SET enable_seqscan = off"))
+        plan = conn.execute(
+            text(
+                "EXPLAIN SELECT id FROM comments WHERE created_at >= now() "
+                "ORDER BY created_at, id LIMIT 10"
+            )
+        ).all()
+
+    assert "ix_comments_created_at_id" in " ".join(row[0] for row in plan)
@@ -0,0 +1,39 @@
+import pytest
+
+from src.api.request_models import ProcessingRequest
+from settings import (
+    PROCESSING_CHUNK_SIZE,
+    PROCESSING_CHUNK_SIZE_LIMIT,
+    PROCESSING_MAX_ROWS,
+    PROCESSING_MAX_SECONDS,
+    PROCESSING_MAX_SECONDS_LIMIT,
+)
+
+
+def test_processing_request_defaults():
+    config = ProcessingRequest.from_query(
+        {"chunk_size": None, "max_rows": None, "max_seconds": None}
+    )
+
+    assert config.chunk_size == PROCESSING_CHUNK_SIZE
+    assert config.max_rows == PROCESSING_MAX_ROWS
+    assert config.max_seconds == PROCESSING_MAX_SECONDS
+
+
+@pytest.mark.parametrize("name", ["chunk_size", "max_rows", "max_seconds"])
+@pytest.mark.parametrize("value", [0, -1])
+def test_processing_request_rejects_non_positive_values(name, value):
+    with pytest.raises(ValueError):
+        ProcessingRequest.from_query({name: value})
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"chunk_size": PROCESSING_CHUNK_SIZE_LIMIT + 1},
+        {"max_seconds": PROCESSING_MAX_SECONDS_LIMIT + 1},
+    ],
+)
+def test_processing_request_rejects_values_beyond_limits(query):
+    with pytest.raises(ValueError):
+        ProcessingRequest.from_query(query)
@@ -0,0 +1,74 @@
+from typing import Any
+import time
+
+from src.models import Comment, MediaHouse, Status
+from src.scheduler import PipelineScheduler
+
+
+class ListBackupWriter:
+    def __init__(self):
+        self.records: list[dict[str, Any]] = []
+
+    def write(self, record: dict[str, Any]) -> None:
+        self.records.append(record)
+
+
+def to_raw(id_: str, body: str) -> dict[str, Any]:
+    """Comment as returned by the mdr api."""
+    return {
+        "id": id_,
+        "body": body,
+        "asset_id": "a1",
+        "asset": {"url": "www.mdr.de"},
+        "author_id": "u1",
+        "author": {"username": "Jaime"},
+        "created_at": "2023-01-02T12:00:00",
+    }
+
+
+def is_done(scheduler: PipelineScheduler, count: int) -> bool:
+    """True, if the first run is fetched and 'count' comments are classified."""
+    history = scheduler.get_status()["history"]
+    return (
+        bool(history)
+        and history[0]["status"] != "running"
+        and history[0]["classified"] == count
+    )
+
+
+def test_fetched_pages_are_stored_and_classified(engine, session, fake_model):
+    classified = []
+    backup_writer = ListBackupWriter()
+    scheduler = PipelineScheduler(
+        engine,
+        backup_writer,
+        intervals={MediaHouse.MDR: 3600},
+        on_classified=lambda: classified.append(True),
+    )
+    pages = [[to_raw("c1", "Liebe Redaktion")], [to_raw("c2", "Hallo")]]
+    scheduler._iter_pages = lambda media_house: iter(pages)
+
+    scheduler.start()
+    deadline = time.monotonic() + 10
+    while not is_done(scheduler, 2):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    scheduler.stop(timeout=5)
+
+    (run,) = scheduler.get_status()["history"]
+    assert run["source"] == MediaHouse.MDR.value
+    assert run["status"] == "ok"
+    counts = ("pages", "fetched", "stored", "classified", "mentions")
+    assert {key: run[key] for key in counts} == {
+        "pages": 2,
+        "fetched": 2,
+        "stored": 2,
+        "classified": 2,
+        "mentions": 1,
+    }
+    assert [record["id"] for record in backup_writer.records] == ["c1", "c2"]
+    assert classified == [True]
+    assert {c.id: c.status for c in session.query(Comment)} == {
+        "c1": Status.TO_BE_PUBLISHED,
+        "c2": Status.NO_MENTIONS,
+    }
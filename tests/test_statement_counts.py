@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import pytest
+
+from src.models import MediaHouse, RecognitionResult, Status
+from src.storage.postgres import (
+    claim_unpublished,
+    get_latest_mentions,
+    get_unprocessed_chunks,
+    get_unpublished,
+    invalidate_latest_mentions,
+)
+
+
+@pytest.fixture(params=[1, 5], ids=["1_comment", "5_comments"])
+def comments(request, session, new_comment) -> int:
+    """Store comments with a mention per status, the counts mustn't depend on it."""
+    now = datetime(2023, 1, 2, 12)
+    for index in range(request.param):
+        for status in (Status.TO_BE_PROCESSED, Status.TO_BE_PUBLISHED, Status.ACCEPTED):
+            id_ = f"{status.value}_{index}"
+            session.add(new_comment(id_, status, now, media_house=MediaHouse.BR))
+            session.flush()
+            session.add(
+                RecognitionResult(id=f"m_{id_}", comment_id=id_, body="Redaktion")
+            )
+
+    session.commit()
+    session.expunge_all()
+    return request.param
+
+
+def test_unpublished_statements(session, statements, comments):
+    with statements:
+        lines = [comment.as_dict() for comment in get_unpublished(session)]
+
+    assert len(lines) == comments
+    # comments and their mentions
+    assert statements.count == 2
+
+
+def test_claim_unpublished_statements(session, statements, comments):
+    with statements:
+        lines = [comment.as_dict() for comment in claim_unpublished(session)]
+
+    assert len(lines) == comments
+    # ids, claim, comments and their mentions
+    assert statements.count == 4
+
+
+def test_unprocessed_statements(session, statements, comments):
+    chunk_size = 2
+    with statements:
+        lines = [
+            comment.as_dict()
+            for chunk in get_unprocessed_chunks(session, chunk_size)
+            for comment in chunk
+        ]
+
+    assert len(lines) == comments
+    chunks = -(-comments // chunk_size)
+    # per chunk ids, claim, comments and their mentions, then the empty lookup
+    assert statements.count == 4 * chunks + 1
+
+
+def test_latest_mentions_statements(session, statements, comments):
+    invalidate_latest_mentions()
+    with statements:
+        get_latest_mentions(session)
+        get_latest_mentions(session)
+
+    # the second call is answered by the cache
+    assert statements.count == 1
+    invalidate_latest_mentions()
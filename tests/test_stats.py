@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from src.models import Comment, MediaHouse, Status, StatusCount
+from src.storage.stats import rebuild_status_counts
+
+
+def get_counts(session) -> dict[Status, int]:
+    return {row.status: row.count for row in session.query(StatusCount).all()}
+
+
+def test_insert_counts_status(session, new_comment):
+    session.add(new_comment())
+    session.commit()
+
+    assert get_counts(session) == {Status.TO_BE_PROCESSED: 1}
+
+
+def test_status_change_after_commit_moves_count(session, new_comment):
+    comment = new_comment()
+    session.add(comment)
+    session.commit()
+
+    # the attributes are expired by the commit, the old status isn't loaded yet
+    comment.status = Status.TO_BE_PUBLISHED
+    session.commit()
+
+    assert get_counts(session) == {Status.TO_BE_PROCESSED: 0, Status.TO_BE_PUBLISHED: 1}
+
+
+def test_model_type_change_after_commit_moves_count(session, new_comment):
+    comment = new_comment()
+    session.add(comment)
+    session.commit()
+
+    comment.status = Status.NO_MENTIONS
+    comment.model_type = "gpt2"
+    session.commit()
+
+    rows = {
+        (row.status, row.model_type): row.count
+        for row in session.query(StatusCount).all()
+    }
+    assert rows == {(Status.TO_BE_PROCESSED, ""): 0, (Status.NO_MENTIONS, "gpt2"): 1}
+
+
+def test_rebuild_keeps_days_without_comments(session, new_comment):
+    day = datetime(2023, 1, 2, 12)
+    session.add(new_comment(created_at=day))
+    session.add(new_comment("c2", created_at=day))
+    session.commit()
+
+    # e.g. the comments of an old month were archived and deleted by retention
+    session.query(Comment).filter(Comment.id == "c2").update(
+        {Comment.created_at: datetime(2020, 1, 2, 12)}, synchronize_session=False
+    )
+    session.add(
+        StatusCount(
+            day=datetime(2020, 1, 2).date(),
+            media_house=MediaHouse.TEST,
+            status=Status.ACCEPTED,
+            model_type="",
+            count=5,
+        )
+    )
+    session.commit()
+    session.query(Comment).filter(Comment.id == "c2").delete()
+    session.commit()
+
+    assert rebuild_status_counts(session) == 2
+    rows = {(row.day.year, row.status): row.count for row in session.query(StatusCount)}
+    assert rows == {(2023, Status.TO_BE_PROCESSED): 1, (2020, Status.ACCEPTED): 5}